@@ -0,0 +1,135 @@
+"""
+Задержка event loop при запросах к Supabase под нагрузкой
+
+    python -m scripts.benchmark_db_loop_lag [--users 100] [--messages 3] [--latency 0.02]
+
+Поднимает локальный фейковый PostgREST с заданной задержкой ответа и
+запускает users одновременных пользователей. Каждый messages раз читает
+свой профиль тем же запросом, что get_or_create_user (без кэша профилей),
+двумя способами:
+
+- blocking: синхронный query.execute() прямо в корутине (как было раньше);
+- executor: SupabaseDB._execute, пул из DB_MAX_WORKERS потоков.
+
+Печатает пропускную способность и задержку event loop (p50 / p99 / max),
+которую измеряет фоновая задача с периодом 10 мс.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List
+from urllib.parse import parse_qs, urlparse
+
+TICK = 0.01
+
+
+def start_fake_postgrest(latency: float) -> ThreadingHTTPServer:
+    """PostgREST, отвечающий на SELECT из users строкой пользователя через latency секунд"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            query = parse_qs(urlparse(self.path).query)
+            telegram_id = int(query.get("telegram_id", ["eq.0"])[0].removeprefix("eq."))
+            body = json.dumps([{"telegram_id": telegram_id, "level": "intermediate"}]).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+async def measure(name: str, fetch: Callable, users: int, messages: int) -> None:
+    loop = asyncio.get_running_loop()
+    lags: List[float] = []
+
+    async def monitor():
+        while True:
+            started = loop.time()
+            await asyncio.sleep(TICK)
+            lags.append(loop.time() - started - TICK)
+
+    async def user(telegram_id: int):
+        for _ in range(messages):
+            await fetch(telegram_id)
+            # Остальная работа хендлера тоже ждёт сеть
+            await asyncio.sleep(0)
+
+    monitor_task = asyncio.create_task(monitor())
+    await asyncio.sleep(TICK * 2)
+    started = time.monotonic()
+    await asyncio.gather(*(user(telegram_id) for telegram_id in range(1, users + 1)))
+    elapsed = time.monotonic() - started
+    # Монитор должен успеть записать последнюю задержку
+    await asyncio.sleep(TICK * 2)
+    monitor_task.cancel()
+
+    requests = users * messages
+    print(
+        f"{name:<9} {requests / elapsed:>9.1f} req/s {elapsed:>7.2f}s   loop lag ms: "
+        f"p50 {percentile(lags, 0.5) * 1000:>7.1f}  p99 {percentile(lags, 0.99) * 1000:>7.1f}  "
+        f"max {max(lags, default=0.0) * 1000:>7.1f}"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    from src.services.supabase_db import db
+
+    def query(telegram_id: int):
+        return db.client.table("users").select("*").eq("telegram_id", telegram_id)
+
+    async def blocking(telegram_id: int):
+        return query(telegram_id).execute()
+
+    async def executor(telegram_id: int):
+        return await db._execute(query(telegram_id))
+
+    print(
+        f"{args.users} users x {args.messages} messages, PostgREST latency {args.latency * 1000:.0f} ms, "
+        f"DB_MAX_WORKERS={db._executor._max_workers}"
+    )
+    # Прогрев: соединения и импорт внутри supabase-py
+    await executor(0)
+    await measure("blocking", blocking, args.users, args.messages)
+    await measure("executor", executor, args.users, args.messages)
+    db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=3, help="запросов профиля на пользователя")
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка ответа PostgREST (сек)")
+    parser.add_argument("--workers", type=int, help="DB_MAX_WORKERS (по умолчанию из настроек)")
+    args = parser.parse_args()
+
+    server = start_fake_postgrest(args.latency)
+    # Настройки читаются при импорте src: фейковый сервер и заглушки обязательных переменных
+    os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["SUPABASE_KEY"] = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJyb2xlIjoiYW5vbiJ9.benchmark"
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:benchmark")
+    os.environ.setdefault("TTS_PROVIDER", "groq")
+    if args.workers:
+        os.environ["DB_MAX_WORKERS"] = str(args.workers)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    asyncio.run(main(args))
+    server.shutdown()
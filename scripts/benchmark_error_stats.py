@@ -0,0 +1,198 @@
+"""
+Время /stats по ошибкам: подсчёт по error_logs против счётчиков user_error_stats
+
+    python -m scripts.benchmark_error_stats [--rows 10000 100000] [--repeats 20] [--latency 0.005]
+
+Поднимает локальный фейковый PostgREST поверх SQLite. В error_logs у
+пользователя rows строк, user_error_stats заполняется row-level
+триггером с тем же upsert, что statement-level триггер миграции
+20261017000100_user_error_stats.sql. Статистика ошибок читается через
+SupabaseDB._execute двумя способами:
+
+- old: select category из error_logs (count=exact) и подсчёт в Python,
+  как get_user_stats до счётчиков;
+- counters: select category, error_count из user_error_stats (текущий путь).
+
+Печатает p50 / p95 времени запроса и размер ответа. Фейковый сервер
+отдаёт все строки: у настоящего Supabase лимит db-max-rows (по умолчанию
+1000) ещё и обрезал бы старый подсчёт.
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List
+from urllib.parse import parse_qsl, urlparse
+
+CATEGORIES = ["grammar", "vocabulary", "tense", "articles", "prepositions", "word_order", "none"]
+TABLES = {"error_logs", "user_error_stats"}
+
+SCHEMA = """
+create table error_logs (
+    id integer primary key,
+    user_id integer not null,
+    category text,
+    created_at text not null default current_timestamp
+);
+create index error_logs_user_id on error_logs (user_id);
+
+create table user_error_stats (
+    user_id integer not null,
+    category text not null,
+    error_count integer not null default 0,
+    primary key (user_id, category)
+);
+
+create trigger error_logs_bump_stats after insert on error_logs
+begin
+    insert into user_error_stats (user_id, category, error_count)
+    values (new.user_id, coalesce(new.category, 'none'), 1)
+    on conflict (user_id, category) do update set error_count = error_count + 1;
+end;
+"""
+
+
+def create_database(rows: int) -> sqlite3.Connection:
+    """error_logs с rows строками пользователя 1 и немного чужих строк"""
+    connection = sqlite3.connect(":memory:", check_same_thread=False)
+    connection.executescript(SCHEMA)
+    rng = random.Random(0)
+    connection.executemany(
+        "insert into error_logs (user_id, category) values (?, ?)",
+        [(1, rng.choice(CATEGORIES)) for _ in range(rows)]
+        + [(rng.randint(2, 1000), rng.choice(CATEGORIES)) for _ in range(rows // 10)]
+    )
+    connection.commit()
+    return connection
+
+
+def start_fake_postgrest(connection: sqlite3.Connection, latency: float) -> ThreadingHTTPServer:
+    """PostgREST для GET /rest/v1/<table>?select=...&<column>=eq.<value>[&limit=N]"""
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            # postgrest-py шлёт тело и у GET: непрочитанное тело превращает закрытие сокета в RST
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            time.sleep(latency)
+            url = urlparse(self.path)
+            table = url.path.rsplit("/", 1)[-1]
+            if table not in TABLES:
+                self.send_error(404)
+                return
+
+            columns, filters, limit = "*", [], None
+            for key, value in parse_qsl(url.query):
+                if key == "select":
+                    columns = ", ".join(column.strip() for column in value.split(",") if column.strip().isidentifier())
+                elif key == "limit":
+                    limit = int(value)
+                elif key.isidentifier() and value.startswith("eq."):
+                    filters.append((key, value.removeprefix("eq.")))
+
+            where = " and ".join(f"{column} = ?" for column, _ in filters) or "1"
+            params = [value for _, value in filters]
+            with lock:
+                cursor = connection.execute(f"select {columns} from {table} where {where}", params)
+                names = [description[0] for description in cursor.description]
+                rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+            total = len(rows)
+            if limit is not None:
+                rows = rows[:limit]
+
+            body = json.dumps(rows).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if "count=exact" in self.headers.get("Prefer", ""):
+                self.send_header("Content-Range", f"0-{max(len(rows) - 1, 0)}/{total}")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+async def measure(name: str, rows: int, fetch: Callable, repeats: int) -> Dict[str, int]:
+    timings = []
+    stats: Dict[str, int] = {}
+    size = 0
+    for _ in range(repeats):
+        started = time.monotonic()
+        stats, size = await fetch()
+        timings.append(time.monotonic() - started)
+    print(
+        f"{rows:>8} rows  {name:<9} p50 {percentile(timings, 0.5) * 1000:>8.1f} ms  "
+        f"p95 {percentile(timings, 0.95) * 1000:>8.1f} ms  response {size:>9} bytes"
+    )
+    return stats
+
+
+async def main(args: argparse.Namespace, servers: Dict[int, ThreadingHTTPServer]) -> None:
+    from supabase import create_client
+    from src.services.supabase_db import db
+
+    print(f"PostgREST latency {args.latency * 1000:.0f} ms, {args.repeats} requests per approach")
+    for rows, server in servers.items():
+        # Отдельный клиент на каждый размер: у каждого свой фейковый сервер
+        client = create_client(f"http://127.0.0.1:{server.server_address[1]}", os.environ["SUPABASE_KEY"])
+
+        async def old():
+            response = await db._execute(client
+                                         .table("error_logs")
+                                         .select("category", count="exact")
+                                         .eq("user_id", 1))
+            counts = Counter(item["category"] for item in response.data if item["category"] != "none")
+            return dict(counts), len(json.dumps(response.data))
+
+        async def counters():
+            response = await db._execute(client
+                                         .table("user_error_stats")
+                                         .select("category, error_count")
+                                         .eq("user_id", 1))
+            counts = {item["category"]: item["error_count"] for item in response.data if item["category"] != "none"}
+            return counts, len(json.dumps(response.data))
+
+        await counters()
+        old_stats = await measure("old", rows, old, args.repeats)
+        new_stats = await measure("counters", rows, counters, args.repeats)
+        if old_stats != new_stats:
+            print(f"  ⚠️ results differ: {old_stats} != {new_stats}")
+    db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000], help="строк error_logs у пользователя")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.005, help="задержка ответа PostgREST (сек)")
+    args = parser.parse_args()
+
+    servers = {rows: start_fake_postgrest(create_database(rows), args.latency) for rows in args.rows}
+    # Настройки читаются при импорте src: заглушки обязательных переменных
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+    os.environ["SUPABASE_KEY"] = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJyb2xlIjoiYW5vbiJ9.benchmark"
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:benchmark")
+    os.environ.setdefault("TTS_PROVIDER", "groq")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    asyncio.run(main(args, servers))
+    for server in servers.values():
+        server.shutdown()
@@ -0,0 +1,141 @@
+"""
+Латентность транскрибации длинных голосовых: целиком против нарезки
+
+    python -m scripts.benchmark_long_audio [--minutes 0.5 1 2 5] [--keys 4] [--rounds 2]
+
+Синтетическая речь с паузами заданной длины распознаётся через
+GroqClient.transcribe_audio двумя способами:
+
+- single: одним запросом к Whisper (LONG_AUDIO_ENABLED=false);
+- chunked: нарезка по паузам в пуле процессов и параллельные запросы
+  на сегменты по разным ключам (текущий путь для записей длиннее
+  LONG_AUDIO_SECONDS).
+
+Whisper заменяет локальный OpenAI-совместимый сервер: ответ через
+whisper-base + длительность * whisper-rtf секунд, как у API, время
+которого растёт с длиной записи. Печатает среднее время транскрибации
+и число сегментов. Нужен PyAV.
+"""
+import os
+import sys
+import math
+import time
+import random
+import asyncio
+import argparse
+from io import BytesIO
+from statistics import mean
+from typing import List
+
+SAMPLE_RATE = 16000
+
+
+def speech_with_pauses(seconds: float) -> bytes:
+    """16-bit PCM: фразы по 4-6 с, между ними 0.4-0.8 с тишины"""
+    rng = random.Random(0)
+    samples = bytearray()
+    total = int(seconds * SAMPLE_RATE)
+    while len(samples) // 2 < total:
+        phrase = int(rng.uniform(4.0, 6.0) * SAMPLE_RATE)
+        for i in range(phrase):
+            envelope = 2000 + 1500 * math.sin(2 * math.pi * 3 * i / SAMPLE_RATE)
+            samples += int(envelope * math.sin(2 * math.pi * 180 * i / SAMPLE_RATE)).to_bytes(2, "little", signed=True)
+        samples += bytes(2 * int(rng.uniform(0.4, 0.8) * SAMPLE_RATE))
+    return bytes(samples[:total * 2])
+
+
+async def start_fake_whisper(args: argparse.Namespace):
+    """/audio/transcriptions, отвечающий через base + duration * rtf секунд"""
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+    from src.utils.audio import ogg_duration
+
+    async def transcribe(request: web.Request) -> web.Response:
+        form = await request.post()
+        duration = ogg_duration(form["file"].file.read())
+        await asyncio.sleep(args.whisper_base + duration * args.whisper_rtf)
+        words = " ".join(f"word{i}" for i in range(int(duration * 2)))
+        if form.get("response_format") == "verbose_json":
+            return web.json_response({
+                "text": words,
+                "segments": [{"start": 0.0, "end": duration, "avg_logprob": -0.1}]
+            })
+        return web.Response(text=words)
+
+    app = web.Application(client_max_size=256 * 1024 * 1024)
+    app.router.add_post("/v1/audio/transcriptions", transcribe)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+async def main(args: argparse.Namespace) -> None:
+    from src.config import settings
+    from src.services.groq_client import GroqClient
+    from src.services.opus_encoder import opus_encoder
+    from src.services.usage_tracker import usage_tracker
+    from src.utils import audio
+
+    if audio.av is None:
+        sys.exit("PyAV is not installed: long audio is never split")
+
+    # Счётчики пользователей не сбрасываются в Supabase
+    usage_tracker.start = lambda: None
+    server = await start_fake_whisper(args)
+    groq = GroqClient([f"key{i}" for i in range(args.keys)], base_url=str(server.make_url("/v1")))
+    opus_encoder.start()
+
+    segments: List[int] = []
+    original_chunked = groq._transcribe_chunked
+
+    async def transcribe_chunked(ogg, duration):
+        # Число сегментов - по числу запросов к Whisper внутри нарезки
+        before = sum(usage["requests"] for usage in groq.whisper_usage.values())
+        text = await original_chunked(ogg, duration)
+        segments.append(sum(usage["requests"] for usage in groq.whisper_usage.values()) - before)
+        return text
+
+    groq._transcribe_chunked = transcribe_chunked
+
+    print(
+        f"{args.keys} keys, LONG_AUDIO_CHUNK_SECONDS={settings.LONG_AUDIO_CHUNK_SECONDS:g}, "
+        f"Whisper {args.whisper_base:g}s + {args.whisper_rtf:g}s per audio second"
+    )
+    print(f"{'audio':>7} {'single s':>9} {'chunked s':>10} {'segments':>9} {'gain':>6}")
+    for minutes in args.minutes:
+        ogg = audio.encode_pcm_ogg_opus(speech_with_pauses(minutes * 60), SAMPLE_RATE, sample_rate=SAMPLE_RATE)
+        timings = {"single": [], "chunked": []}
+        segments.clear()
+        for _ in range(args.rounds):
+            for mode, enabled in (("single", False), ("chunked", True)):
+                settings.LONG_AUDIO_ENABLED = enabled
+                groq.transcription_cache.clear()
+                started = time.monotonic()
+                assert await groq.transcribe_audio(BytesIO(ogg))
+                timings[mode].append(time.monotonic() - started)
+
+        single, chunked = mean(timings["single"]), mean(timings["chunked"])
+        count = f"{mean(segments):.0f}" if segments else "1"
+        print(f"{minutes * 60:>6.0f}s {single:>9.2f} {chunked:>10.2f} {count:>9} {single / chunked:>5.2f}x")
+
+    opus_encoder.shutdown()
+    await server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--minutes", type=float, nargs="+", default=[0.5, 1.0, 2.0, 5.0], help="длительности записи (мин)")
+    parser.add_argument("--keys", type=int, default=4, help="Groq ключей (сегменты идут параллельно по ключам)")
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--whisper-base", type=float, default=0.4, help="постоянная задержка Whisper (сек)")
+    parser.add_argument("--whisper-rtf", type=float, default=0.02, help="секунд обработки на секунду записи")
+    args = parser.parse_args()
+
+    # Настройки читаются при импорте src: заглушки обязательных переменных
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:benchmark")
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+    os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJyb2xlIjoiYW5vbiJ9.benchmark")
+    os.environ.setdefault("TTS_PROVIDER", "groq")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    asyncio.run(main(args))
@@ -0,0 +1,117 @@
+"""
+Пропускная способность кодирования WAV -> OGG Opus: пул PyAV против ffmpeg
+
+    python -m scripts.benchmark_opus_encode [--seconds 6] [--jobs 48] [--workers 2]
+
+Кодирует один и тот же синтетический ответ (речеподобный сигнал длиной
+seconds) jobs раз при 1, 4 и 16 одновременных задачах двумя способами:
+
+- pool: OpusEncoderPool, долгоживущие процессы с PyAV (текущий путь);
+- ffmpeg: процесс ffmpeg на каждый ответ (как было раньше).
+
+Печатает encodes/s и задержку одной задачи (p50 / p95). Режим ffmpeg
+пропускается, если ffmpeg не установлен, режим pool - без PyAV.
+"""
+import os
+import io
+import sys
+import math
+import time
+import wave
+import random
+import shutil
+import asyncio
+import argparse
+from typing import Awaitable, Callable, List, Optional
+
+CONCURRENCY = (1, 4, 16)
+
+
+def synthetic_wav(seconds: float, sample_rate: int = 24000) -> bytes:
+    """Моно WAV: тон с огибающей слогов и шумом, примерно как речь TTS"""
+    rng = random.Random(0)
+    samples = bytearray()
+    for i in range(int(seconds * sample_rate)):
+        t = i / sample_rate
+        envelope = 0.5 + 0.5 * math.sin(2 * math.pi * 4 * t)
+        value = envelope * (6000 * math.sin(2 * math.pi * 180 * t) + 2000 * math.sin(2 * math.pi * 720 * t))
+        value += rng.uniform(-300, 300)
+        samples += int(value).to_bytes(2, "little", signed=True)
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(bytes(samples))
+    return buffer.getvalue()
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+async def measure(name: str, encode: Callable[[], Awaitable[Optional[bytes]]], jobs: int, concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    failures = 0
+
+    async def job():
+        nonlocal failures
+        async with semaphore:
+            started = time.monotonic()
+            if not await encode():
+                failures += 1
+            latencies.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    await asyncio.gather(*(job() for _ in range(jobs)))
+    elapsed = time.monotonic() - started
+    print(
+        f"{name:<7} c={concurrency:<3} {jobs / elapsed:>8.1f} encodes/s   latency ms: "
+        f"p50 {percentile(latencies, 0.5) * 1000:>7.1f}  p95 {percentile(latencies, 0.95) * 1000:>7.1f}"
+        + (f"   failures {failures}" if failures else "")
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    from src.utils import audio
+    from src.services.opus_encoder import OpusEncoderPool
+
+    wav_bytes = synthetic_wav(args.seconds)
+    print(f"{args.seconds:.0f}s WAV ({len(wav_bytes)} bytes), {args.jobs} encodes per run, {args.workers} pool workers")
+
+    if audio.av is not None:
+        # Очередь не должна отклонять задачи бенчмарка
+        pool = OpusEncoderPool(workers=args.workers, queue_size=args.jobs, queue_timeout=300.0, job_timeout=60.0)
+        pool.start()
+        await pool.encode(wav_bytes)
+        for concurrency in CONCURRENCY:
+            await measure("pool", lambda: pool.encode(wav_bytes), args.jobs, concurrency)
+        pool.shutdown()
+    else:
+        print("pool    skipped: PyAV is not installed")
+
+    if shutil.which("ffmpeg"):
+        for concurrency in CONCURRENCY:
+            await measure("ffmpeg", lambda: audio.ffmpeg_encode_ogg_opus(wav_bytes), args.jobs, concurrency)
+    else:
+        print("ffmpeg  skipped: ffmpeg is not installed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=6.0, help="длительность ответа (сек)")
+    parser.add_argument("--jobs", type=int, default=48, help="кодирований на каждый прогон")
+    parser.add_argument("--workers", type=int, default=2, help="процессов в пуле")
+    args = parser.parse_args()
+
+    # Настройки читаются при импорте src: заглушки обязательных переменных
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:benchmark")
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+    os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJyb2xlIjoiYW5vbiJ9.benchmark")
+    os.environ.setdefault("TTS_PROVIDER", "groq")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    asyncio.run(main(args))
@@ -0,0 +1,152 @@
+"""
+Память и латентность голосовых: скачивание в память против временного файла
+
+    python -m scripts.benchmark_voice_download [--sizes-mb 1 5 20] [--concurrency 8] [--repeats 3]
+
+Поднимает в отдельном процессе фейковый Telegram Bot API (раздача файлов)
+и OpenAI-совместимый /audio/transcriptions. Голосовые скачиваются
+настоящим aiogram Bot.download_file и отправляются через
+GroqClient.transcribe_audio так же, как в transcribe_voice_with_groq:
+
+- memory: BytesIO из download_file передаётся в клиент как есть;
+- spill: файл скачивается во временный файл, клиенту передаётся путь
+  (так идут голосовые больше VOICE_SPILL_THRESHOLD_BYTES).
+
+Для каждого размера concurrency голосовых обрабатываются одновременно.
+Печатает p50 / p95 латентности одного голосового и пик выделенной
+Python-памяти (tracemalloc) на весь прогон. Нарезка длинных записей
+(LONG_AUDIO_ENABLED) выключена: её измеряет benchmark_long_audio.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tracemalloc
+import multiprocessing
+from typing import Awaitable, Callable, List
+
+TOKEN = "123456:benchmark"
+
+
+def serve(port_queue: multiprocessing.Queue) -> None:
+    """Фейковый Bot API и Whisper: файл /file/bot<token>/<mb>/<n>.oga - mb мегабайт"""
+    from aiohttp import web
+
+    base = os.urandom(1024 * 1024)
+
+    async def download(request: web.Request) -> web.StreamResponse:
+        megabytes = int(request.match_info["mb"])
+        # Первый байт зависит от номера: одинаковые файлы не попадали бы в кэш по хэшу
+        marker = int(request.match_info["n"]).to_bytes(8, "little")
+        response = web.StreamResponse(headers={"Content-Type": "audio/ogg"})
+        response.content_length = megabytes * len(base)
+        await response.prepare(request)
+        await response.write(marker + base[len(marker):])
+        for _ in range(megabytes - 1):
+            await response.write(base)
+        await response.write_eof()
+        return response
+
+    async def transcribe(request: web.Request) -> web.Response:
+        # Тело читается потоком и выбрасывается, как его принял бы API
+        while await request.content.read(65536):
+            pass
+        return web.Response(text="hello from the benchmark")
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/file/bot{token}/{mb}/{n}.oga", download)
+        app.router.add_post("/v1/audio/transcriptions", transcribe)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port_queue.put(site._server.sockets[0].getsockname()[1])
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+async def measure(name: str, megabytes: int, handle: Callable[[int], Awaitable], args: argparse.Namespace) -> None:
+    latencies: List[float] = []
+
+    async def one(n: int) -> None:
+        started = time.monotonic()
+        await handle(n)
+        latencies.append(time.monotonic() - started)
+
+    tracemalloc.start()
+    for repeat in range(args.repeats):
+        await asyncio.gather(*(one(repeat * args.concurrency + i) for i in range(args.concurrency)))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{megabytes:>4} MB  {name:<6} latency ms: p50 {percentile(latencies, 0.5) * 1000:>8.1f}  "
+        f"p95 {percentile(latencies, 0.95) * 1000:>8.1f}   peak memory {peak / 1024 / 1024:>7.1f} MB"
+    )
+
+
+async def main(args: argparse.Namespace, port: int) -> None:
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from src.services.groq_client import GroqClient
+    from src.utils.audio import create_temp_path, cleanup_file
+
+    base_url = f"http://127.0.0.1:{port}"
+    bot = Bot(TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(base_url)))
+    groq = GroqClient(["benchmark"], base_url=f"{base_url}/v1")
+
+    print(f"{args.concurrency} concurrent voices x {args.repeats} rounds per size")
+    for megabytes in args.sizes_mb:
+        run_id = megabytes * 1_000_000
+
+        async def memory(n: int) -> None:
+            audio_buffer = await bot.download_file(f"{megabytes}/{run_id + n}.oga")
+            assert await groq.transcribe_audio(audio_buffer)
+
+        async def spill(n: int) -> None:
+            tmp_path = create_temp_path("ogg")
+            try:
+                await bot.download_file(f"{megabytes}/{run_id + 500_000 + n}.oga", destination=tmp_path)
+                assert await groq.transcribe_audio(tmp_path)
+            finally:
+                await cleanup_file(tmp_path)
+
+        await memory(-1)
+        await measure("memory", megabytes, memory, args)
+        await measure("spill", megabytes, spill, args)
+
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[1, 5, 20], help="размеры голосовых (МБ)")
+    parser.add_argument("--concurrency", type=int, default=8, help="голосовых одновременно")
+    parser.add_argument("--repeats", type=int, default=3, help="раундов на размер")
+    args = parser.parse_args()
+
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(port_queue,), daemon=True)
+    server.start()
+    port = port_queue.get(timeout=30)
+
+    # Настройки читаются при импорте src: заглушки обязательных переменных
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", TOKEN)
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+    os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJyb2xlIjoiYW5vbiJ9.benchmark")
+    os.environ.setdefault("TTS_PROVIDER", "groq")
+    os.environ["LONG_AUDIO_ENABLED"] = "false"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    try:
+        asyncio.run(main(args, port))
+    finally:
+        server.terminate()
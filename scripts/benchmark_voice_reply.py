@@ -0,0 +1,174 @@
+"""
+Время до готового голосового ответа в зависимости от длины ответа
+
+    python -m scripts.benchmark_voice_reply [--sentences 1 3 6 10] [--rounds 3] [--real]
+
+Сравнивает два пути озвучки ответа собеседника:
+
+- full: generate_response, затем text_to_speech целого ответа
+  (TTS_STREAMING=false);
+- streamed: generate_response_with_voice - предложения озвучиваются по
+  мере генерации и склеиваются (TTS_STREAMING=true).
+
+Печатает среднее время до готового OGG и до первого озвученного
+предложения. По умолчанию ответы и TTS отдаёт локальный
+OpenAI-совместимый сервер с задержками как у Groq (первый токен, скорость
+генерации, синтез пропорционально длине текста); ответ сервера содержит
+столько предложений, сколько запрошено. С --real запросы идут в
+настоящий API из .env, длина ответа тогда задаётся только просьбой в реплике.
+"""
+import os
+import io
+import sys
+import json
+import math
+import time
+import wave
+import asyncio
+import argparse
+from statistics import mean
+from typing import Dict, List
+
+SENTENCE = "This is sentence number {n} of a reply that keeps the conversation going nicely."
+
+
+def speech_wav(seconds: float, sample_rate: int = 24000) -> bytes:
+    """Тон вместо речи: кодировщику и склейке важны только длина и формат"""
+    frames = bytearray()
+    for i in range(int(seconds * sample_rate)):
+        frames += int(3000 * math.sin(2 * math.pi * 220 * i / sample_rate)).to_bytes(2, "little", signed=True)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(sample_rate)
+        writer.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+async def start_fake_groq(args: argparse.Namespace):
+    """Чат (поток и обычный ответ) и TTS с задержками, похожими на Groq"""
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+
+    def reply_text(body: Dict) -> str:
+        # Реплика пользователя - последняя в messages: "<sentences> <run>"
+        count, run = body["messages"][-1]["content"].split()
+        return " ".join(SENTENCE.format(n=f"{i + 1}.{run}") for i in range(int(count)))
+
+    async def chat(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        words = [word + " " for word in reply_text(body).split()]
+        await asyncio.sleep(args.first_token)
+        if not body.get("stream"):
+            await asyncio.sleep(len(words) / args.tokens_per_second)
+            return web.json_response({
+                "id": "chatcmpl-bench", "object": "chat.completion", "created": 0, "model": body["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)}, "finish_reason": "stop"}]
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for word in words:
+            chunk = {
+                "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await asyncio.sleep(1 / args.tokens_per_second)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def speech(request: web.Request) -> web.Response:
+        text = (await request.json())["input"]
+        await asyncio.sleep(args.tts_base + len(text) * args.tts_per_char)
+        return web.Response(body=speech_wav(len(text) * 0.06), content_type="audio/wav")
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat)
+    app.router.add_post("/v1/audio/speech", speech)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+async def main(args: argparse.Namespace) -> None:
+    from src.services.groq_client import GroqClient, groq_client
+    from src.services.opus_encoder import opus_encoder
+    from src.services.usage_tracker import usage_tracker
+
+    # Счётчики пользователей не сбрасываются в Supabase
+    usage_tracker.start = lambda: None
+    server = None
+    if args.real:
+        groq = groq_client
+    else:
+        server = await start_fake_groq(args)
+        groq = GroqClient(["benchmark"], base_url=str(server.make_url("/v1")))
+    opus_encoder.start()
+
+    first_sentence: List[float] = []
+    original_synthesize = groq._synthesize_wav
+
+    async def synthesize_wav(text: str):
+        # Первое предложение озвучено: отсюда пользователь мог бы уже слушать
+        wav = await original_synthesize(text)
+        if not first_sentence:
+            first_sentence.append(time.monotonic())
+        return wav
+
+    groq._synthesize_wav = synthesize_wav
+
+    print(f"{'sentences':>9} {'full s':>8} {'streamed s':>11} {'first sentence s':>17} {'gain':>6}")
+    run = 0
+    for sentences in args.sentences:
+        full: List[float] = []
+        streamed: List[float] = []
+        first: List[float] = []
+        for _ in range(args.rounds):
+            run += 1
+            text = f"{sentences} {run}" if not args.real else f"Please answer in exactly {sentences} sentences, variant {run}."
+
+            started = time.monotonic()
+            reply = await groq.generate_response(text, "intermediate")
+            assert await groq.text_to_speech(reply)
+            full.append(time.monotonic() - started)
+
+            first_sentence.clear()
+            started = time.monotonic()
+            _, audio = await groq.generate_response_with_voice(text, "intermediate")
+            assert audio
+            streamed.append(time.monotonic() - started)
+            first.append(first_sentence[0] - started)
+
+        print(
+            f"{sentences:>9} {mean(full):>8.2f} {mean(streamed):>11.2f} {mean(first):>17.2f} "
+            f"{mean(full) / mean(streamed):>5.2f}x"
+        )
+
+    opus_encoder.shutdown()
+    if server:
+        await server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sentences", type=int, nargs="+", default=[1, 3, 6, 10], help="длины ответа в предложениях")
+    parser.add_argument("--rounds", type=int, default=3, help="ответов на каждую длину")
+    parser.add_argument("--real", action="store_true", help="настоящий API из .env вместо локального")
+    parser.add_argument("--first-token", type=float, default=0.3, help="задержка первого токена (сек)")
+    parser.add_argument("--tokens-per-second", type=float, default=150.0)
+    parser.add_argument("--tts-base", type=float, default=0.3, help="задержка синтеза (сек)")
+    parser.add_argument("--tts-per-char", type=float, default=0.004, help="время синтеза на символ (сек)")
+    args = parser.parse_args()
+
+    if not args.real:
+        # Настройки читаются при импорте src: заглушки обязательных переменных
+        os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:benchmark")
+        os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+        os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJyb2xlIjoiYW5vbiJ9.benchmark")
+        os.environ["TTS_PROVIDER"] = "groq"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    asyncio.run(main(args))
@@ -0,0 +1,115 @@
+"""
+Сравнение split и fused режимов LLM по токенам и латентности
+
+    python -m scripts.compare_llm_modes [--rounds 1] [--level intermediate] [--precheck]
+
+Прогоняет фиксированный корпус реплик учеников через оба пути
+process_user_message: split (correct_text и generate_response
+параллельно) и fused (analyze_and_respond). Расход считается по usage
+ответов API через usage_tracker, латентность - по времени всего хода.
+Нужны настоящие GROQ_API_KEYS (или GROQ_BASE_URL другого
+OpenAI-совместимого API). В Supabase ничего не пишется.
+
+Кэш коррекций очищается перед каждым ходом, иначе второй режим получал
+бы коррекцию из кэша первого. Пред-классификация (precheck) по умолчанию
+выключена: она одинаково экономит вызовы в обоих режимах и смазывает
+сравнение самих промптов.
+"""
+import sys
+import time
+import asyncio
+import argparse
+from typing import Any, Dict, List
+
+# Реплики уровня A2-B2 с типичными ошибками и без них
+CORPUS = [
+    "Yesterday I go to the cinema with my friends.",
+    "She don't like coffee, she prefer tea.",
+    "I have been living in Moscow since five years.",
+    "Can you explain me this grammar rule?",
+    "I am agree with you about this topic.",
+    "My brother is more taller than me.",
+    "We discussed about the project during the meeting.",
+    "I didn't went to work today because I was sick.",
+    "If I will have time, I will visit you.",
+    "He is the most smartest student in our class.",
+    "I like reading books in the evening.",
+    "Last summer we travelled to Italy and it was amazing.",
+    "I'm looking forward to hear from you.",
+    "There is many people in the park today.",
+    "I want to improve my English for my new job.",
+    "How long time does it take to get to the airport?",
+    "She said me that she will come later.",
+    "I usually drink two cups of coffee every morning.",
+    "Do you think artificial intelligence will replace teachers?",
+    "I was very boring at the lesson yesterday.",
+]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+async def run_mode(mode: str, texts: List[str], level: str) -> Dict[str, Any]:
+    from src.services.groq_client import groq_client
+    from src.services.usage_tracker import usage_tracker
+
+    totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "fallbacks": 0}
+    latencies = []
+    for i, text in enumerate(texts):
+        groq_client.result_cache.clear()
+        with usage_tracker.message(i) as usage:
+            started = time.monotonic()
+            if mode == "fused":
+                await groq_client.analyze_and_respond(text, level)
+            else:
+                await asyncio.gather(groq_client.correct_text(text, level), groq_client.generate_response(text, level))
+            latencies.append(time.monotonic() - started)
+        if mode == "fused" and usage.calls > 1:
+            # Fused JSON не разобрался - ход ушёл на два обычных вызова
+            totals["fallbacks"] += 1
+        totals["calls"] += usage.calls
+        totals["prompt_tokens"] += usage.prompt_tokens
+        totals["completion_tokens"] += usage.completion_tokens
+
+    totals["tokens"] = totals["prompt_tokens"] + totals["completion_tokens"]
+    totals["avg_latency"] = sum(latencies) / len(latencies)
+    totals["p95_latency"] = percentile(latencies, 0.95)
+    return totals
+
+
+async def main(args: argparse.Namespace) -> None:
+    from src.config import settings
+    from src.services.usage_tracker import usage_tracker
+
+    settings.PRECHECK_ENABLED = args.precheck
+    # Счётчики пользователей не сбрасываются в Supabase
+    usage_tracker.start = lambda: None
+
+    texts = CORPUS * args.rounds
+    results = {mode: await run_mode(mode, texts, args.level) for mode in ("split", "fused")}
+
+    print(f"{len(texts)} messages, level {args.level}, precheck {'on' if args.precheck else 'off'}")
+    print(f"{'mode':<6} {'calls':>6} {'prompt':>8} {'compl.':>8} {'tokens':>8} {'tok/msg':>8} {'avg s':>7} {'p95 s':>7} {'fallback':>9}")
+    for mode, r in results.items():
+        print(
+            f"{mode:<6} {r['calls']:>6} {r['prompt_tokens']:>8} {r['completion_tokens']:>8} {r['tokens']:>8} "
+            f"{r['tokens'] / len(texts):>8.0f} {r['avg_latency']:>7.2f} {r['p95_latency']:>7.2f} {r['fallbacks']:>9}"
+        )
+
+    split, fused = results["split"], results["fused"]
+    if split["tokens"] and split["calls"]:
+        print(
+            f"fused / split: calls {fused['calls'] / split['calls']:.2f}, tokens {fused['tokens'] / split['tokens']:.2f}, "
+            f"avg latency {fused['avg_latency'] / split['avg_latency']:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=1, help="сколько раз прогнать корпус")
+    parser.add_argument("--level", default="intermediate")
+    parser.add_argument("--precheck", action="store_true", help="не выключать пред-классификацию")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,138 @@
+"""
+Размер и время отправки голосового ответа: старый выход провайдеров против общего
+
+    python -m scripts.compare_voice_output [--durations 3 10 30] [--uplink-mbps 10] [--chat-id ID]
+
+Для синтетических ответов нескольких длительностей сравнивает, что бот
+отправлял раньше и что отправляет общий этап encode_ogg_opus:
+
+- groq: раньше WAV 48 кГц от API уходил в Telegram как есть;
+- piper: раньше WAV 22.05 кГц кодировался в Opus без нормализации.
+
+Печатает размер файла, время кодирования и время отправки. Отправка по
+умолчанию идёт на локальный приёмник с пропускной способностью
+uplink-mbps; с --chat-id голосовое по-настоящему отправляется в Telegram
+(нужен TELEGRAM_BOT_TOKEN), время - до ответа sendVoice.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from typing import Awaitable, Callable, List
+
+# Частоты, с которыми провайдеры отдают WAV
+GROQ_RATE = 48000
+PIPER_RATE = 22050
+CHUNK = 64 * 1024
+
+
+async def start_throttled_sink(uplink_mbps: float):
+    """HTTP-приёмник, читающий тело запроса не быстрее uplink_mbps"""
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+
+    async def upload(request: web.Request) -> web.Response:
+        received = 0
+        while True:
+            chunk = await request.content.read(CHUNK)
+            if not chunk:
+                break
+            received += len(chunk)
+            await asyncio.sleep(len(chunk) * 8 / (uplink_mbps * 1_000_000))
+        return web.json_response({"ok": True, "bytes": received})
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/upload", upload)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+async def timed(action: Callable[[], Awaitable]) -> float:
+    started = time.monotonic()
+    await action()
+    return time.monotonic() - started
+
+
+async def main(args: argparse.Namespace) -> None:
+    import aiohttp
+    from aiogram import Bot
+    from aiogram.types import BufferedInputFile
+    from src.config import settings
+    from src.utils import audio
+    from scripts.benchmark_opus_encode import synthetic_wav
+
+    if audio.av is None:
+        sys.exit("PyAV is not installed: nothing to compare")
+
+    sink = None
+    bot = None
+    if args.chat_id:
+        bot = Bot(settings.TELEGRAM_BOT_TOKEN)
+        target = f"Telegram chat {args.chat_id}"
+    else:
+        sink = await start_throttled_sink(args.uplink_mbps)
+        session = aiohttp.ClientSession()
+        target = f"local sink at {args.uplink_mbps:g} Mbit/s"
+
+    async def upload(data: bytes, filename: str) -> None:
+        if bot:
+            await bot.send_voice(args.chat_id, BufferedInputFile(data, filename=filename))
+            return
+        form = aiohttp.FormData()
+        form.add_field("voice", data, filename=filename)
+        async with session.post(sink.make_url("/upload"), data=form) as response:
+            response.raise_for_status()
+
+    print(f"Upload target: {target}")
+    print(f"{'provider':<8} {'reply':>6} {'output':<15} {'bytes':>10} {'encode ms':>10} {'upload ms':>10}")
+    for seconds in args.durations:
+        for provider, rate in (("groq", GROQ_RATE), ("piper", PIPER_RATE)):
+            wav_bytes = synthetic_wav(seconds, sample_rate=rate)
+
+            started = time.monotonic()
+            if provider == "groq":
+                old_output, old_name = wav_bytes, "response.wav"
+            else:
+                # Старый путь Piper: Opus без даунмикса и нормализации громкости
+                old_output, old_name = audio.encode_pcm_ogg_opus(*audio.read_wav(wav_bytes)), "response.ogg"
+            old_encode = time.monotonic() - started
+
+            started = time.monotonic()
+            new_output = audio.encode_ogg_opus(wav_bytes)
+            new_encode = time.monotonic() - started
+
+            rows: List[tuple] = [
+                ("old " + ("wav" if provider == "groq" else "opus"), old_output, old_name, old_encode),
+                ("shared opus", new_output, "response.ogg", new_encode),
+            ]
+            for label, data, filename, encode_seconds in rows:
+                upload_seconds = await timed(lambda: upload(data, filename))
+                print(
+                    f"{provider:<8} {seconds:>5.0f}s {label:<15} {len(data):>10} "
+                    f"{encode_seconds * 1000:>10.1f} {upload_seconds * 1000:>10.1f}"
+                )
+
+    if bot:
+        await bot.session.close()
+    else:
+        await session.close()
+        await sink.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--durations", type=float, nargs="+", default=[3.0, 10.0, 30.0], help="длительности ответа (сек)")
+    parser.add_argument("--uplink-mbps", type=float, default=10.0, help="пропускная способность локального приёмника")
+    parser.add_argument("--chat-id", type=int, help="отправлять в этот чат Telegram вместо локального приёмника")
+    args = parser.parse_args()
+
+    # Настройки читаются при импорте src: заглушки обязательных переменных
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:benchmark")
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+    os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJyb2xlIjoiYW5vbiJ9.benchmark")
+    os.environ.setdefault("TTS_PROVIDER", "groq")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    asyncio.run(main(args))
@@ -0,0 +1,9 @@
+"""
+Точка входа: python -m src
+
+В отличие от src.main, модуль __main__ пакета не выполняется заново
+в дочерних процессах multiprocessing (воркеры кодировщика голоса).
+"""
+from src.main import run
+
+run()
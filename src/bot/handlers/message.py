@@ -1,41 +1,253 @@
+import asyncio
 import logging
 from io import BytesIO
-from aiogram import Router, types
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+from aiogram import Bot, Router, types
 from aiogram.types import Message, BufferedInputFile
 from aiogram.filters import Command
 
 from src.config import settings, ADMIN_IDS
 from src.services.supabase_db import db
 from src.services.groq_client import groq_client
-from src.utils.audio import save_voice_file, cleanup_file, read_file_bytes
+from src.services.tts_cache import tts_cache
+from src.services.usage_tracker import usage_tracker
+from src.services.opus_encoder import opus_encoder
+from src.services.write_behind import write_queue
+from src.utils.audio import create_temp_path, cleanup_file, ogg_duration, screen_voice
+from src.utils.metrics import StageTimer
 
 router = Router()
 logger = logging.getLogger(__name__)
 
 
-async def transcribe_voice_with_groq(voice_file_bytes: bytes) -> str:
-    """Транскрибация голоса через Groq Whisper API"""
+async def prescreen_voice(
+    audio: Union[BytesIO, Path],
+    duration: Optional[float] = None
+) -> Union[BytesIO, Path, bytes, None]:
+    """
+    Дешёвая локальная проверка перед Whisper: длительность и
+    энергетический VAD в пуле процессов.
+    
+    Args:
+        audio: голосовое в памяти или скачанное на диск (spill-to-disk)
+        duration: длительность из Telegram (voice.duration). Telegram
+            отдаёт целые секунды, поэтому 0 или None означает, что
+            длительность читается по granule position OGG
+    
+    Returns:
+        None - речи нет (Whisper не вызываем), иначе аудио для отправки:
+        исходное, версия без длинной тишины в начале и в конце (bytes) или,
+        для файла на диске, тот же путь с уже обрезанной записью
+    """
+    size = 0
+    if isinstance(audio, Path):
+        if not duration:
+            duration = await asyncio.to_thread(ogg_duration, audio)
+    else:
+        with audio.getbuffer() as view:
+            size = len(view)
+            duration = duration or ogg_duration(view)
+    if 0 < duration < settings.VOICE_MIN_SECONDS:
+        logger.info(f"🔇 Voice too short ({duration:.2f}s), skipping Whisper")
+        return None
+    
+    if not settings.VOICE_PRESCREEN or not opus_encoder.available:
+        return audio
+    
+    try:
+        # Длинные записи декодируются дольше: таймаут растёт с длительностью
+        has_speech, trimmed, speech_seconds = await opus_encoder.run(
+            screen_voice,
+            audio if isinstance(audio, Path) else audio.getvalue(),
+            settings.VOICE_VAD_MIN_RMS,
+            settings.VOICE_MIN_SPEECH_SECONDS,
+            settings.VOICE_TRIM_MIN_SILENCE,
+            timeout=settings.OPUS_ENCODER_TIMEOUT + duration / 60 * settings.LONG_AUDIO_SPLIT_TIMEOUT_PER_MINUTE
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ Voice prescreen failed, sending as is: {e!r}")
+        return audio
+    
+    if not has_speech:
+        logger.info(f"🔇 No speech detected in {duration:.1f}s voice, skipping Whisper")
+        return None
+    if isinstance(trimmed, Path):
+        logger.info(f"✂️ Trimmed silence on disk ({speech_seconds:.1f}s of speech)")
+        return trimmed
+    if trimmed and len(trimmed) < size:
+        logger.info(f"✂️ Trimmed silence: {size} -> {len(trimmed)} bytes ({speech_seconds:.1f}s of speech)")
+        return trimmed
+    return audio
+
+
+async def transcribe_voice_with_groq(bot: Bot, voice: types.Voice) -> Optional[str]:
+    """
+    Скачивание и транскрибация голоса через Groq Whisper API
+    
+    Returns:
+        Текст, "" если в голосовом нет речи, None при ошибке транскрибации
+    
+    Обычные голосовые не касаются диска: BytesIO из bot.download_file
+    передаётся в Groq как есть, без промежуточных копий.
+    Файлы больше VOICE_SPILL_THRESHOLD_BYTES скачиваются во временный файл.
+    Повторно присланные голосовые (тот же file_unique_id) не скачиваются вовсе.
+    """
     try:
-        # Сохраняем временный файл
-        ogg_path = await save_voice_file(voice_file_bytes, "ogg")
+        cached = groq_client.get_cached_transcription(voice.file_unique_id)
+        if cached is not None:
+            logger.info("✅ Transcription cache hit (file_unique_id)")
+            return cached
         
-        try:
-            # Читаем файл для отправки в Groq
-            audio_bytes = await read_file_bytes(ogg_path)
-            
-            # Отправляем в Groq
-            text = await groq_client.transcribe_audio(audio_bytes)
-            return text
-            
-        finally:
-            # Очищаем временный файл
-            await cleanup_file(ogg_path)
+        voice_file = await bot.get_file(voice.file_id)
+        
+        if (voice.file_size or 0) > settings.VOICE_SPILL_THRESHOLD_BYTES:
+            tmp_path = create_temp_path("ogg")
+            try:
+                await bot.download_file(voice_file.file_path, destination=tmp_path)
+                audio = await prescreen_voice(tmp_path, voice.duration)
+                if audio is None:
+                    return ""
+                return await groq_client.transcribe_audio(audio, file_unique_id=voice.file_unique_id)
+            finally:
+                await cleanup_file(tmp_path)
+        
+        audio_buffer = await bot.download_file(voice_file.file_path)
+        audio = await prescreen_voice(audio_buffer, voice.duration)
+        if audio is None:
+            return ""
+        return await groq_client.transcribe_audio(audio, file_unique_id=voice.file_unique_id)
                 
     except Exception as e:
         logger.error(f"Error transcribing voice with Groq: {e}")
         raise
 
 
+def queue_analysis(user_id: int, user_text: str, analysis_data: Dict[str, Any]) -> None:
+    """Ставит словарь и ошибку из коррекции в фоновую очередь записи (не блокирует ответ)"""
+    for item in analysis_data.get("vocabulary_items") or []:
+        if isinstance(item, dict) and item.get("word_or_phrase"):
+            write_queue.add_vocabulary(user_id, item)
+    
+    category = str(analysis_data.get("error_category") or "none").lower()
+    if category != "none":
+        write_queue.add_error(user_id, {"category": category, "mistake_text": user_text})
+
+
+def format_analysis(user_text: str, analysis_data: Dict[str, Any]) -> str:
+    """Анализ для голосового режима (только коррекция)"""
+    analysis_text = f"""✅ **Correct**
+{analysis_data.get('corrected_sentence', user_text)}
+
+💡 **Why**
+{analysis_data.get('explanation', 'No corrections needed.')}"""
+    
+    if analysis_data.get('vocabulary_items'):
+        analysis_text += "\n\n📚 *New words added to your vocabulary*"
+    return analysis_text
+
+
+async def reply_with_voice(
+    user_id: int,
+    user_text: str,
+    user_level: str,
+    timer: StageTimer,
+    fused_task: Optional[asyncio.Task] = None
+) -> Tuple[str, Union[str, bytes, None]]:
+    """
+    Ответ собеседника и его озвучка: TTS стартует сразу, не дожидаясь коррекции
+    
+    Args:
+        fused_task: задача analyze_and_respond в fused режиме - ответ
+            берётся из неё вместо отдельного вызова
+    
+    Returns:
+        (chat_response, voice) - voice это OGG-байты, Telegram file_id
+        уже отправленного такого же голосового или None
+    """
+    if fused_task is not None:
+        chat_response = (await fused_task)["chat_response"]
+    elif settings.TTS_STREAMING:
+        # Пофразовый синтез прямо во время генерации ответа
+        chat_response, voice_bytes = await timer.track(
+            "chat_tts_stream", groq_client.generate_response_with_voice(user_text, user_level, user_id)
+        )
+        timer.mark("voice_ready")
+        return chat_response, voice_bytes
+    else:
+        chat_response = await timer.track("chat", groq_client.generate_response(user_text, user_level, user_id))
+    
+    # Такое голосовое уже загружалось - отправим по file_id без синтеза
+    file_id = tts_cache.get_file_id(groq_client.tts_cache_key(chat_response))
+    if file_id:
+        timer.mark("voice_ready")
+        return chat_response, file_id
+    
+    voice_bytes = await timer.track("tts", groq_client.text_to_speech(chat_response))
+    timer.mark("voice_ready")
+    return chat_response, voice_bytes
+
+
+async def send_voice_pipeline(message: Message, user_id: int, user_text: str, user_level: str) -> None:
+    """
+    Голосовой режим: коррекция и цепочка "ответ -> TTS" идут параллельно,
+    отправка - строго в порядке анализ, голос, текст ответа.
+    """
+    timer = StageTimer()
+    if settings.LLM_MODE == "fused":
+        # Один вызов: анализ и ответ готовы одновременно, TTS стартует сразу после него
+        correction_task = asyncio.create_task(
+            timer.track("fused", groq_client.analyze_and_respond(user_text, user_level, user_id))
+        )
+        voice_task = asyncio.create_task(reply_with_voice(user_id, user_text, user_level, timer, correction_task))
+    else:
+        correction_task = asyncio.create_task(
+            timer.track("correction", groq_client.correct_text(user_text, user_level))
+        )
+        voice_task = asyncio.create_task(reply_with_voice(user_id, user_text, user_level, timer))
+    
+    try:
+        # 1. Анализ текстом, как только готова коррекция
+        analysis_data = await correction_task
+        queue_analysis(user_id, user_text, analysis_data)
+        await message.answer(format_analysis(user_text, analysis_data), parse_mode="Markdown")
+        timer.mark("analysis_sent")
+        
+        # 2. Голосовой ответ (синтез к этому моменту обычно уже закончился)
+        chat_response, voice = await voice_task
+        
+        if isinstance(voice, str):
+            # Кэшированный file_id: без повторной загрузки
+            await message.answer_voice(voice)
+            timer.mark("voice_sent")
+        elif voice:
+            logger.info(f"Voice generated successfully: {len(voice)} bytes")
+            voice_file = BufferedInputFile(voice, filename="response.ogg")
+            sent = await message.answer_voice(voice_file, duration=round(ogg_duration(voice)))
+            if sent.voice:
+                tts_cache.remember_file_id(groq_client.tts_cache_key(chat_response), sent.voice.file_id, len(voice))
+            timer.mark("voice_sent")
+        else:
+            # Fallback: только текст если TTS не сработал
+            logger.warning("TTS failed, sending chat response as text")
+        
+        # 3. Дублируем диалог текстом для удобства
+        await message.answer(f"💬 {chat_response}", parse_mode="Markdown")
+    finally:
+        for task in (correction_task, voice_task):
+            if not task.done():
+                task.cancel()
+    
+    durations = timer.durations
+    if {"correction", "chat", "tts"} <= durations.keys():
+        # Раньше TTS стартовал только после обоих LLM-вызовов
+        sequential = max(durations["correction"], durations["chat"]) + durations["tts"]
+        saved = sequential - timer.marks.get("voice_ready", sequential)
+        logger.info(f"⏱ Voice pipeline: {timer.summary()} (sequential estimate {sequential:.2f}s, saved {saved:.2f}s)")
+    else:
+        logger.info(f"⏱ Voice pipeline: {timer.summary()}")
+
+
 @router.message(Command("stats"))
 async def cmd_stats(message: Message):
     """Команда /stats"""
@@ -52,16 +264,38 @@ async def cmd_stats(message: Message):
 
 
 @router.message()
-async def handle_message(message: Message):
-    """Основной обработчик текстовых и голосовых сообщений"""
+async def handle_message(
+    message: Message,
+    user: Optional[Dict[str, Any]] = None,
+    user_text: Optional[str] = None
+):
+    """
+    Основной обработчик текстовых и голосовых сообщений
+    
+    user_text - склеенный MailboxMiddleware текст нескольких сообщений подряд
+    """
+    # Все вызовы API ниже (включая фоновые задачи) учитываются на этого пользователя
+    with usage_tracker.message(message.from_user.id):
+        await process_message(message, user, user_text)
+
+
+async def process_message(
+    message: Message,
+    user: Optional[Dict[str, Any]] = None,
+    combined_text: Optional[str] = None
+):
+    """Обработка сообщения: транскрипция, коррекция, ответ текстом или голосом"""
     try:
         user_id = message.from_user.id
         is_voice_input = False
         
+        # Профиль уже загружен UserMiddleware (data["user"]), в БД идём только если его нет
+        if not user:
+            user = await db.get_or_create_user(user_id)
+        
         # Проверяем лимиты (если не админ)
         is_admin = user_id in ADMIN_IDS
         if not is_admin and settings.FREE_MESSAGES_LIMIT > 0:
-            user = await db.get_or_create_user(user_id)
             if user.get("free_messages_used", 0) >= settings.FREE_MESSAGES_LIMIT:
                 await message.answer(
                     "You've reached your message limit. Please upgrade to continue.",
@@ -75,12 +309,12 @@ async def handle_message(message: Message):
             is_voice_input = True
             await message.bot.send_chat_action(user_id, "typing")
             
-            # Скачиваем файл
-            voice_file = await message.bot.get_file(message.voice.file_id)
-            voice_bytes = await message.bot.download_file(voice_file.file_path)
+            # Скачиваем и транскрибируем через Groq
+            user_text = await transcribe_voice_with_groq(message.bot, message.voice)
             
-            # Транскрибируем через Groq
-            user_text = await transcribe_voice_with_groq(voice_bytes.read())
+            if user_text == "":
+                await message.answer("I couldn't hear any speech in your voice message. Please try again.")
+                return
             
             if not user_text or user_text.startswith("[Transcription error"):
                 await message.answer("Could not transcribe your voice message. Please try again.")
@@ -90,16 +324,17 @@ async def handle_message(message: Message):
             await message.answer(f"🎤 *You said:* {user_text}", parse_mode="Markdown")
             
         elif message.text:
-            # Текстовое сообщение
-            user_text = message.text.strip()
+            # Текстовое сообщение (или несколько, склеенных в один ход)
+            user_text = (combined_text or message.text).strip()
             
             if not user_text or user_text.startswith("/"):
                 return
         else:
             return
         
-        # Получаем данные пользователя
-        user = await db.get_or_create_user(user_id)
+        usage_tracker.count_message()
+        
+        # Уровень пользователя
         user_level = user.get("level", settings.DEFAULT_USER_LEVEL)
         
         # Определяем, нужно ли отвечать голосом
@@ -117,51 +352,19 @@ async def handle_message(message: Message):
         else:
             await message.bot.send_chat_action(user_id, "typing")
         
-        # Обрабатываем сообщение через Speech Flow AI
-        response, analysis_data = await groq_client.process_user_message(
-            telegram_id=user_id,
-            user_text=user_text,
-            user_level=user_level
-        )
-        
         # Отправляем ответ в стиле Engify:
         # 1. Сначала анализ текстом (коррекция + объяснение)
         # 2. Потом диалог голосом (если включено)
-        
         if should_reply_voice:
-            # Формируем анализ (только коррекция)
-            analysis_text = f"""✅ **Correct**
-{analysis_data.get('corrected_sentence', user_text)}
-
-💡 **Why**
-{analysis_data.get('explanation', 'No corrections needed.')}"""
-            
-            if analysis_data.get('vocabulary_items'):
-                analysis_text += "\n\n📚 *New words added to your vocabulary*"
-            
-            # 1. Отправляем анализ текстом
-            await message.answer(analysis_text, parse_mode="Markdown")
-            
-            # 2. Генерируем голосовой ответ (только диалог)
-            logger.info("Generating voice response...")
-            chat_response = analysis_data.get('chat_response', response)
-            voice_bytes = await groq_client.text_to_speech(chat_response)
-            
-            if voice_bytes:
-                logger.info(f"Voice generated successfully: {len(voice_bytes)} bytes")
-                # Отправляем голосом
-                voice_file = BufferedInputFile(voice_bytes, filename="response.wav")
-                await message.answer_voice(voice_file)
-                logger.info("Voice message sent")
-                
-                # Дублируем диалог текстом для удобства
-                await message.answer(f"💬 {chat_response}", parse_mode="Markdown")
-            else:
-                # Fallback: только текст если TTS не сработал
-                logger.warning("TTS failed, sending chat response as text")
-                await message.answer(f"💬 {chat_response}", parse_mode="Markdown")
+            await send_voice_pipeline(message, user_id, user_text, user_level)
         else:
             # Текстовый режим: весь ответ текстом
+            response, analysis_data = await groq_client.process_user_message(
+                telegram_id=user_id,
+                user_text=user_text,
+                user_level=user_level
+            )
+            queue_analysis(user_id, user_text, analysis_data)
             logger.info("Sending text-only response")
             await message.answer(response, parse_mode="Markdown")
         
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, TelegramObject, Update
+
+logger = logging.getLogger(__name__)
+
+
+class Mailbox:
+    """Очередь ходов одного пользователя"""
+
+    __slots__ = ("lock", "pending", "collector")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = 0  # ходов в очереди и в работе
+        self.collector: Optional[List[str]] = None  # тексты хода, который ещё принимает сообщения
+
+
+class MailboxMiddleware(BaseMiddleware):
+    """
+    Последовательная обработка сообщений каждого пользователя.
+
+    Ходы одного пользователя выполняются строго по очереди, разные
+    пользователи - параллельно. Сообщение свободного пользователя
+    обрабатывается сразу. Тексты, пришедшие, пока предыдущий ход ещё
+    отвечает, склеиваются в один следующий ход: склеенный текст
+    передаётся хендлеру как data["user_text"], поглощённые апдейты не
+    обрабатываются. Голосовое или команда закрывают склейку, поэтому
+    более поздние тексты не обгоняют их. С debounce > 0 текст и
+    свободного пользователя ждёт паузы в серии (не дольше max_debounce).
+    Ходов в очереди на пользователя не больше max_pending.
+    """
+
+    def __init__(self, debounce: float = 0.0, max_debounce: float = 5.0, max_pending: int = 3):
+        self.debounce = debounce
+        self.max_debounce = max_debounce
+        self.max_pending = max_pending
+        self._mailboxes: Dict[int, Mailbox] = {}
+
+        # Метрики
+        self.turns = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    @staticmethod
+    def _is_plain_text(message: Message) -> bool:
+        return bool(message.text) and not message.text.startswith("/")
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        message: Optional[Message] = event.message if isinstance(event, Update) else None
+        if message is None or message.from_user is None:
+            return await handler(event, data)
+
+        user_id = message.from_user.id
+        mailbox = self._mailboxes.setdefault(user_id, Mailbox())
+        plain_text = self._is_plain_text(message)
+
+        if plain_text and mailbox.collector is not None:
+            # Текст присоединяется к ходу, который ещё не начал отвечать
+            mailbox.collector.append(message.text.strip())
+            self.coalesced += 1
+            return None
+
+        if mailbox.pending >= self.max_pending:
+            self.rejected += 1
+            logger.warning(f"⚠️ Mailbox of user {user_id} is full, dropping update")
+            await message.answer("⏳ I'm still answering your previous messages. Please wait a moment.")
+            return None
+
+        busy = mailbox.pending > 0
+        mailbox.pending += 1
+        texts: Optional[List[str]] = None  # тексты этого хода
+        # Место в очереди занимается сразу, чтобы ходы шли в порядке прихода
+        acquire = asyncio.ensure_future(mailbox.lock.acquire())
+        try:
+            if not plain_text:
+                # Более поздние тексты встают в очередь после этого апдейта
+                mailbox.collector = None
+            elif busy or self.debounce > 0:
+                texts = mailbox.collector = [message.text.strip()]
+                if self.debounce > 0:
+                    await self._wait_for_pause(texts)
+
+            # Пока идёт предыдущий ход, новые тексты продолжают попадать в этот
+            await acquire
+            if texts is not None:
+                if mailbox.collector is texts:
+                    mailbox.collector = None
+                if len(texts) > 1:
+                    logger.info(f"📬 Coalesced {len(texts)} messages of user {user_id} into one turn")
+                data["user_text"] = "\n".join(texts)
+
+            self.turns += 1
+            return await handler(event, data)
+        finally:
+            if texts is not None and mailbox.collector is texts:
+                # Ход отменён до начала: собранные тексты теряются вместе с ним
+                mailbox.collector = None
+            if acquire.done() and not acquire.cancelled():
+                mailbox.lock.release()
+            else:
+                acquire.cancel()
+            mailbox.pending -= 1
+            if mailbox.pending == 0:
+                self._mailboxes.pop(user_id, None)
+
+    async def _wait_for_pause(self, texts: List[str]) -> None:
+        """Ждёт паузы в debounce секунд между текстами (не дольше max_debounce)"""
+        deadline = time.monotonic() + self.max_debounce
+        seen = 0
+        while len(texts) != seen:
+            seen = len(texts)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(self.debounce, remaining))
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики для /status"""
+        return {
+            "active_users": len(self._mailboxes),
+            "turns": self.turns,
+            "coalesced_messages": self.coalesced,
+            "rejected_updates": self.rejected
+        }
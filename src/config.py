@@ -9,6 +9,31 @@ class Settings(BaseSettings):
     
     # Groq API Keys (строка с ключами через запятую)
     GROQ_API_KEYS: str = ""  # ✅ Должна быть строкой, не списком!
+    GROQ_BASE_URL: str = "https://api.groq.com/openai/v1"  # OpenAI-совместимый endpoint (фейковый сервер в тестах)
+    GROQ_BREAKER_FAILURES: int = 3  # Ошибок подряд, после которых ключ выводится из ротации
+    GROQ_BREAKER_OPEN_SECONDS: float = 30.0  # На сколько открывается circuit breaker ключа
+    GROQ_MAX_KEY_WAIT: float = 5.0  # Максимальное ожидание освобождения ключа (сек)
+    GROQ_HEDGE_ENABLED: bool = False  # Дублировать медленные LLM-запросы на другой ключ
+    GROQ_HEDGE_PERCENTILE: float = 0.95  # Перцентиль латентности, после которого отправляется дубль
+    GROQ_HEDGE_MIN_SAMPLES: int = 20  # Замеров до того, как перцентиль начинает использоваться
+    GROQ_HEDGE_DEFAULT_DELAY: float = 3.0  # Порог до накопления замеров (сек)
+    GROQ_HEDGE_MIN_DELAY: float = 0.5  # Нижняя граница порога (сек)
+    RESULT_CACHE_SIZE: int = 5000  # Проверенных предложений (результатов коррекции) в кэше
+    RESULT_CACHE_TTL: float = 900.0  # Время жизни результата коррекции (сек), коротко: правки промптов доходят быстро
+    LLM_MODE: str = "split"  # "split" - коррекция и ответ двумя вызовами, "fused" - одним JSON-вызовом
+    FUSED_MODEL: str = "openai/gpt-oss-120b"  # Модель для fused режима
+    CORRECTION_MODEL: str = "openai/gpt-oss-120b"  # Основная модель коррекции
+    LIGHT_CORRECTION_MODEL: str = "llama-3.1-8b-instant"  # Лёгкая модель для коротких простых фраз
+    PRECHECK_ENABLED: bool = True  # Локальная пред-классификация реплик перед коррекцией
+    PRECHECK_SKIP_THRESHOLD: float = 0.9  # Уверенность, с которой коррекция не запрашивается вовсе
+    PRECHECK_LIGHT_THRESHOLD: float = 0.6  # Уверенность, с которой хватает лёгкой модели
+    PRECHECK_LIGHT_MAX_WORDS: int = 10  # Более длинные фразы всегда идут на основную модель
+    CONVERSATION_MEMORY: bool = True  # Передавать в диалог историю реплик пользователя
+    CONVERSATION_TOKEN_BUDGET: int = 1200  # Лимит токенов истории (summary + последние сообщения)
+    CONVERSATION_MAX_MESSAGES: int = 20  # Сообщений в буфере; старые сворачиваются в summary
+    CONVERSATION_MAX_USERS: int = 5000  # Диалогов в памяти (LRU)
+    CONVERSATION_PERSIST: bool = True  # Сохранять память диалогов в Supabase
+    CONVERSATION_SUMMARY_MODEL: str = "llama-3.1-8b-instant"  # Модель для summary старых реплик
     
     # Supabase
     SUPABASE_URL: str
@@ -18,11 +43,60 @@ class Settings(BaseSettings):
     DEFAULT_USER_LEVEL: str = "intermediate"
     FREE_MESSAGES_LIMIT: int = 0
     VOICE_RESPONSE_MODE: str = "mirror"  # "always", "mirror", "never"
+    MAILBOX_DEBOUNCE: float = 0.0  # Ждать паузы в серии текстов и у свободного пользователя (0 - отвечать сразу)
+    MAILBOX_MAX_DEBOUNCE: float = 5.0  # Максимальное ожидание продолжения серии текстов (сек)
+    MAILBOX_MAX_PENDING: int = 3  # Ходов пользователя в очереди, сверх этого апдейты отклоняются
     TTS_VOICE: str = "autumn"  # Groq Orpheus: autumn, diana, hannah, austin, daniel, troy
     
     # TTS Provider settings - читается из .env
     TTS_PROVIDER: Optional[str] = None  # "groq" или "piper" - ОБЯЗАТЕЛЬНО указать в .env!
     PIPER_TTS_URL: Optional[str] = None  # URL Piper TTS сервиса (обязательно для piper)
+    PIPER_STREAM_ENCODE: bool = False  # Кодировать Piper WAV в Opus во время скачивания (нужен ffmpeg, без общей нормализации громкости)
+    TTS_STREAMING: bool = False  # Озвучивать ответ по предложениям по мере генерации
+    TTS_STREAM_CONCURRENCY: int = 3  # Одновременных синтезов предложений
+    TTS_STREAM_MIN_SENTENCE_CHARS: int = 20  # Короткие предложения склеиваются со следующими
+    TTS_CACHE_MEMORY_BYTES: int = 32 * 1024 * 1024  # Лимит аудио в памяти
+    TTS_CACHE_DIR: Optional[str] = None  # Каталог дискового кэша TTS (None - только память)
+    TTS_CACHE_DISK_BYTES: int = 512 * 1024 * 1024  # Лимит дискового кэша
+    TTS_CACHE_MAX_TEXT_CHARS: int = 300  # Кэшируются только фразы не длиннее
+    TTS_FILE_ID_CACHE_SIZE: int = 10000  # Запоминаемых Telegram file_id голосовых
+    OPUS_ENCODER_WORKERS: int = 2  # Процессов-кодировщиков WAV -> OGG Opus
+    OPUS_ENCODER_QUEUE_SIZE: int = 32  # Максимум задач кодирования в работе и в очереди
+    OPUS_ENCODER_TIMEOUT: float = 10.0  # Таймаут одной задачи (сек)
+    OPUS_ENCODER_QUEUE_TIMEOUT: float = 10.0  # Максимум ожидания свободного воркера (сек)
+    OPUS_ENCODER_MAX_TASKS: int = 500  # Задач на воркер до перезапуска
+    
+    # Voice input
+    VOICE_SPILL_THRESHOLD_BYTES: int = 5 * 1024 * 1024  # Голосовые больше этого скачиваются на диск
+    VOICE_PRESCREEN: bool = True  # Локальный VAD перед Whisper (нужен PyAV)
+    VOICE_MIN_SECONDS: float = 0.3  # Более короткие голосовые не распознаются
+    VOICE_MIN_SPEECH_SECONDS: float = 0.2  # Минимум речи по VAD
+    VOICE_VAD_MIN_RMS: int = 300  # Минимальный порог энергии кадра речи (16-bit PCM)
+    VOICE_TRIM_MIN_SILENCE: float = 1.0  # Обрезать тишину, если в начале и конце её не меньше (сек)
+    WHISPER_MODEL: str = "whisper-large-v3"  # Основная (точная) модель
+    WHISPER_FAST_MODEL: str = "whisper-large-v3-turbo"  # Быстрая модель для коротких клипов и пиковой нагрузки
+    WHISPER_ROUTING: bool = True  # Выбирать модель по длительности клипа и загрузке ключей
+    WHISPER_FAST_MAX_SECONDS: float = 15.0  # Клипы не длиннее - на быструю модель
+    WHISPER_SATURATION_IN_FLIGHT: float = 2.0  # Запросов на ключ, после которых всё идёт на быструю модель
+    WHISPER_ESCALATE_LOGPROB: float = -0.7  # Ниже этого avg_logprob ответ быстрой модели перепроверяется
+    LONG_AUDIO_ENABLED: bool = True  # Распознавать длинные голосовые частями параллельно (нужен PyAV)
+    LONG_AUDIO_SECONDS: float = 60.0  # Начиная с какой длительности резать запись
+    LONG_AUDIO_CHUNK_SECONDS: float = 30.0  # Целевая длина сегмента
+    LONG_AUDIO_OVERLAP_SECONDS: float = 1.0  # Перекрытие соседних сегментов
+    LONG_AUDIO_CONCURRENCY: int = 4  # Одновременных запросов на сегменты
+    LONG_AUDIO_SPLIT_TIMEOUT_PER_MINUTE: float = 5.0  # Добавка к OPUS_ENCODER_TIMEOUT на минуту записи при декодировании (нарезка, VAD) (сек)
+    TRANSCRIPTION_CACHE_SIZE: int = 2000  # Транскрипций в кэше (по file_unique_id и хэшу)
+    TRANSCRIPTION_CACHE_TTL: float = 3600.0  # Время жизни транскрипции в кэше (сек)
+    TRANSCRIPTION_CACHE_MAX_TEXT_CHARS: int = 4000  # Более длинные транскрипции не кэшируются
+    
+    # Storage
+    DB_MAX_WORKERS: int = 8  # Потоков для синхронных запросов Supabase (не блокируют event loop)
+    USER_CACHE_SIZE: int = 10000  # Максимум профилей в кэше процесса
+    USER_CACHE_TTL: float = 300.0  # Время жизни профиля в кэше (сек)
+    WRITE_BEHIND_BATCH_SIZE: int = 50  # Строк в одном bulk insert (vocabulary / error_logs)
+    WRITE_BEHIND_FLUSH_INTERVAL: float = 2.0  # Максимальная задержка записи (сек)
+    WRITE_BEHIND_MAX_RETRIES: int = 3  # Повторов неудачного батча
+    USAGE_FLUSH_INTERVAL: float = 10.0  # Как часто токены и сообщения пользователей пишутся в users (сек)
     
     def __init__(self, **data):
         super().__init__(**data)
@@ -12,8 +12,16 @@ from aiogram.client.default import DefaultBotProperties
 from src.config import settings, ADMIN_IDS
 from src.bot.handlers import start, level, menu, message
 from src.bot.middlewares.user_middleware import UserMiddleware
+from src.bot.middlewares.mailbox_middleware import MailboxMiddleware
 from src.services.groq_client import groq_client
 from src.services.supabase_db import db
+from src.services.write_behind import write_queue
+from src.services.opus_encoder import opus_encoder
+from src.services.tts_cache import tts_cache
+from src.services.correction_precheck import correction_precheck
+from src.services.conversation import conversation_store
+from src.services.prompts import prompt_registry
+from src.services.usage_tracker import usage_tracker
 
 # Настройка логирования
 logging.basicConfig(
@@ -30,6 +38,11 @@ bot = Bot(
     default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN)
 )
 dp = Dispatcher()
+mailbox = MailboxMiddleware(
+    debounce=settings.MAILBOX_DEBOUNCE,
+    max_debounce=settings.MAILBOX_MAX_DEBOUNCE,
+    max_pending=settings.MAILBOX_MAX_PENDING
+)
 shutdown_event = asyncio.Event()
 
 
@@ -124,6 +137,21 @@ async def status():
                 "name": bot_info.first_name
             },
             "groq_clients": len(groq_client.clients),
+            "groq_keys": groq_client.scheduler.stats(),
+            "groq_latency": groq_client.latency_stats(),
+            "user_cache": db.user_cache.stats(),
+            "write_queue": write_queue.stats(),
+            "opus_encoder": opus_encoder.stats(),
+            "tts_cache": tts_cache.stats(),
+            "transcription_cache": groq_client.transcription_cache.stats(),
+            "whisper_models": groq_client.whisper_stats(),
+            "correction_precheck": correction_precheck.stats(),
+            "conversations": conversation_store.stats(),
+            "prompts": prompt_registry.stats(),
+            "singleflight": groq_client.singleflight.stats(),
+            "result_cache": groq_client.result_cache.stats(),
+            "usage": usage_tracker.stats(),
+            "mailbox": mailbox.stats(),
             "admin_count": len(ADMIN_IDS),
             "timestamp": datetime.utcnow().isoformat()
         }
@@ -143,7 +171,9 @@ async def status():
 async def startup():
     """Запуск бота"""
     try:
-        # Регистрируем middleware
+        # Регистрируем middleware: очередь ходов пользователя (outer) срабатывает
+        # до загрузки профиля, поэтому склеенные сообщения не грузят его повторно
+        dp.update.outer_middleware(mailbox)
         dp.update.middleware(UserMiddleware())
         
         # Регистрируем роутеры
@@ -152,6 +182,13 @@ async def startup():
         dp.include_router(menu.router)
         dp.include_router(message.router)
         
+        # Фоновая запись словаря и ошибок, токенов и счётчиков сообщений
+        write_queue.start()
+        usage_tracker.start()
+        
+        # Поднимаем воркеры кодирования голоса
+        opus_encoder.start()
+        
         # Удаляем вебхук
         await bot.delete_webhook(drop_pending_updates=True)
         
@@ -189,6 +226,13 @@ async def shutdown():
         # Закрываем сессию бота
         await bot.session.close()
         logger.info("✅ Bot session closed")
+        
+        # Дописываем очередь записи и память диалогов, останавливаем пул потоков БД
+        await write_queue.stop()
+        await conversation_store.stop()
+        await usage_tracker.stop()
+        db.close()
+        opus_encoder.shutdown()
     except Exception as e:
         logger.error(f"❌ Shutdown error: {e}")
 
@@ -197,7 +241,8 @@ async def shutdown():
 # MAIN
 # =============================================================================
 
-if __name__ == "__main__":
+def run():
+    """Запуск HTTP-сервера с ботом (точка входа: python -m src)"""
     import uvicorn
     
     # Берём порт из переменной окружения
@@ -210,3 +255,9 @@ if __name__ == "__main__":
     logger.info("=" * 50)
     
     uvicorn.run(app, host="0.0.0.0", port=port)
+
+
+if __name__ == "__main__":
+    # Работает, но воркеры кодировщика тогда заново выполняют этот модуль
+    logger.warning("⚠️ Started as python -m src.main, prefer python -m src")
+    run()
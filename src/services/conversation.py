@@ -0,0 +1,181 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from src.config import settings
+from src.services.supabase_db import SupabaseDB, db
+
+logger = logging.getLogger(__name__)
+
+Message = Dict[str, str]
+Summarizer = Callable[[str, List[Message]], Awaitable[str]]
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка токенов (~4 символа на токен плюс служебные токены сообщения)"""
+    return len(text) // 4 + 4
+
+
+class Conversation:
+    """Память диалога одного пользователя"""
+
+    __slots__ = ("messages", "summary", "to_summarize", "summary_task")
+
+    def __init__(self, messages: Optional[List[Message]] = None, summary: str = ""):
+        self.messages: List[Message] = messages or []
+        self.summary = summary
+        self.to_summarize: List[Message] = []
+        self.summary_task: Optional[asyncio.Task] = None
+
+
+class ConversationStore:
+    """
+    Память диалогов для generate_response.
+
+    На пользователя хранится кольцевой буфер последних сообщений и краткое
+    содержание более старых. История для запроса собирается с конца в
+    пределах token_budget. Вытесненные из буфера сообщения сворачиваются
+    в summary фоновой задачей, не задерживая ответ. С storage память
+    сохраняется в Supabase и переживает перезапуск.
+    """
+
+    def __init__(
+        self,
+        storage: Optional[SupabaseDB] = None,
+        max_messages: int = 20,
+        token_budget: int = 1200,
+        max_users: int = 5000
+    ):
+        self.storage = storage
+        self.max_messages = max_messages
+        self.token_budget = token_budget
+        self.max_users = max_users
+        self.summarizer: Optional[Summarizer] = None
+
+        self._users: "OrderedDict[int, Conversation]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+
+        # Метрики
+        self.summaries = 0
+        self.summary_failures = 0
+        self.prompt_calls = 0
+        self.prompt_tokens_total = 0
+        self.prompt_tokens_max = 0
+        self.history_tokens_total = 0
+
+    async def _get(self, user_id: int) -> Conversation:
+        conversation = self._users.get(user_id)
+        if conversation is not None:
+            self._users.move_to_end(user_id)
+            return conversation
+
+        conversation = Conversation()
+        if self.storage is not None:
+            data = await self.storage.get_conversation(user_id)
+            if data:
+                conversation = Conversation(list(data.get("messages") or []), data.get("summary") or "")
+
+        # Пока шёл запрос в базу, запись могла появиться
+        conversation = self._users.setdefault(user_id, conversation)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return conversation
+
+    async def history(self, user_id: int) -> List[Message]:
+        """Summary и последние сообщения, укладывающиеся в token_budget"""
+        conversation = await self._get(user_id)
+        budget = self.token_budget
+        prefix: List[Message] = []
+
+        if conversation.summary:
+            content = f"Summary of the earlier conversation with this user: {conversation.summary}"
+            budget -= estimate_tokens(content)
+            prefix.append({"role": "system", "content": content})
+
+        selected: List[Message] = []
+        for message in reversed(conversation.messages):
+            cost = estimate_tokens(message["content"])
+            if cost > budget:
+                break
+            budget -= cost
+            selected.append(message)
+        selected.reverse()
+        return prefix + selected
+
+    async def add_exchange(self, user_id: int, user_text: str, reply: str) -> None:
+        """Добавляет реплику пользователя и ответ; переполнение уходит в summary"""
+        conversation = await self._get(user_id)
+        conversation.messages.append({"role": "user", "content": user_text})
+        conversation.messages.append({"role": "assistant", "content": reply})
+
+        if len(conversation.messages) > self.max_messages:
+            # Сворачиваем сразу половину буфера, чтобы summary считался редко
+            overflow = len(conversation.messages) - self.max_messages // 2
+            conversation.to_summarize.extend(conversation.messages[:overflow])
+            del conversation.messages[:overflow]
+            if self.summarizer is None:
+                conversation.to_summarize.clear()
+            elif conversation.summary_task is None or conversation.summary_task.done():
+                conversation.summary_task = self._spawn(self._summarize(user_id, conversation))
+
+        self._spawn(self._save(user_id, conversation))
+
+    def _spawn(self, coro: Awaitable[Any]) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _summarize(self, user_id: int, conversation: Conversation) -> None:
+        """Фоновое сворачивание вытесненных сообщений в summary"""
+        while conversation.to_summarize:
+            batch = conversation.to_summarize
+            conversation.to_summarize = []
+            try:
+                conversation.summary = await self.summarizer(conversation.summary, batch)
+                self.summaries += 1
+            except Exception as e:
+                # Сообщения теряются, но предыдущее summary остаётся в силе
+                self.summary_failures += 1
+                logger.warning(f"⚠️ Conversation summary failed for {user_id}: {e}")
+        await self._save(user_id, conversation)
+
+    async def _save(self, user_id: int, conversation: Conversation) -> None:
+        if self.storage is not None:
+            await self.storage.save_conversation(user_id, conversation.summary, list(conversation.messages))
+
+    def record_prompt(self, prompt_tokens: int, history_tokens: int) -> None:
+        """Учитывает размер промпта одного вызова (для /status)"""
+        self.prompt_calls += 1
+        self.prompt_tokens_total += prompt_tokens
+        self.prompt_tokens_max = max(self.prompt_tokens_max, prompt_tokens)
+        self.history_tokens_total += history_tokens
+
+    async def stop(self) -> None:
+        """Дожидается фоновых summary и сохранений (вызывается при shutdown)"""
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=10.0)
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики для /status"""
+        calls = self.prompt_calls
+        return {
+            "users": len(self._users),
+            "pending_tasks": len(self._tasks),
+            "summaries": self.summaries,
+            "summary_failures": self.summary_failures,
+            "prompt_calls": calls,
+            "avg_prompt_tokens": round(self.prompt_tokens_total / calls) if calls else None,
+            "max_prompt_tokens": self.prompt_tokens_max,
+            "avg_history_tokens": round(self.history_tokens_total / calls) if calls else None
+        }
+
+
+# Глобальный экземпляр
+conversation_store = ConversationStore(
+    db if settings.CONVERSATION_PERSIST else None,
+    max_messages=settings.CONVERSATION_MAX_MESSAGES,
+    token_budget=settings.CONVERSATION_TOKEN_BUDGET,
+    max_users=settings.CONVERSATION_MAX_USERS
+)
@@ -0,0 +1,248 @@
+import re
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Маршруты коррекции
+ROUTE_SKIP = "skip"    # ответ без LLM: заведомо корректная реплика
+ROUTE_LIGHT = "light"  # короткая простая фраза - лёгкая модель
+ROUTE_HEAVY = "heavy"  # всё остальное - основная модель
+
+_WORD = re.compile(r"[a-z]+(?:'[a-z]+)?")
+_NON_LATIN = re.compile(r"[^\x00-\x7f’‘“”—–…]")
+
+# Короткие реплики, которые не нуждаются в коррекции
+_TRIVIAL_PHRASES = frozenset({
+    "yes", "no", "yeah", "yep", "nope", "ok", "okay", "sure", "of course", "maybe",
+    "thanks", "thank you", "thank you very much", "thanks a lot", "no thanks", "no thank you",
+    "hi", "hello", "hey", "good morning", "good afternoon", "good evening", "good night",
+    "bye", "goodbye", "see you", "see you later", "see you soon",
+    "how are you", "i'm fine", "i'm fine thanks", "i'm fine thank you", "i'm good", "not bad",
+    "great", "cool", "nice", "awesome", "perfect", "exactly", "right", "me too", "i agree",
+    "i don't know", "i see", "got it", "sounds good", "nice to meet you", "you too",
+    "what about you", "and you", "sorry", "excuse me", "please", "why", "really",
+})
+
+# Частотные слова: неизвестное слово - возможная опечатка или редкая лексика
+_COMMON_WORDS = frozenset("""
+a about after again all also always am an and any are around as at away back be because been
+before being best better big book both but buy by call came can can't car cat city come coffee
+could couldn't day days did didn't do does doesn't dog don't done down drink during each early eat
+english every family far feel few find fine first food for free friend friends from fun game get
+go going good got great had has have haven't he he's her here him his home hot house how i i'd
+i'll i'm i've if in interesting into is isn't it it's its job just know last learn learning
+least like little live long look lot love made make many me more morning most movie movies much
+music my need never new next nice night no not now of off often old on once one only or other
+our out over people play read really right said same saw say school see she she's should so some
+something sometimes soon speak sport still study summer take talk tea teacher tell than that
+that's the their them then there there's these they they're thing things think this those time
+to today together tomorrow too travel tried try two up us usually very visit want wanted was
+wasn't watch water way we we're weather week weekend well went were weren't what what's when
+where which while who why will with work working would wouldn't write year years yes yesterday
+you you're your
+""".split())
+
+# Местоимения 3-го лица ед. числа и формы глаголов, с которыми они не сочетаются
+_THIRD_PERSON = frozenset({"he", "she", "it"})
+_PLURAL_FORMS = frozenset({"don't", "have", "are", "were", "do"})
+_NON_THIRD_PERSON = frozenset({"i", "you", "we", "they"})
+
+# Частые глаголы: после want/need без "to" они почти всегда ошибка
+_BASE_VERBS = frozenset("""
+be become buy come cook dance do drive eat find fly get go have know learn leave listen live make
+meet play read run say see sing speak spend stay study swim take talk tell think travel try visit
+wake watch write
+""".split())
+# Для согласования с he/she/it годятся и глаголы, которые бывают существительными
+_AGREEMENT_VERBS = (_BASE_VERBS | {"like", "love", "hate", "want", "need", "work", "help"}) - {"be"}
+
+
+def _third_person_form(verb: str) -> str:
+    """go -> goes, study -> studies, have -> has, like -> likes"""
+    if verb == "have":
+        return "has"
+    if verb.endswith("y") and verb[-2] not in "aeiou":
+        return verb[:-1] + "ies"
+    if verb.endswith(("o", "ch", "sh", "ss", "x")):
+        return verb + "es"
+    return verb + "s"
+
+
+_THIRD_PERSON_FORMS = frozenset(_third_person_form(verb) for verb in _AGREEMENT_VERBS)
+
+# После этих слов глагол 3-го лица стоит в начальной форме ("does he go")
+_AUXILIARIES = frozenset({
+    "do", "does", "did", "don't", "doesn't", "didn't", "can", "can't", "could", "couldn't",
+    "will", "won't", "would", "wouldn't", "should", "must", "may", "might", "let"
+})
+_MODALS = frozenset({"can", "could", "should", "must", "may", "might", "will", "would"})
+_NEEDS_TO = frozenset({"want", "wants", "wanted", "need", "needs", "needed", "decided", "hope", "plan"})
+
+# Маркеры прошлого и формы прошедшего времени, которые должны их сопровождать
+_PAST_TIME_UNITS = frozenset({
+    "night", "week", "weekend", "month", "year", "summer", "winter", "spring", "autumn", "time",
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"
+})
+_PAST_FORMS = frozenset("""
+was were wasn't weren't did didn't had went saw came made said got bought ate drank took gave
+found told thought wrote read met left felt slept spoke began became knew ran sat stood heard
+lost paid put sent spent taught understood won wore woke flew drove swam sang could couldn't
+""".split())
+_NOT_PAST_ED = frozenset({"need", "bed", "red", "feed", "speed", "seed", "indeed", "shed"})
+
+_VOWEL_SOUND_EXCEPTIONS = ("uni", "use", "usu", "eu", "one", "once")
+_CONSONANT_SOUND_EXCEPTIONS = ("hour", "honest", "honor", "heir")
+
+
+def normalize_phrase(text: str) -> str:
+    """Нижний регистр, прямые апострофы, без пунктуации и лишних пробелов"""
+    text = text.lower().replace("’", "'").replace("‘", "'")
+    return " ".join(_WORD.findall(text))
+
+
+def _is_past(word: str) -> bool:
+    return word in _PAST_FORMS or (word.endswith("ed") and len(word) > 3 and word not in _NOT_PAST_ED)
+
+
+def _past_time_marker(words: Tuple[str, ...]) -> bool:
+    """Есть ли в реплике указание на прошлое: yesterday, ago, last week..."""
+    if "yesterday" in words or "ago" in words:
+        return True
+    return any(prev == "last" and word in _PAST_TIME_UNITS for prev, word in zip(words, words[1:]))
+
+
+def _grammar_flags(words: Tuple[str, ...]) -> Optional[str]:
+    """Простые эвристики типичных ошибок; возвращает название первой найденной"""
+    if _past_time_marker(words) and not any(_is_past(word) for word in words):
+        return "tense with past time marker"
+    for i, (prev, word) in enumerate(zip(words, words[1:])):
+        before = words[i - 1] if i else ""
+        if prev == word and word not in ("very", "really", "no", "bye"):
+            return "repeated word"
+        if prev == "a" and word[0] in "aeiou" and not word.startswith(_VOWEL_SOUND_EXCEPTIONS):
+            return "a before vowel"
+        if prev == "an" and word[0] not in "aeiou" and not word.startswith(_CONSONANT_SOUND_EXCEPTIONS):
+            return "an before consonant"
+        if prev in _THIRD_PERSON and before not in _AUXILIARIES and (word in _PLURAL_FORMS or word in _AGREEMENT_VERBS):
+            return "subject-verb agreement"
+        if prev == "i" and word in ("is", "are", "has"):
+            return "subject-verb agreement"
+        if prev in _NON_THIRD_PERSON and (word in _THIRD_PERSON_FORMS or word in ("is", "doesn't")):
+            return "subject-verb agreement"
+        if prev in ("you", "we", "they") and word == "was":
+            return "subject-verb agreement"
+        if prev in _NEEDS_TO and word in _BASE_VERBS:
+            return "missing to before verb"
+        if prev in _MODALS and word == "to":
+            return "to after modal"
+        if prev in ("didn't", "did", "doesn't", "does", "can", "can't", "will") and word in ("went", "saw", "did", "was", "had"):
+            return "verb form after auxiliary"
+        if prev == "more" and word in ("better", "worse", "bigger", "smaller"):
+            return "double comparative"
+    return None
+
+
+class CorrectionPrecheck:
+    """
+    Локальная пред-классификация реплик перед коррекцией.
+
+    Без LLM отвечает на короткие заведомо корректные реплики ("Yes",
+    "Thanks!"), короткие простые фразы отправляет на лёгкую модель,
+    остальное - на основную. Уверенность ниже порогов всегда означает
+    основную модель. Любой признак типичной ошибки (время при
+    "yesterday", пропущенное "to" после want/need, согласование
+    подлежащего и сказуемого) даёт нулевую уверенность: фраза с ошибкой
+    на лёгкую модель не уходит. Уже проверенные предложения отвечает
+    result_cache GroqClient ещё до пред-классификации.
+    """
+
+    def __init__(
+        self,
+        skip_threshold: float = 0.9,
+        light_threshold: float = 0.6,
+        light_max_words: int = 10
+    ):
+        self.skip_threshold = skip_threshold
+        self.light_threshold = light_threshold
+        self.light_max_words = light_max_words
+
+        # Метрики
+        self.checks = 0
+        self.routes: Dict[str, int] = {ROUTE_SKIP: 0, ROUTE_LIGHT: 0, ROUTE_HEAVY: 0}
+
+    def confidence(self, text: str) -> Tuple[float, Optional[str]]:
+        """
+        Уверенность (0..1), что реплика корректна и тривиальна
+
+        Returns:
+            (confidence, reason) - reason объясняет низкую оценку для логов
+        """
+        if _NON_LATIN.search(text):
+            return 0.0, "non-latin text"
+
+        phrase = normalize_phrase(text)
+        if not phrase:
+            return 0.0, "no words"
+        if phrase in _TRIVIAL_PHRASES:
+            return 1.0, None
+
+        words = tuple(phrase.split())
+        flag = _grammar_flags(words)
+        if flag:
+            return 0.0, flag
+
+        known = sum(1 for word in words if word in _COMMON_WORDS) / len(words)
+        length_factor = max(0.0, 1.0 - max(0, len(words) - 6) * 0.1)
+        # Эвристики не доказывают грамматическую корректность: не выше 0.8
+        return round(0.8 * known * length_factor, 3), None
+
+    def route(self, text: str) -> str:
+        confidence, reason = self.confidence(text)
+        if confidence >= self.skip_threshold:
+            return ROUTE_SKIP
+        if confidence >= self.light_threshold and len(text.split()) <= self.light_max_words:
+            return ROUTE_LIGHT
+        if reason:
+            logger.debug(f"Precheck: heavy correction ({reason})")
+        return ROUTE_HEAVY
+
+    def check(self, text: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Маршрут коррекции для реплики
+
+        Returns:
+            (route, result) - result готов для skip, иначе None
+        """
+        self.checks += 1
+
+        route = self.route(text)
+        self.routes[route] += 1
+        if route == ROUTE_SKIP:
+            return route, {
+                "corrected_sentence": text,
+                "explanation": "No corrections needed.",
+                "vocabulary_items": [],
+                "error_category": "none"
+            }
+        return route, None
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики для /status"""
+        avoided = self.routes[ROUTE_SKIP] + self.routes[ROUTE_LIGHT]
+        return {
+            "checks": self.checks,
+            **self.routes,
+            "heavy_calls_avoided": avoided,
+            "avoided_rate": round(avoided / self.checks, 3) if self.checks else 0.0
+        }
+
+
+# Глобальный экземпляр
+correction_precheck = CorrectionPrecheck(
+    skip_threshold=settings.PRECHECK_SKIP_THRESHOLD,
+    light_threshold=settings.PRECHECK_LIGHT_THRESHOLD,
+    light_max_words=settings.PRECHECK_LIGHT_MAX_WORDS
+)
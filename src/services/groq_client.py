@@ -1,18 +1,37 @@
-import random
+import re
+import time
 import asyncio
 import logging
 import json
-from typing import List, Optional, Dict, Any, Tuple
-from openai import AsyncOpenAI
+import hashlib
+from collections import defaultdict
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, List, Optional, Dict, Any, Tuple, Union
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from openai.types import CompletionUsage
 
 from src.config import settings
+from src.services.conversation import conversation_store, estimate_tokens
+from src.services.correction_precheck import correction_precheck, ROUTE_LIGHT
+from src.services.key_scheduler import KeyScheduler, is_retryable
+from src.services.opus_encoder import opus_encoder
+from src.services.prompts import prompt_registry
+from src.services.tts_cache import tts_cache
+from src.services.usage_tracker import usage_tracker
+from src.utils.audio import concat_wav, ogg_duration, split_voice
+from src.utils.cache import TTLCache
+from src.utils.metrics import LatencyStats
+from src.utils.singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
 # Импорт Piper TTS клиента (опционально)
 try:
     from src.services.piper_tts_client import PiperTTSClient
-    piper_client = PiperTTSClient(settings.PIPER_TTS_URL) if settings.PIPER_TTS_URL else None
+    piper_client = (
+        PiperTTSClient(settings.PIPER_TTS_URL, stream_encode=settings.PIPER_STREAM_ENCODE)
+        if settings.PIPER_TTS_URL else None
+    )
     if piper_client:
         logger.info(f"✅ Piper TTS client initialized with URL: {settings.PIPER_TTS_URL}")
 except ImportError:
@@ -22,145 +41,504 @@ except Exception as e:
     piper_client = None
     logger.warning(f"⚠️ Piper TTS client initialization failed: {e}")
 
+CHAT_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
+FALLBACK_CHAT_RESPONSE = "I'm here to help you practice English. Tell me more!"
+
+# Конец предложения: знак препинания (и закрывающие кавычки/скобки), затем пробел
+_SENTENCE_END = re.compile(r'[.!?…]+["\')\]]*\s+')
+
+
+def split_sentences(buffer: str, min_chars: int = 0) -> Tuple[List[str], str]:
+    """
+    Вырезает из буфера законченные предложения
+    
+    Короткие предложения склеиваются со следующими, пока не наберётся min_chars,
+    чтобы не синтезировать отдельно "Oh!" или "Great.".
+    
+    Returns:
+        (готовые предложения, незаконченный остаток)
+    """
+    sentences = []
+    start = 0
+    for match in _SENTENCE_END.finditer(buffer):
+        candidate = buffer[start:match.end()].strip()
+        if len(candidate) >= min_chars:
+            sentences.append(candidate)
+            start = match.end()
+    return sentences, buffer[start:]
+
+
+def _normalize_word(word: str) -> str:
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+def stitch_transcripts(parts: List[str], max_overlap_words: int = 12) -> str:
+    """
+    Склеивает транскрипции перекрывающихся сегментов
+    
+    Конец уже собранного текста и начало следующего сегмента содержат
+    одни и те же слова из зоны перекрытия - самый длинный совпадающий
+    фрагмент (без учёта регистра и пунктуации) выбрасывается из следующего.
+    """
+    words: List[str] = []
+    for part in parts:
+        new_words = part.split()
+        if not new_words:
+            continue
+        
+        skip = 0
+        limit = min(max_overlap_words, len(words), len(new_words))
+        for size in range(limit, 0, -1):
+            tail = [_normalize_word(w) for w in words[-size:]]
+            head = [_normalize_word(w) for w in new_words[:size]]
+            # Совпадение из одного короткого слова ("a", "the") слишком вероятно случайно
+            if tail == head and (size > 1 or len(tail[0]) > 3):
+                skip = size
+                break
+        words.extend(new_words[skip:])
+    return " ".join(words)
+
+
+def _stream_chunk_usage(chunk: Any) -> Optional[CompletionUsage]:
+    """usage из чанка потока: стандартное поле или x_groq.usage финального чанка Groq"""
+    usage = getattr(chunk, "usage", None)
+    if usage is None:
+        groq_usage = (getattr(chunk, "x_groq", None) or {}).get("usage")
+        if groq_usage:
+            usage = CompletionUsage.model_validate(groq_usage)
+    return usage
+
+
 class GroqClient:
-    def __init__(self, api_keys: List[str]):
+    def __init__(self, api_keys: List[str], base_url: str = "https://api.groq.com/openai/v1"):
         self.clients = []
-        self.current_index = 0
         
-        # Инициализируем клиенты для round-robin
+        # Инициализируем клиенты; каждый HTTP-клиент сообщает планировщику rate-limit заголовки.
+        # Повторы SDK отключены: после 429 или таймаута _make_request сразу берёт другой ключ
         for key in api_keys:
             if key.strip():
                 self.clients.append(
                     AsyncOpenAI(
                         api_key=key.strip(),
-                        base_url="https://api.groq.com/openai/v1",
-                        timeout=60.0
+                        base_url=base_url,
+                        timeout=60.0,
+                        max_retries=0,
+                        http_client=DefaultAsyncHttpxClient(
+                            event_hooks={"response": [self._headers_hook(len(self.clients))]}
+                        )
                     )
                 )
+        
+        self.scheduler = KeyScheduler(
+            self.clients,
+            failure_threshold=settings.GROQ_BREAKER_FAILURES,
+            open_seconds=settings.GROQ_BREAKER_OPEN_SECONDS,
+            max_wait=settings.GROQ_MAX_KEY_WAIT
+        )
+        
+        # Транскрипции по file_unique_id и по хэшу содержимого
+        self.transcription_cache = TTLCache(
+            maxsize=settings.TRANSCRIPTION_CACHE_SIZE,
+            ttl=settings.TRANSCRIPTION_CACHE_TTL
+        )
+        
+        # Одинаковые одновременные запросы (коррекция, TTS) выполняются один раз,
+        # детерминированные результаты коррекции (temperature=0) кэшируются
+        self.singleflight = SingleFlight()
+        self.result_cache = TTLCache(
+            maxsize=settings.RESULT_CACHE_SIZE,
+            ttl=settings.RESULT_CACHE_TTL
+        )
+        
+        # Латентность по операциям (с учётом hedging) и счётчики хеджирования
+        self.latency: Dict[str, LatencyStats] = defaultdict(LatencyStats)
+        self.hedge_counters: Dict[str, Dict[str, int]] = defaultdict(lambda: {"requests": 0, "hedged": 0, "hedge_wins": 0})
+        
+        # Латентность и использование по моделям Whisper
+        self.whisper_latency: Dict[str, LatencyStats] = defaultdict(LatencyStats)
+        self.whisper_usage: Dict[str, Dict[str, Any]] = defaultdict(lambda: {"requests": 0, "audio_seconds": 0.0, "escalations": 0})
+        
+        # Старые реплики диалога сворачиваются в summary лёгкой моделью
+        conversation_store.summarizer = self.summarize_conversation
         logger.info(f"✅ Инициализировано {len(self.clients)} Groq клиентов")
     
-    def _get_next_client(self) -> Optional[AsyncOpenAI]:
-        """Round-robin выбор следующего клиента"""
-        if not self.clients:
-            return None
-        
-        client = self.clients[self.current_index]
-        self.current_index = (self.current_index + 1) % len(self.clients)
-        return client
+    def _headers_hook(self, index: int):
+        """httpx hook: передаёт x-ratelimit-* заголовки ответа в планировщик ключей"""
+        async def _hook(response):
+            self.scheduler.observe_headers(index, response.headers)
+        return _hook
     
-    async def _make_request(self, func, *args, **kwargs):
-        """Универсальный метод с retry и балансировкой"""
+    async def _make_request(
+        self,
+        func,
+        *args,
+        usage_model: Optional[str] = None,
+        audio_seconds: float = 0.0,
+        **kwargs
+    ):
+        """
+        Универсальный метод с retry и выбором наименее загруженного здорового ключа
+        
+        usage успешного ответа (и audio_seconds для Whisper) учитывается в
+        usage_tracker по ключу, модели и текущему сообщению пользователя.
+        """
         if not self.clients:
             raise Exception("Нет доступных Groq клиентов")
         
         errors = []
         
-        # Пробуем каждый ключ до 2 раз
+        # Не больше двух попыток на ключ; паузы между ними задаёт планировщик
         for attempt in range(len(self.clients) * 2):
-            client = self._get_next_client()
-            if not client:
+            try:
+                state = await self.scheduler.acquire()
+            except Exception as e:
+                errors.append(str(e))
                 break
             
+            started = time.monotonic()
             try:
-                return await func(client, *args, **kwargs)
+                result = await func(state.client, *args, **kwargs)
+            except asyncio.CancelledError:
+                self.scheduler.release(state)
+                raise
             except Exception as e:
+                self.scheduler.release(state, latency=time.monotonic() - started, error=e)
                 errors.append(str(e))
-                logger.warning(f"❌ Groq request failed (attempt {attempt + 1}): {e}")
-                await asyncio.sleep(0.5 + random.random())  # Jitter
+                logger.warning(f"❌ Groq request failed on key #{state.index} (attempt {attempt + 1}): {e}")
+                if not is_retryable(e):
+                    break
+                continue
+            
+            self.scheduler.release(state, latency=time.monotonic() - started)
+            usage_tracker.record(
+                state.index,
+                usage_model or getattr(result, "model", None),
+                getattr(result, "usage", None),
+                audio_seconds
+            )
+            return result
         
         raise Exception(f"Все Groq клиенты недоступны: {'; '.join(errors[:3])}")
     
-    async def transcribe_audio(self, audio_bytes: bytes) -> Optional[str]:
+    def _hedge_delay(self, operation: str) -> float:
+        """Через сколько секунд без ответа отправлять дубль запроса"""
+        stats = self.latency[operation]
+        delay = None
+        if stats.count >= settings.GROQ_HEDGE_MIN_SAMPLES:
+            delay = stats.percentile(settings.GROQ_HEDGE_PERCENTILE)
+        return max(delay or settings.GROQ_HEDGE_DEFAULT_DELAY, settings.GROQ_HEDGE_MIN_DELAY)
+    
+    async def _make_hedged_request(self, operation: str, func, *args, **kwargs):
+        """
+        _make_request с опциональным hedging
+        
+        Если первый запрос не ответил за перцентиль латентности операции,
+        дубль уходит на другой ключ (планировщик выдаст менее загруженный),
+        берётся первый успешный ответ, проигравший запрос отменяется.
+        """
+        started = time.monotonic()
+        counters = self.hedge_counters[operation]
+        counters["requests"] += 1
+        
+        if not settings.GROQ_HEDGE_ENABLED or len(self.clients) < 2:
+            result = await self._make_request(func, *args, **kwargs)
+            self.latency[operation].add(time.monotonic() - started)
+            return result
+        
+        primary = asyncio.create_task(self._make_request(func, *args, **kwargs))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self._hedge_delay(operation))
+            if not done:
+                counters["hedged"] += 1
+                hedge = asyncio.create_task(self._make_request(func, *args, **kwargs))
+                pending.add(hedge)
+                logger.info(f"⚡ Hedging {operation} after {time.monotonic() - started:.2f}s")
+            
+            last_error = None
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            counters["hedge_wins"] += 1
+                        self.latency[operation].add(time.monotonic() - started)
+                        return task.result()
+                    last_error = task.exception()
+                if not pending:
+                    raise last_error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    def latency_stats(self) -> Dict[str, Any]:
+        """Латентность и hedging по операциям для /status"""
+        result = {}
+        for operation, stats in self.latency.items():
+            counters = self.hedge_counters[operation]
+            result[operation] = {
+                **stats.stats(),
+                **counters,
+                "hedge_rate": round(counters["hedged"] / counters["requests"], 3) if counters["requests"] else 0.0
+            }
+        return result
+    
+    def get_cached_transcription(self, file_unique_id: str) -> Optional[str]:
+        """Транскрипция голосового с тем же Telegram file_unique_id (пересланные и повторные)"""
+        return self.transcription_cache.get(("file", file_unique_id))
+    
+    @staticmethod
+    def _audio_digest(audio: Union[bytes, BinaryIO, Path]) -> Optional[str]:
+        """sha256 содержимого для аудио в памяти (файлы на диске не хэшируем)"""
+        if isinstance(audio, (bytes, bytearray, memoryview)):
+            return hashlib.sha256(audio).hexdigest()
+        if hasattr(audio, "getbuffer"):
+            with audio.getbuffer() as view:
+                return hashlib.sha256(view).hexdigest()
+        return None
+    
+    async def transcribe_audio(
+        self,
+        audio: Union[bytes, BinaryIO, Path],
+        file_unique_id: Optional[str] = None
+    ) -> Optional[str]:
         """
         Транскрибация голоса через Whisper на Groq
         
         Args:
-            audio_bytes: Байты аудиофайла (OGG формат)
+            audio: Аудио в формате OGG - байты, буфер (BytesIO) или путь к файлу.
+                Буфер передаётся в HTTP-клиент без копирования.
+            file_unique_id: Telegram file_unique_id для кэша транскрипций
             
         Returns:
             str: Распознанный текст или None в случае ошибки
         """
+        digest = self._audio_digest(audio)
+        if digest:
+            cached = self.transcription_cache.get(("sha256", digest))
+            if cached is not None:
+                logger.info("✅ Transcription cache hit (content hash)")
+                if file_unique_id:
+                    self.transcription_cache.set(("file", file_unique_id), cached)
+                return cached
+        
+        try:
+            duration = self._audio_seconds(audio)
+            long_audio = self._long_audio_source(audio, duration)
+            if long_audio is not None:
+                try:
+                    text = await self._transcribe_chunked(long_audio, duration)
+                except Exception as e:
+                    logger.warning(f"⚠️ Chunked transcription failed, sending whole file: {e}")
+                    text = await self._transcribe_once(audio, duration)
+            else:
+                text = await self._transcribe_once(audio, duration)
+            
+            if text and len(text) <= settings.TRANSCRIPTION_CACHE_MAX_TEXT_CHARS:
+                if file_unique_id:
+                    self.transcription_cache.set(("file", file_unique_id), text)
+                if digest:
+                    self.transcription_cache.set(("sha256", digest), text)
+            return text
+        except Exception as e:
+            logger.error(f"❌ Ошибка транскрибации: {e}")
+            # Возвращаем None вместо текста ошибки, чтобы обработать выше
+            return None
+    
+    @staticmethod
+    def _audio_seconds(audio: Union[bytes, BinaryIO, Path]) -> Optional[float]:
+        """Длительность OGG; у файла на диске читаются только начало и последняя страница"""
+        if isinstance(audio, (bytes, bytearray, memoryview, Path)):
+            return ogg_duration(audio)
+        if hasattr(audio, "getbuffer"):
+            with audio.getbuffer() as view:
+                return ogg_duration(view)
+        return None
+    
+    def _keys_saturated(self) -> bool:
+        """Пул ключей перегружен: в среднем на ключ приходится слишком много запросов"""
+        states = self.scheduler.states
+        if not states:
+            return False
+        in_flight = sum(state.in_flight for state in states)
+        return in_flight / len(states) >= settings.WHISPER_SATURATION_IN_FLIGHT
+    
+    def _whisper_model(self, duration: Optional[float]) -> str:
+        """
+        Выбор модели Whisper: короткие клипы и все клипы при перегрузке
+        ключей - на быструю модель, длинные - на большую
+        """
+        if not settings.WHISPER_ROUTING:
+            return settings.WHISPER_MODEL
+        if duration is not None and duration <= settings.WHISPER_FAST_MAX_SECONDS:
+            return settings.WHISPER_FAST_MODEL
+        if self._keys_saturated():
+            return settings.WHISPER_FAST_MODEL
+        return settings.WHISPER_MODEL
+    
+    async def _transcribe_once(
+        self,
+        audio: Union[bytes, BinaryIO, Path],
+        duration: Optional[float] = None
+    ) -> str:
+        """
+        Один клип через Whisper с маршрутизацией по модели
+        
+        Ответ быстрой модели с низкой уверенностью (avg_logprob) повторно
+        распознаётся большой моделью, если ключи не перегружены.
+        """
+        model = self._whisper_model(duration)
+        escalate = settings.WHISPER_ROUTING and model != settings.WHISPER_MODEL
+        text, confidence = await self._whisper_request(audio, model, duration, with_confidence=escalate)
+        
+        if escalate and confidence is not None and confidence < settings.WHISPER_ESCALATE_LOGPROB:
+            if self._keys_saturated():
+                logger.info(f"⚠️ Low-confidence transcript (avg_logprob={confidence:.2f}) kept: keys saturated")
+            else:
+                logger.info(f"🔁 Low-confidence transcript (avg_logprob={confidence:.2f}), retrying on {settings.WHISPER_MODEL}")
+                self.whisper_usage[model]["escalations"] += 1
+                text, _ = await self._whisper_request(audio, settings.WHISPER_MODEL, duration)
+        return text
+    
+    async def _whisper_request(
+        self,
+        audio: Union[bytes, BinaryIO, Path],
+        model: str,
+        duration: Optional[float] = None,
+        with_confidence: bool = False
+    ) -> Tuple[str, Optional[float]]:
+        """Запрос к Whisper; с with_confidence дополнительно возвращает средний avg_logprob"""
         async def _transcribe(client):
+            if isinstance(audio, Path):
+                # OpenAI SDK сам асинхронно читает файл по пути
+                file = audio
+            else:
+                if hasattr(audio, "seek"):
+                    # Повторная попытка должна читать буфер с начала
+                    audio.seek(0)
+                file = ("voice.ogg", audio, "audio/ogg")  # Явный MIME тип
+            
             response = await client.audio.transcriptions.create(
-                model="whisper-large-v3",  # Правильное имя модели для Groq
-                file=("voice.ogg", audio_bytes, "audio/ogg"),  # Явный MIME тип
+                model=model,
+                file=file,
                 language="en",
-                response_format="text",
+                response_format="verbose_json" if with_confidence else "text",
                 temperature=0.0
             )
             return response
         
-        try:
-            result = await self._make_request(_transcribe)
-            # Если результат строка, возвращаем как есть, иначе извлекаем текст
-            if isinstance(result, str):
-                return result.strip()
-            elif hasattr(result, 'text'):
-                return result.text.strip()
-            else:
-                return str(result).strip()
-        except Exception as e:
-            logger.error(f"❌ Ошибка транскрибации: {e}")
-            # Возвращаем None вместо текста ошибки, чтобы обработать выше
+        started = time.monotonic()
+        result = await self._make_request(_transcribe, usage_model=model, audio_seconds=duration or 0.0)
+        
+        self.whisper_latency[model].add(time.monotonic() - started)
+        usage = self.whisper_usage[model]
+        usage["requests"] += 1
+        if duration is not None:
+            usage["audio_seconds"] += duration
+        
+        # Если результат строка, возвращаем как есть, иначе извлекаем текст
+        if isinstance(result, str):
+            return result.strip(), None
+        elif hasattr(result, 'text'):
+            return result.text.strip(), self._avg_logprob(result)
+        else:
+            return str(result).strip(), None
+    
+    @staticmethod
+    def _avg_logprob(result: Any) -> Optional[float]:
+        """Средний avg_logprob сегментов verbose_json, взвешенный по их длительности"""
+        segments = getattr(result, "segments", None) or []
+        total = weight = 0.0
+        for segment in segments:
+            get = segment.get if isinstance(segment, dict) else lambda name: getattr(segment, name, None)
+            logprob = get("avg_logprob")
+            if logprob is None:
+                continue
+            length = max((get("end") or 0.0) - (get("start") or 0.0), 0.01)
+            total += logprob * length
+            weight += length
+        return total / weight if weight else None
+    
+    def whisper_stats(self) -> Dict[str, Any]:
+        """Использование и латентность моделей Whisper для /status"""
+        return {
+            model: {
+                **self.whisper_latency[model].stats(),
+                **usage,
+                "audio_seconds": round(usage["audio_seconds"], 1)
+            }
+            for model, usage in self.whisper_usage.items()
+        }
+    
+    @staticmethod
+    def _long_audio_source(
+        audio: Union[bytes, BinaryIO, Path],
+        duration: Optional[float]
+    ) -> Union[bytes, Path, None]:
+        """
+        Аудио для нарезки, если его стоит распознавать по частям, иначе None
+        
+        Файл на диске не читается в память: воркер пула декодирует его по пути.
+        """
+        if not settings.LONG_AUDIO_ENABLED or not opus_encoder.available:
             return None
+        if duration is None or duration < settings.LONG_AUDIO_SECONDS:
+            return None
+        if isinstance(audio, Path):
+            return audio
+        return audio.getvalue() if hasattr(audio, "getvalue") else bytes(audio)
+    
+    async def _transcribe_chunked(self, ogg: Union[bytes, Path], duration: float) -> str:
+        """
+        Длинная запись: нарезка по паузам с перекрытием (в пуле процессов),
+        параллельная транскрибация сегментов на разных ключах и склейка текста
+        """
+        started = time.monotonic()
+        segments = await opus_encoder.run(
+            split_voice,
+            ogg,
+            settings.LONG_AUDIO_CHUNK_SECONDS,
+            settings.LONG_AUDIO_OVERLAP_SECONDS,
+            # Декодирование и перекодирование растут с длиной записи
+            timeout=settings.OPUS_ENCODER_TIMEOUT + duration / 60 * settings.LONG_AUDIO_SPLIT_TIMEOUT_PER_MINUTE
+        )
+        if len(segments) == 1:
+            return await self._transcribe_once(segments[0], ogg_duration(segments[0]))
+        
+        semaphore = asyncio.Semaphore(settings.LONG_AUDIO_CONCURRENCY)
+        
+        async def _segment(segment: bytes) -> str:
+            async with semaphore:
+                return await self._transcribe_once(segment, ogg_duration(segment))
+        
+        texts = await asyncio.gather(*(_segment(segment) for segment in segments))
+        logger.info(f"✅ Transcribed {len(segments)} segments in {time.monotonic() - started:.2f}s")
+        return stitch_transcripts(texts)
     
     async def correct_text(self, text: str, level: str) -> Dict[str, Any]:
-        """GPT OSS 120B для коррекции с улучшенным промптом"""
+        """
+        Коррекция реплики: GPT OSS 120B с улучшенным промптом
         
-        system_prompt = """# ROLE
-You are an elite ESL Professor with 15+ years of experience. Your goal is to analyze the user's input with surgical precision, provide actionable corrections, and explain the underlying logic in a way that accelerates fluency.
-
-# LEVEL-ADAPTIVE PEDAGOGY
-## BEGINNER (A1-A2)
-- Focus: Basic Tenses (Present/Past/Future Simple), Articles (a/an/the), Subject-Verb Agreement, Word Order
-- Explanation style: 100% Russian, nurturing tone
-- Vocabulary items: Only high-frequency words (Top 1000)
-
-## ELEMENTARY (A2-B1)
-- Focus: Present Perfect, Prepositions, Common Phrasal Verbs, Comparatives
-- Explanation style: 60% Russian / 40% English
-- Vocabulary items: Everyday collocations
-
-## INTERMEDIATE (B1-B2)
-- Focus: Conditionals, Reported Speech, Collocations, Phrasal Verbs with multiple meanings
-- Explanation style: 30% Russian / 70% English
-- Vocabulary items: Academic/professional terms
-
-## ADVANCED (C1-C2)
-- Focus: Subjunctive Mood, Inversion, Nuance, Register, Stylistic choices
-- Explanation style: 100% English, sophisticated metalanguage
-- Vocabulary items: Rare synonyms, idiomatic expressions
-
-# OUTPUT FORMAT (JSON ONLY)
-{
-  "corrected_sentence": "[Full corrected sentence - if perfect, return original]",
-  "explanation": "[Level-appropriate explanation, max 2 sentences, focus on WHY]",
-  "vocabulary_items": [
-    {
-      "word_or_phrase": "...",
-      "translation": "...",
-      "context_sentence": "...",
-      "mastery_score": 0
-    }
-  ],
-  "error_category": "grammar|vocabulary|pronunciation|structure|style|none"
-}"""
+        Уже проверенные (result_cache) и тривиальные реплики отвечаются
+        локально, короткие простые фразы уходят на лёгкую модель.
+        """
+        model = settings.CORRECTION_MODEL
+        if settings.PRECHECK_ENABLED:
+            route, precomputed = correction_precheck.check(text)
+            if precomputed is not None:
+                return precomputed
+            if route == ROUTE_LIGHT:
+                model = settings.LIGHT_CORRECTION_MODEL
         
-        async def _correct(client):
-            response = await client.chat.completions.create(
-                model="openai/gpt-oss-120b",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"LEVEL: {level}\nUSER TEXT: {text}\n\nAnalyze and correct."}
-                ],
-                temperature=0.0,
-                response_format={"type": "json_object"}
-            )
-            return response.choices[0].message.content
+        # Модель входит в ключ: ответ лёгкой модели не выдаётся за ответ основной
+        key = self._correction_key(text, level, model)
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            return dict(cached)
         
         try:
-            result = await self._make_request(_correct)
-            return json.loads(result)
+            # Каждый вызывающий получает свою копию общего результата
+            return dict(await self.singleflight.do(key, lambda: self._request_correction(key, text, level, model)))
         except Exception as e:
             logger.error(f"❌ Ошибка коррекции: {e}")
             return {
@@ -170,104 +548,330 @@ You are an elite ESL Professor with 15+ years of experience. Your goal is to ana
                 "error_category": "None"
             }
     
-    async def generate_response(self, text: str, level: str) -> str:
-        """Llama 4 Scout для диалога с улучшенным промптом"""
+    @staticmethod
+    def _correction_key(text: str, level: str, model: str) -> Tuple[str, str, str, str]:
+        # Регистр и пунктуация значимы для коррекции, нормализуем только пробелы
+        return "correct_text", model, " ".join(text.split()), level
+    
+    async def _request_correction(self, key: Tuple, text: str, level: str, model: str) -> Dict[str, Any]:
+        """Запрос коррекции к модели; результат попадает в result_cache"""
+        async def _correct(client):
+            return await client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": prompt_registry.render("correction", level)},
+                    {"role": "user", "content": f"USER TEXT: {text}\n\nAnalyze and correct."}
+                ],
+                temperature=0.0,
+                response_format={"type": "json_object"}
+            )
         
-        system_prompt = f"""# ROLE
-You are "Speech Flow AI", a charismatic English conversation partner who makes learners WANT to keep talking. You balance being supportive with gently pushing boundaries (i+1 principle).
-
-# LEVEL-ADAPTIVE COMMUNICATION MATRIX
-
-## BEGINNER (A1-A2)
-- Vocabulary: Top 500 words only
-- Grammar: Present/Past/Future Simple, "can", "there is/are"
-- Sentence length: 5-8 words max
-- Questions: Binary choice or Yes/No
-  Example: "Do you like coffee or tea?"
-
-## ELEMENTARY (A2-B1)
-- Vocabulary: Top 1500 words + basic adjectives
-- Grammar: Present Perfect, "going to", basic modals
-- Sentence length: 8-12 words
-- Questions: Simple "Wh-" questions, "Have you ever...?"
-  Example: "What did you do last weekend?"
-
-## INTERMEDIATE (B1-B2)
-- Vocabulary: 3000+ words, idioms, phrasal verbs
-- Grammar: All tenses, conditionals, passive voice
-- Sentence length: 10-15 words
-- Questions: Open-ended, opinion-based
-  Example: "What's the most challenging part of learning English for you?"
-
-## ADVANCED (C1-C2)
-- Vocabulary: Academic/business, subtle nuances, literary expressions
-- Grammar: Subjunctive, inversion, cleft sentences
-- Sentence length: Natural (15-20 words)
-- Questions: Abstract, provocative, philosophical
-  Example: "How do you think AI will reshape the job market in the next decade?"
-
-# CONVERSATION ENGINEERING RULES
-
-1. **NEVER repeat the user's mistakes**
-   - If user says "I go yesterday", respond naturally: "Oh, you went somewhere yesterday? Where did you go?"
-
-2. **ALWAYS end with ONE question**
-   - Use varied question types (avoid repetition)
-   - Make questions feel like natural curiosity, not interrogation
-
-3. **Match energy + 1**
-   - Keep responses SHORT: 2-3 sentences max
-   - Reference their previous messages when possible
-
-4. **Avoid teacher mode**
-   - Just have a natural conversation
-   - Don't say "Good job!" or give explicit corrections
-
-# RESPONSE LENGTH
-- Beginner: 1-2 sentences + question
-- Elementary: 2 sentences + question
-- Intermediate: 2-3 sentences + question
-- Advanced: 3 sentences + question
-
-# CURRENT CONTEXT
-User Level: {level}
-
-# YOUR RESPONSE (2-3 sentences + question):"""
+        started = time.monotonic()
+        response = await self._make_hedged_request("correct_text", _correct)
+        prompt_registry.record("correction", response.usage, latency=time.monotonic() - started)
+        result = json.loads(response.choices[0].message.content)
+        self.result_cache.set(key, result)
+        return result
+    
+    def _chat_messages(
+        self,
+        text: str,
+        level: str,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": prompt_registry.render("chat", level)},
+            *(history or []),
+            {"role": "user", "content": text}
+        ]
+    
+    async def _history(self, user_id: Optional[int]) -> List[Dict[str, str]]:
+        """История диалога пользователя в пределах бюджета токенов"""
+        if user_id is None or not settings.CONVERSATION_MEMORY:
+            return []
+        return await conversation_store.history(user_id)
+    
+    async def _remember_exchange(self, user_id: Optional[int], text: str, reply: str) -> None:
+        if user_id is not None and settings.CONVERSATION_MEMORY:
+            await conversation_store.add_exchange(user_id, text, reply)
+    
+    @staticmethod
+    def _record_prompt(
+        operation: str,
+        messages: List[Dict[str, str]],
+        history: List[Dict[str, str]],
+        usage: Any = None
+    ) -> None:
+        """Логирует размер промпта: prompt_tokens из usage или оценка, если usage нет"""
+        history_tokens = sum(estimate_tokens(m["content"]) for m in history)
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        if prompt_tokens is None:
+            prompt_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+        conversation_store.record_prompt(prompt_tokens, history_tokens)
+        logger.info(f"📝 {operation} prompt: {prompt_tokens} tokens ({len(history)} history messages, ~{history_tokens} tokens)")
+    
+    async def generate_response(self, text: str, level: str, user_id: Optional[int] = None) -> str:
+        """Llama 4 Scout для диалога с улучшенным промптом и историей диалога"""
+        history = await self._history(user_id)
+        messages = self._chat_messages(text, level, history)
         
         async def _chat(client):
-            response = await client.chat.completions.create(
-                model="meta-llama/llama-4-scout-17b-16e-instruct",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": text}
-                ],
+            return await client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
                 temperature=0.8,
                 max_tokens=400
             )
-            return response.choices[0].message.content
         
         try:
-            return await self._make_request(_chat)
+            started = time.monotonic()
+            response = await self._make_hedged_request("generate_response", _chat)
+            prompt_registry.record("chat", response.usage, latency=time.monotonic() - started)
+            self._record_prompt("generate_response", messages, history, response.usage)
+            chat_response = response.choices[0].message.content
+            await self._remember_exchange(user_id, text, chat_response)
+            return chat_response
         except Exception as e:
             logger.error(f"❌ Ошибка генерации ответа: {e}")
-            return "I'm here to help you practice English. Tell me more!"
+            return FALLBACK_CHAT_RESPONSE
+    
+    async def summarize_conversation(self, summary: str, messages: List[Dict[str, str]]) -> str:
+        """Сворачивает старые реплики диалога в краткое содержание (вне критического пути)"""
+        transcript = "\n".join(
+            f"{'User' if m['role'] == 'user' else 'Tutor'}: {m['content']}" for m in messages
+        )
+        prompt = f"""Update the running summary of a conversation between an English learner (User) and a conversation partner (Tutor).
+Keep facts about the user (name, interests, plans, events they mentioned) and topics already discussed. Max 80 words, plain text.
+
+CURRENT SUMMARY:
+{summary or "(empty)"}
+
+NEW MESSAGES:
+{transcript}
+
+UPDATED SUMMARY:"""
+        
+        async def _summarize(client):
+            return await client.chat.completions.create(
+                model=settings.CONVERSATION_SUMMARY_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.2,
+                max_tokens=200
+            )
+        
+        response = await self._make_request(_summarize)
+        return response.choices[0].message.content.strip()
+    
+    async def analyze_and_respond(self, text: str, level: str, user_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Fused режим: коррекция и ответ собеседника одним JSON-вызовом
+        
+        Returns:
+            dict: поля correct_text плюс chat_response. При ошибке или
+            неполном JSON - результат обычных двух вызовов.
+        """
+        # Подходит коррекция fused модели или основной модели split режима
+        precomputed = None
+        for model in dict.fromkeys((settings.FUSED_MODEL, settings.CORRECTION_MODEL)):
+            precomputed = self.result_cache.get(self._correction_key(text, level, model))
+            if precomputed is not None:
+                break
+        if precomputed is None and settings.PRECHECK_ENABLED:
+            _, precomputed = correction_precheck.check(text)
+        if precomputed is not None:
+            # Коррекция уже известна - достаточно ответа собеседника
+            return {**precomputed, "chat_response": await self.generate_response(text, level, user_id)}
+        
+        history = await self._history(user_id)
+        messages = [
+            {"role": "system", "content": prompt_registry.render("fused", level)},
+            *history,
+            {"role": "user", "content": f"USER TEXT: {text}\n\nAnalyze, correct and reply."}
+        ]
+        
+        async def _fused(client):
+            return await client.chat.completions.create(
+                model=settings.FUSED_MODEL,
+                messages=messages,
+                temperature=0.3,
+                response_format={"type": "json_object"}
+            )
+        
+        try:
+            started = time.monotonic()
+            response = await self._make_hedged_request("fused", _fused)
+            prompt_registry.record("fused", response.usage, latency=time.monotonic() - started)
+            self._record_prompt("fused", messages, history, response.usage)
+            result = json.loads(response.choices[0].message.content)
+            if not isinstance(result, dict) or not str(result.get("chat_response") or "").strip():
+                raise ValueError("no chat_response in fused JSON")
+            result["chat_response"] = result["chat_response"].strip()
+            self.result_cache.set(
+                self._correction_key(text, level, settings.FUSED_MODEL),
+                {k: v for k, v in result.items() if k != "chat_response"}
+            )
+            await self._remember_exchange(user_id, text, result["chat_response"])
+            return result
+        except Exception as e:
+            logger.error(f"❌ Ошибка fused вызова, переходим на два запроса: {e}")
+            correction_result, chat_response = await asyncio.gather(
+                self.correct_text(text, level),
+                self.generate_response(text, level, user_id)
+            )
+            return {**correction_result, "chat_response": chat_response}
+    
+    async def stream_response(
+        self,
+        text: str,
+        level: str,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> AsyncIterator[str]:
+        """Ответ собеседника потоком токенов (ретраи только до начала потока)"""
+        messages = self._chat_messages(text, level, history)
+        
+        async def _open_stream(client):
+            return await client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
+                temperature=0.8,
+                max_tokens=400,
+                stream=True,
+                # Без этого OpenAI-совместимый API не присылает usage в потоке
+                stream_options={"include_usage": True}
+            )
+        
+        started = time.monotonic()
+        stream = await self._make_request(_open_stream, usage_model=CHAT_MODEL)
+        usage = None
+        first_token = None
+        async for chunk in stream:
+            # usage приходит в последнем чанке
+            usage = _stream_chunk_usage(chunk) or usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first_token is None:
+                    first_token = time.monotonic() - started
+                yield chunk.choices[0].delta.content
+        prompt_registry.record("chat", usage, latency=time.monotonic() - started, first_token=first_token)
+        usage_tracker.record_stream_usage(CHAT_MODEL, usage)
+        self._record_prompt("stream_response", messages, history or [], usage)
+    
+    async def generate_response_with_voice(
+        self,
+        text: str,
+        level: str,
+        user_id: Optional[int] = None
+    ) -> Tuple[str, Optional[bytes]]:
+        """
+        Потоковый ответ с пофразовым синтезом речи
+        
+        Токены ответа режутся на предложения, каждое предложение озвучивается
+        сразу (не больше TTS_STREAM_CONCURRENCY синтезов одновременно),
+        результаты склеиваются в одно голосовое сообщение.
+        
+        Returns:
+            (chat_response, audio) - audio в OGG Opus, как у text_to_speech
+        """
+        started = time.monotonic()
+        semaphore = asyncio.Semaphore(settings.TTS_STREAM_CONCURRENCY)
+        tasks: List[asyncio.Task] = []
+        
+        async def _synthesize(sentence: str) -> Optional[bytes]:
+            async with semaphore:
+                return await self._synthesize_wav(sentence)
+        
+        history = await self._history(user_id)
+        parts: List[str] = []
+        buffer = ""
+        # Текст ответа известен, только когда поток дочитан до конца
+        chat_response: Optional[str] = None
+        try:
+            async for delta in self.stream_response(text, level, history):
+                parts.append(delta)
+                sentences, buffer = split_sentences(buffer + delta, settings.TTS_STREAM_MIN_SENTENCE_CHARS)
+                for sentence in sentences:
+                    if not tasks:
+                        logger.info(f"First sentence ready after {time.monotonic() - started:.2f}s")
+                    tasks.append(asyncio.create_task(_synthesize(sentence)))
+            if buffer.strip():
+                tasks.append(asyncio.create_task(_synthesize(buffer.strip())))
+            
+            streamed = "".join(parts).strip()
+            if not streamed:
+                raise ValueError("empty streamed response")
+            chat_response = streamed
+            wav_parts = await asyncio.gather(*tasks)
+        except Exception as e:
+            for task in tasks:
+                task.cancel()
+            if chat_response is None:
+                # Поток оборвался: обрывок ответа не сохраняем в память и не озвучиваем
+                logger.warning(f"⚠️ Streamed response failed, regenerating without streaming: {e}")
+                chat_response = await self.generate_response(text, level, user_id)
+            else:
+                logger.warning(f"⚠️ Streaming TTS failed, falling back to full synthesis: {e}")
+                await self._remember_exchange(user_id, text, chat_response)
+            return chat_response, await self.text_to_speech(chat_response)
+        
+        await self._remember_exchange(user_id, text, chat_response)
+        if not all(wav_parts):
+            logger.warning("⚠️ Some sentences failed to synthesize, falling back to full synthesis")
+            return chat_response, await self.text_to_speech(chat_response)
+        
+        audio = await opus_encoder.encode(concat_wav(wav_parts))
+        logger.info(f"✅ Streamed voice: {len(wav_parts)} sentences in {time.monotonic() - started:.2f}s")
+        return chat_response, audio
+    
+    async def _synthesize_wav(self, text: str) -> Optional[bytes]:
+        """Синтез фрагмента в WAV у текущего провайдера"""
+        if settings.TTS_PROVIDER == "piper" and piper_client:
+            return await piper_client.synthesize_wav(text)
+        return await self._text_to_speech_groq(text)
+    
+    def tts_cache_key(self, text: str, voice: Optional[str] = None) -> str:
+        """Ключ TTS-кэша для текста у текущего провайдера"""
+        if settings.TTS_PROVIDER == "piper" and piper_client:
+            return tts_cache.make_key(text, "amy", "piper")
+        return tts_cache.make_key(text, voice or settings.TTS_VOICE, "groq")
     
     async def text_to_speech(self, text: str, voice: Optional[str] = None) -> Optional[bytes]:
         """
-        Генерация голоса через Groq TTS или Piper TTS
+        Генерация голоса через Groq TTS или Piper TTS (с кэшем коротких фраз)
         
         Args:
             text: Текст для озвучивания
             voice: Голос (autumn, diana, hannah, austin, daniel, troy для Groq). По умолчанию из settings.
             
         Returns:
-            bytes: Аудио в формате WAV или None в случае ошибки
+            bytes: Аудио в формате OGG Opus (Telegram voice) или None в случае ошибки
         """
+        key = self.tts_cache_key(text, voice)
+        cacheable = tts_cache.cacheable(text)
+        if cacheable:
+            cached = await tts_cache.get(key)
+            if cached:
+                logger.info(f"✅ TTS cache hit ({len(cached)} bytes)")
+                return cached
+        
+        # Одинаковый текст, который уже синтезируется для другого пользователя, не синтезируем повторно
+        return await self.singleflight.do(("tts", key), lambda: self._synthesize_and_cache(text, voice, key if cacheable else None))
+    
+    async def _synthesize_and_cache(self, text: str, voice: Optional[str], cache_key: Optional[str]) -> Optional[bytes]:
+        audio = await self._synthesize_voice(text, voice)
+        if audio and cache_key:
+            await tts_cache.put(cache_key, audio)
+        return audio
+    
+    async def _synthesize_voice(self, text: str, voice: Optional[str] = None) -> Optional[bytes]:
+        """Синтез у текущего провайдера, результат - OGG Opus"""
         # Выбираем провайдера TTS
         if settings.TTS_PROVIDER == "piper" and piper_client:
             return await self._text_to_speech_piper(text)
-        else:
-            return await self._text_to_speech_groq(text, voice)
+        
+        # Groq отдаёт только WAV - прогоняем через общий выход голоса
+        wav_bytes = await self._text_to_speech_groq(text, voice)
+        if not wav_bytes:
+            return None
+        return await opus_encoder.encode(wav_bytes)
     
     async def _text_to_speech_piper(self, text: str) -> Optional[bytes]:
         """TTS через Piper (бесплатный)"""
@@ -282,7 +886,7 @@ User Level: {level}
             return None
     
     async def _text_to_speech_groq(self, text: str, voice: Optional[str] = None) -> Optional[bytes]:
-        """TTS через Groq (платный)"""
+        """TTS через Groq (платный), результат - WAV"""
         if voice is None:
             voice = settings.TTS_VOICE
             
@@ -302,20 +906,25 @@ User Level: {level}
                 return bytes(response)
         
         try:
-            result = await self._make_request(_tts)
+            result = await self._make_request(_tts, usage_model="canopylabs/orpheus-v1-english")
             return result
         except Exception as e:
             logger.error(f"❌ Ошибка Groq TTS: {e}")
             return None
     
     async def process_user_message(self, telegram_id: int, user_text: str, user_level: str) -> Tuple[str, Dict[str, Any]]:
-        """Основной метод: параллельные вызовы"""
+        """Основной метод: параллельные вызовы (или один вызов в fused режиме)"""
         try:
-            # Параллельные вызовы
-            correction_task = self.correct_text(user_text, user_level)
-            response_task = self.generate_response(user_text, user_level)
-            
-            correction_result, chat_response = await asyncio.gather(correction_task, response_task)
+            if settings.LLM_MODE == "fused":
+                # Один вызов возвращает и коррекцию, и ответ
+                correction_result = await self.analyze_and_respond(user_text, user_level, telegram_id)
+                chat_response = correction_result.pop("chat_response")
+            else:
+                # Параллельные вызовы
+                correction_task = self.correct_text(user_text, user_level)
+                response_task = self.generate_response(user_text, user_level, telegram_id)
+                
+                correction_result, chat_response = await asyncio.gather(correction_task, response_task)
             
             # Формируем финальный ПОЛНЫЙ ответ (для текстового режима)
             final_response = f"""💬 **Chat Response:**
@@ -342,4 +951,4 @@ User Level: {level}
 
 
 # ✅ СОЗДАЕМ ГЛОБАЛЬНЫЙ ЭКЗЕМПЛЯР
-groq_client = GroqClient(settings.groq_api_keys_list)
+groq_client = GroqClient(settings.groq_api_keys_list, base_url=settings.GROQ_BASE_URL)
@@ -0,0 +1,231 @@
+import re
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Разбирает длительность из заголовков Groq в секунды.
+
+    Поддерживает '30', '7.66s', '2m59.56s', '1h2m', '120ms'.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+
+    multipliers = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(float(number) * multipliers[unit] for number, unit in parts)
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    return getattr(error, "status_code", None)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Имеет ли смысл повторять запрос на другом ключе.
+
+    Ошибки запроса (400, 404, 422) не зависят от ключа, повтор не поможет.
+    """
+    status = _status_code(error)
+    if status is None or status >= 500:
+        return True
+    return status in (401, 403, 408, 409, 429)
+
+
+class KeyState:
+    """Состояние одного API-ключа"""
+
+    def __init__(self, index: int, client: Any):
+        self.index = index
+        self.client = client
+
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None
+        self.available_at = 0.0  # monotonic-время, до которого ключ не выдаётся
+        self.consecutive_failures = 0
+        self.circuit_open = False
+
+        # Последние значения из x-ratelimit-* заголовков
+        self.remaining_requests: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+
+        self.requests = 0
+        self.failures = 0
+        self.rate_limited = 0
+
+    def is_available(self, now: float) -> bool:
+        if self.available_at > now:
+            return False
+        # Half-open: после паузы пропускаем только один пробный запрос
+        return not (self.circuit_open and self.in_flight > 0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "in_flight": self.in_flight,
+            "latency_ewma_ms": round(self.latency_ewma * 1000) if self.latency_ewma is not None else None,
+            "circuit_open": self.circuit_open,
+            "cooldown_s": round(max(0.0, self.available_at - time.monotonic()), 2),
+            "remaining_requests": self.remaining_requests,
+            "remaining_tokens": self.remaining_tokens,
+            "requests": self.requests,
+            "failures": self.failures,
+            "rate_limited": self.rate_limited
+        }
+
+
+class KeyScheduler:
+    """
+    Выбор API-ключа с учётом нагрузки и здоровья.
+
+    Выдаёт наименее загруженный здоровый ключ (in-flight, затем EWMA латентности),
+    уважает retry-after / x-ratelimit-* и открывает circuit breaker на ключе
+    после серии ошибок. Отозванный ключ (401/403) выводится из ротации надолго.
+    """
+
+    def __init__(
+        self,
+        clients: List[Any],
+        failure_threshold: int = 3,
+        open_seconds: float = 30.0,
+        revoked_seconds: float = 600.0,
+        max_wait: float = 5.0,
+        ewma_alpha: float = 0.3
+    ):
+        self.states = [KeyState(i, client) for i, client in enumerate(clients)]
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.revoked_seconds = revoked_seconds
+        self.max_wait = max_wait
+        self.ewma_alpha = ewma_alpha
+
+    def _pick(self, now: float) -> KeyState:
+        candidates = [s for s in self.states if s.is_available(now)]
+        if candidates:
+            return min(
+                candidates,
+                key=lambda s: (s.in_flight, s.latency_ewma if s.latency_ewma is not None else 0.0)
+            )
+        # Все ключи на паузе - берём тот, что освободится раньше
+        return min(self.states, key=lambda s: s.available_at)
+
+    async def acquire(self) -> KeyState:
+        """Выдаёт ключ, при необходимости дожидаясь окончания паузы (не дольше max_wait)"""
+        if not self.states:
+            raise RuntimeError("Нет доступных Groq ключей")
+
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            now = time.monotonic()
+            state = self._pick(now)
+            if state.is_available(now):
+                state.in_flight += 1
+                state.requests += 1
+                return state
+
+            wait = max(state.available_at - now, 0.05)
+            if now + wait > deadline:
+                raise RuntimeError("Все Groq ключи временно недоступны (rate limit / circuit open)")
+            await asyncio.sleep(wait)
+
+    def release(
+        self,
+        state: KeyState,
+        latency: Optional[float] = None,
+        error: Optional[BaseException] = None
+    ) -> None:
+        """Возвращает ключ и учитывает результат запроса"""
+        state.in_flight = max(0, state.in_flight - 1)
+
+        if latency is not None:
+            if state.latency_ewma is None:
+                state.latency_ewma = latency
+            else:
+                state.latency_ewma += self.ewma_alpha * (latency - state.latency_ewma)
+
+        if error is None:
+            if latency is not None:
+                state.consecutive_failures = 0
+                if state.circuit_open:
+                    logger.info(f"✅ Groq key #{state.index} circuit closed")
+                state.circuit_open = False
+            return
+
+        now = time.monotonic()
+        status = _status_code(error)
+
+        if status == 429:
+            state.rate_limited += 1
+            response = getattr(error, "response", None)
+            retry_after = self._retry_after(response.headers if response is not None else {})
+            state.available_at = max(state.available_at, now + (retry_after or 1.0))
+            logger.warning(f"⏳ Groq key #{state.index} rate limited for {retry_after or 1.0:.1f}s")
+            return
+
+        if status is not None and status < 500 and not is_retryable(error):
+            # Ошибка в самом запросе, ключ ни при чём
+            return
+
+        state.failures += 1
+
+        if status in (401, 403):
+            state.circuit_open = True
+            state.available_at = now + self.revoked_seconds
+            logger.error(f"🔒 Groq key #{state.index} rejected (HTTP {status}), disabled for {self.revoked_seconds:.0f}s")
+            return
+
+        state.consecutive_failures += 1
+        if state.circuit_open or state.consecutive_failures >= self.failure_threshold:
+            state.circuit_open = True
+            state.available_at = now + self.open_seconds
+            logger.warning(f"🔌 Groq key #{state.index} circuit opened for {self.open_seconds:.0f}s")
+        else:
+            # Короткая экспоненциальная пауза, остальные ключи подхватят трафик
+            state.available_at = now + min(0.25 * 2 ** (state.consecutive_failures - 1), self.open_seconds)
+
+    @staticmethod
+    def _retry_after(headers: Mapping[str, str]) -> Optional[float]:
+        return (
+            parse_duration(headers.get("retry-after"))
+            or parse_duration(headers.get("x-ratelimit-reset-requests"))
+            or parse_duration(headers.get("x-ratelimit-reset-tokens"))
+        )
+
+    def observe_headers(self, index: int, headers: Mapping[str, str]) -> None:
+        """Учитывает x-ratelimit-* заголовки любого ответа ключа"""
+        state = self.states[index]
+
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        if remaining_requests is not None and remaining_requests.isdigit():
+            state.remaining_requests = int(remaining_requests)
+        if remaining_tokens is not None and remaining_tokens.isdigit():
+            state.remaining_tokens = int(remaining_tokens)
+
+        reset = None
+        if state.remaining_requests == 0:
+            reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+        elif state.remaining_tokens == 0:
+            reset = parse_duration(headers.get("x-ratelimit-reset-tokens"))
+        else:
+            return
+        state.available_at = max(state.available_at, time.monotonic() + (reset or 1.0))
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Состояние ключей для /status"""
+        return [state.stats() for state in self.states]
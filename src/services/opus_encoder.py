@@ -0,0 +1,228 @@
+import time
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Set
+
+from src.config import settings
+from src.utils import audio
+
+logger = logging.getLogger(__name__)
+
+
+def _mp_context() -> multiprocessing.context.BaseContext:
+    """
+    Контекст процессов-кодировщиков: forkserver, заранее импортировавший
+    только src.utils.audio (с PyAV), поэтому новый воркер - это fork без
+    импортов. Приложение при этом должно запускаться как python -m src:
+    модуль __main__ пакета в воркерах не выполняется, а src.main
+    выполнялся бы заново в каждом (бот, клиенты Supabase и Groq).
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["src.utils.audio"])
+    return context
+
+
+def _terminate(executor: ProcessPoolExecutor) -> None:
+    """Останавливает executor и убивает его процесс (shutdown зависший не трогает)"""
+    processes = list((executor._processes or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+
+class OpusEncoderPool:
+    """
+    Пул долгоживущих процессов-кодировщиков WAV -> OGG Opus.
+
+    Воркеры один раз импортируют PyAV/libopus и переиспользуются, поэтому
+    кодирование ответа не платит за запуск ffmpeg. Каждый воркер - отдельный
+    однопроцессный executor, задача отдаётся только свободному воркеру:
+    таймаут считается от начала выполнения, а не от постановки в очередь.
+    Зависший воркер убивается и заменяется, не задевая задачи других
+    пользователей. Очередь ограничена: при queue_size задачах в работе и
+    ожидании новая отклоняется сразу, а ожидание свободного воркера не
+    дольше queue_timeout. Воркеры перезапускаются после max_tasks_per_worker
+    задач. Без PyAV используется запуск ffmpeg на каждый ответ.
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        queue_size: int = 32,
+        job_timeout: float = 10.0,
+        queue_timeout: float = 10.0,
+        max_tasks_per_worker: int = 500
+    ):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.job_timeout = job_timeout
+        self.queue_timeout = queue_timeout
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self._queued = 0  # задач в работе и в ожидании воркера
+        self._idle: Optional[asyncio.Queue] = None  # свободные воркеры
+        self._executors: Set[ProcessPoolExecutor] = set()
+
+        # Метрики
+        self.jobs = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.recycles = 0
+        self.total_seconds = 0.0
+
+    @property
+    def available(self) -> bool:
+        """Кодирование внутри пула возможно только с PyAV"""
+        return audio.av is not None
+
+    def _add_worker(self) -> None:
+        executor = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=_mp_context(),
+            max_tasks_per_child=self.max_tasks_per_worker
+        )
+        # Процесс поднимается сразу, а не на первой задаче
+        executor.submit(audio.warmup)
+        self._executors.add(executor)
+        self._idle.put_nowait(executor)
+
+    def start(self) -> None:
+        """Поднимает воркеры заранее, чтобы первый ответ не ждал их запуска"""
+        if not self.available:
+            logger.warning("⚠️ PyAV not installed, Opus encoding falls back to ffmpeg per reply")
+            return
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for _ in range(self.workers):
+                self._add_worker()
+            logger.info(f"✅ Opus encoder pool started ({self.workers} workers)")
+
+    def _replace(self, executor: ProcessPoolExecutor, reason: str) -> None:
+        """Убивает зависший или упавший воркер и ставит вместо него новый"""
+        logger.warning(f"♻️ Replacing Opus encoder worker: {reason}")
+        self._executors.discard(executor)
+        _terminate(executor)
+        self._add_worker()
+        self.recycles += 1
+
+    def _release(self, executor: ProcessPoolExecutor) -> None:
+        # Заменённый воркер в пул не возвращается
+        if executor in self._executors:
+            self._idle.put_nowait(executor)
+
+    async def _acquire(self) -> ProcessPoolExecutor:
+        """Свободный воркер, ожидание не дольше queue_timeout"""
+        getter = asyncio.ensure_future(self._idle.get())
+        try:
+            done, _ = await asyncio.wait({getter}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            getter.cancel()
+            # Воркер мог достаться в момент отмены - возвращаем его в пул
+            if getter.done() and not getter.cancelled():
+                self._release(getter.result())
+            raise
+        if not done:
+            getter.cancel()
+            self.rejected += 1
+            raise RuntimeError(f"No free Opus encoder worker after {self.queue_timeout:.0f}s")
+        return getter.result()
+
+    async def run(self, func: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+        """
+        Выполняет синхронную функцию из src.utils.audio в пуле с таймаутом
+
+        timeout заменяет job_timeout для задач, время которых зависит от
+        длины записи (нарезка длинных голосовых).
+        """
+        timeout = timeout or self.job_timeout
+        if self._queued >= self.queue_size:
+            # Очередь полна: ответ уйдёт без голоса сразу, а не через минуты ожидания
+            self.rejected += 1
+            raise RuntimeError(f"Opus encoder queue is full ({self.queue_size} jobs)")
+        self._queued += 1
+        try:
+            if self._idle is None:
+                self.start()
+            executor = await self._acquire()
+            loop = asyncio.get_running_loop()
+            job: Future = executor.submit(func, *args)
+            # Воркер освобождается, когда задача действительно закончилась
+            job.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release, executor))
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(job), timeout=timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                self._replace(executor, f"job timed out after {timeout:.0f}s")
+                raise
+            except BrokenProcessPool:
+                self._replace(executor, "worker process died")
+                raise
+            except asyncio.CancelledError:
+                if job.cancelled() and not asyncio.current_task().cancelling():
+                    # Задачу отменил сам пул (остановка), а не вызывающий - это обычная ошибка
+                    raise CancelledError("Opus encoder job was cancelled") from None
+                raise
+        finally:
+            self._queued -= 1
+
+    async def encode(self, wav_bytes: bytes) -> Optional[bytes]:
+        """
+        WAV -> OGG Opus (32 kbps, 24 кГц, моно)
+
+        Returns:
+            bytes: OGG Opus или None в случае ошибки
+        """
+        self.jobs += 1
+        started = time.monotonic()
+        try:
+            if self.available:
+                result = await self.run(audio.encode_ogg_opus, wav_bytes)
+            else:
+                result = await audio.ffmpeg_encode_ogg_opus(wav_bytes)
+        except Exception as e:
+            logger.error(f"❌ Opus encoding failed: {e!r}")
+            result = None
+        finally:
+            self.total_seconds += time.monotonic() - started
+
+        if result is None:
+            self.failures += 1
+        else:
+            logger.info(f"✅ Encoded WAV ({len(wav_bytes)} bytes) to OGG ({len(result)} bytes)")
+        return result
+
+    def shutdown(self) -> None:
+        if self._idle is not None:
+            for executor in self._executors:
+                _terminate(executor)
+            self._executors.clear()
+            self._idle = None
+            logger.info("Opus encoder pool stopped")
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики для /status"""
+        return {
+            "backend": "pyav" if self.available else "ffmpeg",
+            "jobs": self.jobs,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "recycles": self.recycles,
+            "avg_ms": round(self.total_seconds / self.jobs * 1000, 1) if self.jobs else None
+        }
+
+
+# Глобальный экземпляр
+opus_encoder = OpusEncoderPool(
+    workers=settings.OPUS_ENCODER_WORKERS,
+    queue_size=settings.OPUS_ENCODER_QUEUE_SIZE,
+    job_timeout=settings.OPUS_ENCODER_TIMEOUT,
+    queue_timeout=settings.OPUS_ENCODER_QUEUE_TIMEOUT,
+    max_tasks_per_worker=settings.OPUS_ENCODER_MAX_TASKS
+)
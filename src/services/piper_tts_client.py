@@ -1,10 +1,11 @@
+import shutil
 import logging
-import io
-import wave
-import subprocess
 import asyncio
 import aiohttp
-from typing import Optional
+from typing import AsyncIterator, Optional
+
+from src.services.opus_encoder import opus_encoder
+from src.utils.audio import ffmpeg_stream_ogg_opus
 
 logger = logging.getLogger(__name__)
 
@@ -12,16 +13,22 @@ logger = logging.getLogger(__name__)
 class PiperTTSClient:
     """Клиент для взаимодействия с оптимизированным Piper TTS сервисом"""
     
-    def __init__(self, base_url: str, timeout: int = 30):
+    def __init__(self, base_url: str, timeout: int = 30, stream_encode: bool = False):
         """
         Args:
             base_url: URL Piper TTS сервиса (например, http://localhost:8000)
             timeout: Таймаут запроса в секундах
+            stream_encode: Кодировать в Opus параллельно со скачиванием (нужен ffmpeg;
+                громкость нормализует loudnorm, а не общий encode_ogg_opus)
         """
         self.base_url = base_url.rstrip('/')
         self.timeout = timeout
+        self.stream_encode = stream_encode and shutil.which("ffmpeg") is not None
         self.session: Optional[aiohttp.ClientSession] = None
         logger.info(f"✅ PiperTTSClient initialized with URL: {self.base_url}")
+        if stream_encode and not self.stream_encode:
+            # Образ из Dockerfile ffmpeg не ставит: WAV скачивается целиком
+            logger.warning("⚠️ ffmpeg not found, Piper audio is encoded after the full download")
     
     async def _get_session(self) -> aiohttp.ClientSession:
         """Получение или создание сессии"""
@@ -31,9 +38,9 @@ class PiperTTSClient:
             )
         return self.session
     
-    async def _convert_wav_to_ogg(self, wav_bytes: bytes) -> Optional[bytes]:
+    async def convert_wav_to_ogg(self, wav_bytes: bytes) -> Optional[bytes]:
         """
-        Конвертирует WAV в OGG Opus с помощью ffmpeg
+        Конвертирует WAV в OGG Opus через пул кодировщиков
         
         Args:
             wav_bytes: Байты WAV файла
@@ -41,93 +48,87 @@ class PiperTTSClient:
         Returns:
             bytes: OGG Opus файл или None в случае ошибки
         """
-        try:
-            # Запускаем ffmpeg для конвертации
-            process = await asyncio.create_subprocess_exec(
-                'ffmpeg',
-                '-i', 'pipe:0',           # Вход из stdin
-                '-c:a', 'libopus',          # Кодек Opus
-                '-b:a', '32k',              # Битрейт 32 kbps (стандарт для Telegram)
-                '-ar', '24000',              # Частота 24 кГц
-                '-application', 'voip',      # Оптимизация для речи
-                '-frame_duration', '60',     # Длительность фрейма
-                '-packet_loss', '1',          # Устойчивость к потерям
-                '-f', 'ogg',                  # Выходной формат OGG
-                'pipe:1',                     # Выход в stdout
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
+        return await opus_encoder.encode(wav_bytes)
+    
+    async def _iter_wav_chunks(self, text: str) -> AsyncIterator[bytes]:
+        """Чанки WAV из streaming endpoint по мере поступления"""
+        session = await self._get_session()
+        async with session.post(
+            f"{self.base_url}/tts/stream",
+            json={"text": text, "voice": "amy"}
+        ) as response:
+            if response.status != 200:
+                raise aiohttp.ClientError(f"HTTP {response.status}")
+            async for chunk in response.content.iter_chunked(8192):
+                if chunk:
+                    yield chunk
+    
+    async def synthesize_wav(self, text: str) -> Optional[bytes]:
+        """
+        Генерация речи через Piper TTS сервис без конвертации
+        
+        Args:
+            text: Текст для озвучивания
             
-            # Отправляем WAV в stdin и получаем результат
-            stdout, stderr = await process.communicate(input=wav_bytes)
+        Returns:
+            bytes: Аудио в формате WAV или None в случае ошибки
+        """
+        if not text or not text.strip():
+            logger.warning("Empty text provided to TTS")
+            return None
+        
+        try:
+            wav_data = b''.join([chunk async for chunk in self._iter_wav_chunks(text)])
             
-            if process.returncode != 0:
-                logger.error(f"FFmpeg conversion error: {stderr.decode()}")
+            if not wav_data:
+                logger.error("No audio data received from Piper")
                 return None
             
-            logger.info(f"✅ Converted WAV ({len(wav_bytes)} bytes) to OGG ({len(stdout)} bytes)")
-            return stdout
-            
-        except FileNotFoundError:
-            logger.error("❌ FFmpeg not found. Please install ffmpeg on the system")
-            # Fallback: возвращаем как есть (Telegram не примет, но хотя бы не упадем)
-            return wav_bytes
+            logger.info(f"✅ Received WAV from Piper: {len(wav_data)} bytes")
+            return wav_data
+                
+        except asyncio.TimeoutError:
+            logger.error("Piper TTS request timed out")
+            return None
+        except aiohttp.ClientError as e:
+            logger.error(f"Piper TTS connection error: {e}")
+            return None
         except Exception as e:
-            logger.error(f"❌ Error converting to OGG: {e}")
+            logger.error(f"Unexpected Piper TTS error: {e}")
             return None
     
     async def text_to_speech(self, text: str) -> Optional[bytes]:
         """
         Генерация речи из текста через Piper TTS сервис и конвертация в OGG
         
+        По умолчанию WAV скачивается целиком и кодируется общим пулом PyAV.
+        С stream_encode и ffmpeg чанки WAV сразу уходят в кодировщик: скачивание
+        и кодирование идут параллельно, целый WAV в памяти не собирается.
+        
         Args:
             text: Текст для озвучивания
             
         Returns:
             bytes: Аудио в формате OGG Opus или None в случае ошибки
         """
+        if not self.stream_encode:
+            wav_data = await self.synthesize_wav(text)
+            if not wav_data:
+                return None
+            
+            # Конвертируем WAV в OGG
+            ogg_data = await self.convert_wav_to_ogg(wav_data)
+            if not ogg_data:
+                # Если конвертация не удалась, логируем и возвращаем None
+                logger.error("Failed to convert WAV to OGG")
+            return ogg_data
+        
         if not text or not text.strip():
             logger.warning("Empty text provided to TTS")
             return None
         
         try:
-            session = await self._get_session()
-            
-            # Используем streaming endpoint
-            async with session.post(
-                f"{self.base_url}/tts/stream",
-                json={"text": text, "voice": "amy"}
-            ) as response:
-                
-                if response.status != 200:
-                    logger.error(f"Piper TTS error: HTTP {response.status}")
-                    return None
-                
-                # Собираем все чанки WAV
-                wav_chunks = []
-                async for chunk in response.content.iter_chunked(8192):
-                    if chunk:
-                        wav_chunks.append(chunk)
-                
-                if not wav_chunks:
-                    logger.error("No audio data received from Piper")
-                    return None
-                
-                # Объединяем чанки в один WAV файл
-                wav_data = b''.join(wav_chunks)
-                logger.info(f"✅ Received WAV from Piper: {len(wav_data)} bytes")
-                
-                # Конвертируем WAV в OGG
-                ogg_data = await self._convert_wav_to_ogg(wav_data)
-                
-                if ogg_data:
-                    return ogg_data
-                else:
-                    # Если конвертация не удалась, логируем и возвращаем None
-                    logger.error("Failed to convert WAV to OGG")
-                    return None
-                
+            return await ffmpeg_stream_ogg_opus(self._iter_wav_chunks(text))
         except asyncio.TimeoutError:
             logger.error("Piper TTS request timed out")
             return None
@@ -0,0 +1,258 @@
+import logging
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+from src.utils.metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+LEVELS = ("beginner", "elementary", "intermediate", "advanced")
+
+# Переменная часть промпта - всегда в самом конце системного сообщения
+_LEVEL_CONTEXT = """
+
+# CURRENT CONTEXT
+User Level: {level}"""
+
+# Коррекция: роль и уровни + формат ответа (общие для split и fused режимов)
+_CORRECTION_GUIDE = """# ROLE
+You are an elite ESL Professor with 15+ years of experience. Your goal is to analyze the user's input with surgical precision, provide actionable corrections, and explain the underlying logic in a way that accelerates fluency.
+
+# LEVEL-ADAPTIVE PEDAGOGY
+## BEGINNER (A1-A2)
+- Focus: Basic Tenses (Present/Past/Future Simple), Articles (a/an/the), Subject-Verb Agreement, Word Order
+- Explanation style: 100% Russian, nurturing tone
+- Vocabulary items: Only high-frequency words (Top 1000)
+
+## ELEMENTARY (A2-B1)
+- Focus: Present Perfect, Prepositions, Common Phrasal Verbs, Comparatives
+- Explanation style: 60% Russian / 40% English
+- Vocabulary items: Everyday collocations
+
+## INTERMEDIATE (B1-B2)
+- Focus: Conditionals, Reported Speech, Collocations, Phrasal Verbs with multiple meanings
+- Explanation style: 30% Russian / 70% English
+- Vocabulary items: Academic/professional terms
+
+## ADVANCED (C1-C2)
+- Focus: Subjunctive Mood, Inversion, Nuance, Register, Stylistic choices
+- Explanation style: 100% English, sophisticated metalanguage
+- Vocabulary items: Rare synonyms, idiomatic expressions"""
+
+_CORRECTION_FORMAT = """{
+  "corrected_sentence": "[Full corrected sentence - if perfect, return original]",
+  "explanation": "[Level-appropriate explanation, max 2 sentences, focus on WHY]",
+  "vocabulary_items": [
+    {
+      "word_or_phrase": "...",
+      "translation": "...",
+      "context_sentence": "...",
+      "mastery_score": 0
+    }
+  ],
+  "error_category": "grammar|vocabulary|pronunciation|structure|style|none"
+}"""
+
+# Fused режим: те же поля коррекции плюс ответ собеседника в одном JSON
+_FUSED_FORMAT = """{
+  "corrected_sentence": "[Full corrected sentence - if perfect, return original]",
+  "explanation": "[Level-appropriate explanation, max 2 sentences, focus on WHY]",
+  "vocabulary_items": [
+    {
+      "word_or_phrase": "...",
+      "translation": "...",
+      "context_sentence": "...",
+      "mastery_score": 0
+    }
+  ],
+  "error_category": "grammar|vocabulary|pronunciation|structure|style|none",
+  "chat_response": "[Your conversational reply to the user, 2-3 sentences + ONE question]"
+}"""
+
+_FUSED_CONVERSATION = """# SECOND TASK: CONVERSATION
+After the analysis, reply to the user as "Speech Flow AI", a friendly English conversation partner.
+- Match the user's level: Beginner 1-2 short sentences, Elementary 2, Intermediate 2-3, Advanced 3
+- NEVER repeat the user's mistakes and never correct them in the reply - just respond naturally
+- ALWAYS end with ONE natural, curious question
+- No teacher mode: no "Good job!", no explicit corrections in chat_response"""
+
+_CHAT_PROMPT = """# ROLE
+You are "Speech Flow AI", a charismatic English conversation partner who makes learners WANT to keep talking. You balance being supportive with gently pushing boundaries (i+1 principle).
+
+# LEVEL-ADAPTIVE COMMUNICATION MATRIX
+
+## BEGINNER (A1-A2)
+- Vocabulary: Top 500 words only
+- Grammar: Present/Past/Future Simple, "can", "there is/are"
+- Sentence length: 5-8 words max
+- Questions: Binary choice or Yes/No
+  Example: "Do you like coffee or tea?"
+
+## ELEMENTARY (A2-B1)
+- Vocabulary: Top 1500 words + basic adjectives
+- Grammar: Present Perfect, "going to", basic modals
+- Sentence length: 8-12 words
+- Questions: Simple "Wh-" questions, "Have you ever...?"
+  Example: "What did you do last weekend?"
+
+## INTERMEDIATE (B1-B2)
+- Vocabulary: 3000+ words, idioms, phrasal verbs
+- Grammar: All tenses, conditionals, passive voice
+- Sentence length: 10-15 words
+- Questions: Open-ended, opinion-based
+  Example: "What's the most challenging part of learning English for you?"
+
+## ADVANCED (C1-C2)
+- Vocabulary: Academic/business, subtle nuances, literary expressions
+- Grammar: Subjunctive, inversion, cleft sentences
+- Sentence length: Natural (15-20 words)
+- Questions: Abstract, provocative, philosophical
+  Example: "How do you think AI will reshape the job market in the next decade?"
+
+# CONVERSATION ENGINEERING RULES
+
+1. **NEVER repeat the user's mistakes**
+   - If user says "I go yesterday", respond naturally: "Oh, you went somewhere yesterday? Where did you go?"
+
+2. **ALWAYS end with ONE question**
+   - Use varied question types (avoid repetition)
+   - Make questions feel like natural curiosity, not interrogation
+
+3. **Match energy + 1**
+   - Keep responses SHORT: 2-3 sentences max
+   - Reference their previous messages when possible
+
+4. **Avoid teacher mode**
+   - Just have a natural conversation
+   - Don't say "Good job!" or give explicit corrections
+
+# RESPONSE LENGTH
+- Beginner: 1-2 sentences + question
+- Elementary: 2 sentences + question
+- Intermediate: 2-3 sentences + question
+- Advanced: 3 sentences + question"""
+
+
+class PromptTemplate:
+    """
+    Системный промпт: неизменяемый префикс и уровень пользователя в конце.
+
+    Варианты для всех уровней собираются один раз при создании шаблона,
+    поэтому у всех вызовов шаблона общий побайтно одинаковый префикс
+    (провайдер может его кэшировать), а на вызов не тратится форматирование.
+    """
+
+    def __init__(self, name: str, version: int, prefix: str, suffix: str = _LEVEL_CONTEXT):
+        self.name = name
+        self.version = version
+        self.prefix = prefix
+        self.suffix = suffix
+        self._variants = {level: self._build(level) for level in LEVELS}
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}@v{self.version}"
+
+    def _build(self, level: str) -> str:
+        return self.prefix + self.suffix.format(level=level)
+
+    def render(self, level: str) -> str:
+        """Готовый системный промпт для уровня"""
+        variant = self._variants.get(level)
+        return variant if variant is not None else self._build(level)
+
+
+class PromptRegistry:
+    """Реестр версионированных промптов с метриками по шаблонам (для /status)"""
+
+    def __init__(self):
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._usage: Dict[str, Dict[str, int]] = defaultdict(lambda: {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0})
+        self._latency: Dict[str, LatencyStats] = defaultdict(LatencyStats)
+        self._first_token: Dict[str, LatencyStats] = defaultdict(LatencyStats)
+
+    def register(self, template: PromptTemplate) -> PromptTemplate:
+        self._templates[template.name] = template
+        return template
+
+    def get(self, name: str) -> PromptTemplate:
+        return self._templates[name]
+
+    def render(self, name: str, level: str) -> str:
+        return self._templates[name].render(level)
+
+    def record(
+        self,
+        name: str,
+        usage: Any = None,
+        latency: Optional[float] = None,
+        first_token: Optional[float] = None
+    ) -> None:
+        """
+        Учитывает вызов шаблона
+
+        Args:
+            usage: usage из ответа API (prompt_tokens и, если есть, cached_tokens)
+            latency: время до полного ответа (сек)
+            first_token: время до первого токена потокового ответа (сек)
+        """
+        key = self._templates[name].key
+        counters = self._usage[key]
+        counters["calls"] += 1
+        if usage is not None:
+            counters["prompt_tokens"] += getattr(usage, "prompt_tokens", None) or 0
+            details = getattr(usage, "prompt_tokens_details", None)
+            counters["cached_tokens"] += getattr(details, "cached_tokens", None) or 0
+        if latency is not None:
+            self._latency[key].add(latency)
+        if first_token is not None:
+            self._first_token[key].add(first_token)
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики по шаблонам для /status"""
+        result = {}
+        for template in self._templates.values():
+            key = template.key
+            counters = self._usage[key]
+            result[key] = {
+                **counters,
+                "avg_prompt_tokens": round(counters["prompt_tokens"] / counters["calls"]) if counters["calls"] else None,
+                "latency": self._latency[key].stats(),
+                "first_token": self._first_token[key].stats()
+            }
+        return result
+
+
+# Глобальный экземпляр
+prompt_registry = PromptRegistry()
+
+# Коррекция: уровень перенесён из реплики пользователя в конец системного промпта
+prompt_registry.register(PromptTemplate(
+    "correction",
+    version=2,
+    prefix=f"""{_CORRECTION_GUIDE}
+
+# OUTPUT FORMAT (JSON ONLY)
+{_CORRECTION_FORMAT}"""
+))
+
+prompt_registry.register(PromptTemplate(
+    "chat",
+    version=1,
+    prefix=_CHAT_PROMPT,
+    suffix=_LEVEL_CONTEXT + """
+
+# YOUR RESPONSE (2-3 sentences + question):"""
+))
+
+# Fused: формат ответа перенесён перед уровнем, чтобы префикс не зависел от уровня
+prompt_registry.register(PromptTemplate(
+    "fused",
+    version=2,
+    prefix=f"""{_CORRECTION_GUIDE}
+
+{_FUSED_CONVERSATION}
+
+# OUTPUT FORMAT (JSON ONLY)
+{_FUSED_FORMAT}"""
+))
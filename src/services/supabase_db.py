@@ -1,9 +1,12 @@
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timezone
 from supabase import create_client, Client
 
 from src.config import settings
+from src.utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
@@ -11,17 +14,49 @@ logger = logging.getLogger(__name__)
 class SupabaseDB:
     def __init__(self):
         self.client: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+        # supabase-py синхронный: каждый .execute() блокирует event loop,
+        # поэтому сетевые запросы выполняются в ограниченном пуле потоков
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.DB_MAX_WORKERS,
+            thread_name_prefix="supabase"
+        )
+        # Кэш профилей: middleware заполняет его, хендлеры переиспользуют
+        self.user_cache = TTLCache(
+            maxsize=settings.USER_CACHE_SIZE,
+            ttl=settings.USER_CACHE_TTL
+        )
+    
+    async def _execute(self, query):
+        """Выполняет PostgREST-запрос в пуле потоков, не блокируя event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, query.execute)
+    
+    def close(self) -> None:
+        """Останавливает пул потоков (вызывается при shutdown)"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        logger.info("SupabaseDB executor closed")
+    
+    def _cache_user(self, telegram_id: int, response) -> None:
+        """Write-through: кладём свежую строку в кэш или сбрасываем запись"""
+        if response is not None and response.data:
+            self.user_cache.set(telegram_id, response.data[0])
+        else:
+            self.user_cache.invalidate(telegram_id)
     
     async def get_or_create_user(self, telegram_id: int, username: Optional[str] = None) -> Dict[str, Any]:
         """Получаем или создаем пользователя"""
+        cached = self.user_cache.get(telegram_id)
+        if cached is not None:
+            return cached
+        
         try:
-            response = (self.client
-                       .table("users")
-                       .select("*")
-                       .eq("telegram_id", telegram_id)
-                       .execute())
+            response = await self._execute(self.client
+                                           .table("users")
+                                           .select("*")
+                                           .eq("telegram_id", telegram_id))
             
             if response.data:
+                self.user_cache.set(telegram_id, response.data[0])
                 return response.data[0]
             
             user_data = {
@@ -34,7 +69,8 @@ class SupabaseDB:
                 "created_at": datetime.now(timezone.utc).isoformat()
             }
             
-            response = self.client.table("users").insert(user_data).execute()
+            response = await self._execute(self.client.table("users").insert(user_data))
+            self.user_cache.set(telegram_id, response.data[0])
             return response.data[0]
             
         except Exception as e:
@@ -44,62 +80,79 @@ class SupabaseDB:
     async def update_user_level(self, telegram_id: int, level: str) -> bool:
         """Обновляем уровень пользователя"""
         try:
-            response = (self.client
-                       .table("users")
-                       .update({"level": level})
-                       .eq("telegram_id", telegram_id)
-                       .execute())
+            response = await self._execute(self.client
+                                           .table("users")
+                                           .update({"level": level})
+                                           .eq("telegram_id", telegram_id))
+            self._cache_user(telegram_id, response)
             return len(response.data) > 0
         except Exception as e:
             logger.error(f"Error updating user level: {e}")
+            self.user_cache.invalidate(telegram_id)
             return False
     
-    async def increment_user_metrics(self, telegram_id: int, tokens_used: int = 0) -> None:
-        """Обновляем метрики пользователя"""
+    async def increment_user_metrics(self, telegram_id: int, tokens_used: int = 0, messages: int = 1) -> None:
+        """
+        Атомарно обновляем метрики пользователя (токены, сообщения, streak, last_active)
+        
+        Вся арифметика выполняется в Postgres-функции increment_user_metrics
+        (supabase/migrations), поэтому это один round trip без гонок.
+        """
         try:
-            user = await self.get_or_create_user(telegram_id)
-            
-            update_data = {
-                "total_tokens_used": user.get("total_tokens_used", 0) + tokens_used,
-                "free_messages_used": user.get("free_messages_used", 0) + 1
-            }
-            
-            # Простая логика streak: увеличиваем каждый день при использовании
-            last_active = user.get("last_active")
-            if last_active:
-                last_date = datetime.fromisoformat(last_active.replace('Z', '+00:00')).date()
-                today = datetime.now(timezone.utc).date()
-                
-                if today > last_date:
-                    if today.day - last_date.day == 1:
-                        update_data["streak_days"] = user.get("streak_days", 0) + 1
-                    else:
-                        update_data["streak_days"] = 1
-            
-            update_data["last_active"] = datetime.now(timezone.utc).isoformat()
-            
-            response = (self.client
-                       .table("users")
-                       .update(update_data)
-                       .eq("telegram_id", telegram_id)
-                       .execute())
+            response = await self._execute(self.client.rpc(
+                "increment_user_metrics",
+                {
+                    "p_telegram_id": telegram_id,
+                    "p_tokens": tokens_used,
+                    "p_messages": messages
+                }
+            ))
+            self._cache_user(telegram_id, response)
             
         except Exception as e:
             logger.error(f"Error incrementing user metrics: {e}")
+            self.user_cache.invalidate(telegram_id)
+    
+    @staticmethod
+    def vocabulary_row(telegram_id: int, word_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Строка для таблицы vocabulary"""
+        return {
+            "user_id": telegram_id,
+            "word_or_phrase": word_data.get("word_or_phrase"),
+            "translation": word_data.get("translation"),
+            "context_sentence": word_data.get("context_sentence"),
+            "mastery_score": word_data.get("mastery_score", 0),
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }
+    
+    @staticmethod
+    def error_row(telegram_id: int, error_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Строка для таблицы error_logs"""
+        return {
+            "user_id": telegram_id,
+            "category": error_data.get("category"),
+            "mistake_text": error_data.get("mistake_text"),
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }
+    
+    async def insert_many(self, table: str, rows: List[Dict[str, Any]]) -> int:
+        """
+        Bulk insert одним запросом
+        
+        В отличие от остальных методов не глушит ошибки:
+        вызывающий код (write-behind очередь) сам решает, повторять ли запись.
+        """
+        if not rows:
+            return 0
+        response = await self._execute(self.client.table(table).insert(rows))
+        return len(response.data)
     
     async def add_to_vocabulary(self, telegram_id: int, word_data: Dict[str, Any]) -> bool:
         """Добавляем слово/фразу в словарь пользователя"""
         try:
-            vocab_entry = {
-                "user_id": telegram_id,
-                "word_or_phrase": word_data.get("word_or_phrase"),
-                "translation": word_data.get("translation"),
-                "context_sentence": word_data.get("context_sentence"),
-                "mastery_score": word_data.get("mastery_score", 0),
-                "created_at": datetime.now(timezone.utc).isoformat()
-            }
-            
-            response = self.client.table("vocabulary").insert(vocab_entry).execute()
+            response = await self._execute(self.client
+                                           .table("vocabulary")
+                                           .insert(self.vocabulary_row(telegram_id, word_data)))
             return len(response.data) > 0
             
         except Exception as e:
@@ -109,14 +162,9 @@ class SupabaseDB:
     async def log_error(self, telegram_id: int, error_data: Dict[str, Any]) -> bool:
         """Логируем ошибку пользователя"""
         try:
-            error_entry = {
-                "user_id": telegram_id,
-                "category": error_data.get("category"),
-                "mistake_text": error_data.get("mistake_text"),
-                "created_at": datetime.now(timezone.utc).isoformat()
-            }
-            
-            response = self.client.table("error_logs").insert(error_entry).execute()
+            response = await self._execute(self.client
+                                           .table("error_logs")
+                                           .insert(self.error_row(telegram_id, error_data)))
             return len(response.data) > 0
             
         except Exception as e:
@@ -126,13 +174,12 @@ class SupabaseDB:
     async def get_user_vocabulary(self, telegram_id: int, limit: int = 50) -> List[Dict[str, Any]]:
         """Получаем словарь пользователя"""
         try:
-            response = (self.client
-                       .table("vocabulary")
-                       .select("*")
-                       .eq("user_id", telegram_id)
-                       .order("created_at", desc=True)
-                       .limit(limit)
-                       .execute())
+            response = await self._execute(self.client
+                                           .table("vocabulary")
+                                           .select("*")
+                                           .eq("user_id", telegram_id)
+                                           .order("created_at", desc=True)
+                                           .limit(limit))
             return response.data
         except Exception as e:
             logger.error(f"Error getting user vocabulary: {e}")
@@ -141,30 +188,30 @@ class SupabaseDB:
     async def get_user_stats(self, telegram_id: int) -> Dict[str, Any]:
         """Получаем статистику пользователя"""
         try:
-            user = await self.get_or_create_user(telegram_id)
-            
-            # Получаем количество ошибок по категориям
-            error_response = (self.client
-                            .table("error_logs")
-                            .select("category", count="exact")
-                            .eq("user_id", telegram_id)
-                            .execute())
+            # Запросы независимы - выполняем их параллельно
+            user, error_response, vocab_response = await asyncio.gather(
+                self.get_or_create_user(telegram_id),
+                # Счётчики по категориям поддерживаются триггером на error_logs
+                self._execute(self.client
+                              .table("user_error_stats")
+                              .select("category, error_count")
+                              .eq("user_id", telegram_id)),
+                # Нужен только count, сами строки словаря не тянем
+                self._execute(self.client
+                              .table("vocabulary")
+                              .select("id", count="exact")
+                              .eq("user_id", telegram_id)
+                              .limit(1))
+            )
             
             error_stats = {}
-            if error_response.data:
-                for item in error_response.data:
-                    error_stats[item["category"]] = item.get("count", 0)
-            
-            # Получаем количество слов в словаре
-            vocab_response = (self.client
-                            .table("vocabulary")
-                            .select("id", count="exact")
-                            .eq("user_id", telegram_id)
-                            .execute())
+            for item in error_response.data or []:
+                if item.get("category") and item["category"] != "none":
+                    error_stats[item["category"]] = item.get("error_count", 0)
             
             return {
                 "user": user,
-                "vocabulary_count": vocab_response.count if hasattr(vocab_response, 'count') else 0,
+                "vocabulary_count": vocab_response.count or 0,
                 "error_stats": error_stats
             }
             
@@ -172,6 +219,35 @@ class SupabaseDB:
             logger.error(f"Error getting user stats: {e}")
             return {"user": {}, "vocabulary_count": 0, "error_stats": {}}
     
+    async def get_conversation(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        """Сохранённая память диалога (summary и последние сообщения)"""
+        try:
+            response = await self._execute(self.client
+                                           .table("conversation_memory")
+                                           .select("summary, messages")
+                                           .eq("telegram_id", telegram_id)
+                                           .limit(1))
+            return response.data[0] if response.data else None
+        except Exception as e:
+            logger.error(f"Error getting conversation: {e}")
+            return None
+    
+    async def save_conversation(self, telegram_id: int, summary: str, messages: List[Dict[str, str]]) -> bool:
+        """Сохраняем память диалога (одна строка на пользователя)"""
+        try:
+            response = await self._execute(self.client
+                                           .table("conversation_memory")
+                                           .upsert({
+                                               "telegram_id": telegram_id,
+                                               "summary": summary,
+                                               "messages": messages,
+                                               "updated_at": datetime.now(timezone.utc).isoformat()
+                                           }, on_conflict="telegram_id"))
+            return len(response.data) > 0
+        except Exception as e:
+            logger.error(f"Error saving conversation: {e}")
+            return False
+    
     async def is_admin(self, telegram_id: int) -> bool:
         """Проверяем, является ли пользователь админом"""
         return telegram_id in settings.ADMIN_IDS
@@ -0,0 +1,193 @@
+import os
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from src.config import settings
+from src.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class TTSCache:
+    """
+    Content-addressed кэш синтезированной речи.
+
+    Ключ - sha256(провайдер, голос, нормализованный текст). Уровни:
+    1. LRU в памяти, ограниченный суммарным размером аудио;
+    2. опционально - каталог на диске с ограничением размера;
+    3. Telegram file_id уже отправленного голосового: такое аудио
+       отправляется по ссылке, без повторной загрузки.
+    """
+
+    def __init__(
+        self,
+        memory_max_bytes: int = 32 * 1024 * 1024,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = 512 * 1024 * 1024,
+        max_text_chars: int = 300,
+        file_id_size: int = 10000
+    ):
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self.max_text_chars = max_text_chars
+
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._file_ids = TTLCache(maxsize=file_id_size, ttl=0)
+        self._disk_bytes: Optional[int] = None
+        # Запись на диск идёт в потоках asyncio.to_thread: учёт размера и вытеснение - под локом
+        self._disk_lock = threading.Lock()
+
+        # Метрики
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.file_id_hits = 0
+        self.synthesis_bytes_saved = 0
+        self.upload_bytes_saved = 0
+
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(text: str, voice: str, provider: str) -> str:
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"{provider}\0{voice}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def cacheable(self, text: str) -> bool:
+        """Кэшируем только короткие фразы: длинные ответы почти не повторяются"""
+        return len(text) <= self.max_text_chars
+
+    # ------------------------------------------------------------------ audio
+
+    async def get(self, key: str) -> Optional[bytes]:
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            self.synthesis_bytes_saved += len(audio)
+            return audio
+
+        if self.disk_dir:
+            audio = await asyncio.to_thread(self._disk_read, key)
+            if audio is not None:
+                self.disk_hits += 1
+                self.synthesis_bytes_saved += len(audio)
+                self._memory_put(key, audio)
+                return audio
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, audio: bytes) -> None:
+        self._memory_put(key, audio)
+        if self.disk_dir:
+            try:
+                await asyncio.to_thread(self._disk_write, key, audio)
+            except OSError as e:
+                logger.warning(f"⚠️ TTS disk cache write failed: {e}")
+
+    def _memory_put(self, key: str, audio: bytes) -> None:
+        if len(audio) > self.memory_max_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.ogg"
+
+    def _disk_read(self, key: str) -> Optional[bytes]:
+        path = self._disk_path(key)
+        try:
+            audio = path.read_bytes()
+            os.utime(path)  # mtime служит меткой LRU для вытеснения
+            return audio
+        except FileNotFoundError:
+            return None
+
+    def _disk_write(self, key: str, audio: bytes) -> None:
+        path = self._disk_path(key)
+        with self._disk_lock:
+            # Проверка и запись под локом: одновременные put одного ключа не учитываются дважды
+            if path.exists():
+                return
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_bytes(audio)
+            tmp_path.replace(path)
+
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(p.stat().st_size for p in self.disk_dir.glob("*/*.ogg"))
+            else:
+                self._disk_bytes += len(audio)
+
+            if self._disk_bytes > self.disk_max_bytes:
+                self._disk_evict()
+
+    def _disk_evict(self) -> None:
+        """Удаляет самые давно использованные файлы до 90% лимита (вызывается под _disk_lock)"""
+        files = sorted(
+            ((p.stat().st_mtime, p.stat().st_size, p) for p in self.disk_dir.glob("*/*.ogg")),
+            key=lambda item: item[0]
+        )
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.disk_max_bytes * 0.9:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        self._disk_bytes = total
+
+    # ---------------------------------------------------------------- file_id
+
+    def get_file_id(self, key: str) -> Optional[str]:
+        """Telegram file_id ранее отправленного голосового с этим аудио"""
+        entry: Optional[Tuple[str, int]] = self._file_ids.get(key)
+        if entry is None:
+            return None
+        file_id, size = entry
+        self.file_id_hits += 1
+        self.upload_bytes_saved += size
+        return file_id
+
+    def remember_file_id(self, key: str, file_id: str, size: int) -> None:
+        self._file_ids.set(key, (file_id, size))
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики для /status"""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_bytes": self._disk_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            "file_id_entries": len(self._file_ids),
+            "file_id_hits": self.file_id_hits,
+            "synthesis_bytes_saved": self.synthesis_bytes_saved,
+            "upload_bytes_saved": self.upload_bytes_saved
+        }
+
+
+# Глобальный экземпляр
+tts_cache = TTSCache(
+    memory_max_bytes=settings.TTS_CACHE_MEMORY_BYTES,
+    disk_dir=settings.TTS_CACHE_DIR,
+    disk_max_bytes=settings.TTS_CACHE_DISK_BYTES,
+    max_text_chars=settings.TTS_CACHE_MAX_TEXT_CHARS,
+    file_id_size=settings.TTS_FILE_ID_CACHE_SIZE
+)
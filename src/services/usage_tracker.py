@@ -0,0 +1,199 @@
+import asyncio
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+from src.config import settings
+from src.services.supabase_db import SupabaseDB, db
+
+logger = logging.getLogger(__name__)
+
+
+def _new_counters() -> Dict[str, Any]:
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "audio_seconds": 0.0}
+
+
+class MessageUsage:
+    """Расход API на обработку одного сообщения пользователя"""
+
+    __slots__ = ("user_id", "counted", "calls", "prompt_tokens", "completion_tokens", "audio_seconds")
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.counted = False
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.audio_seconds = 0.0
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+# Сообщение, в рамках которого идут вызовы API (наследуется созданными задачами)
+_current_message: ContextVar[Optional[MessageUsage]] = ContextVar("usage_message", default=None)
+
+
+class UsageTracker:
+    """
+    Учёт токенов и секунд аудио по ответам API.
+
+    GroqClient сообщает usage каждого вызова: он суммируется по ключам и
+    моделям, а через contextvar - по сообщению и пользователю. Токены и
+    счётчик сообщений пользователей копятся в памяти и раз в flush_interval
+    пишутся в users.total_tokens_used / free_messages_used через
+    increment_user_metrics (один RPC на пользователя за период).
+    """
+
+    def __init__(self, storage: SupabaseDB, flush_interval: float = 10.0):
+        self.storage = storage
+        self.flush_interval = flush_interval
+
+        self._pending: Dict[int, Dict[str, int]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        # Метрики
+        self.by_key: Dict[int, Dict[str, Any]] = defaultdict(_new_counters)
+        self.by_model: Dict[str, Dict[str, Any]] = defaultdict(_new_counters)
+        self.messages = 0
+        self.message_tokens = 0
+        self.flushed_users = 0
+
+    def start(self) -> None:
+        """Запускает фоновый сброс (нужен работающий event loop)"""
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+            logger.info("✅ Usage tracker started")
+
+    @contextmanager
+    def message(self, user_id: int) -> Iterator[MessageUsage]:
+        """Относит все вызовы API внутри блока к сообщению пользователя"""
+        usage = MessageUsage(user_id)
+        token = _current_message.set(usage)
+        try:
+            yield usage
+        finally:
+            _current_message.reset(token)
+            if usage.counted:
+                self.messages += 1
+                self.message_tokens += usage.tokens
+                self._add_pending(user_id, messages=1)
+            if usage.calls:
+                logger.info(
+                    f"💰 Message usage for {user_id}: {usage.tokens} tokens "
+                    f"(prompt {usage.prompt_tokens}, completion {usage.completion_tokens}), "
+                    f"{usage.audio_seconds:.1f}s audio in {usage.calls} calls"
+                )
+
+    def count_message(self) -> None:
+        """Засчитывает текущее сообщение (отклонённые лимитом и команды не считаются)"""
+        usage = _current_message.get()
+        if usage is not None:
+            usage.counted = True
+
+    def record(
+        self,
+        key_index: int,
+        model: Optional[str],
+        usage: Any = None,
+        audio_seconds: float = 0.0
+    ) -> None:
+        """Учитывает один успешный вызов API"""
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+        completion_tokens = getattr(usage, "completion_tokens", None) or 0
+
+        for counters in (self.by_key[key_index], self.by_model[model or "unknown"]):
+            counters["calls"] += 1
+            counters["prompt_tokens"] += prompt_tokens
+            counters["completion_tokens"] += completion_tokens
+            counters["audio_seconds"] += audio_seconds
+
+        current = _current_message.get()
+        if current is not None:
+            current.calls += 1
+            current.prompt_tokens += prompt_tokens
+            current.completion_tokens += completion_tokens
+            current.audio_seconds += audio_seconds
+            if prompt_tokens or completion_tokens:
+                self._add_pending(current.user_id, tokens=prompt_tokens + completion_tokens)
+
+    def record_stream_usage(self, model: str, usage: Any) -> None:
+        """
+        Токены потокового ответа: usage приходит в конце потока, когда сам
+        вызов (и ключ) уже учтён в record
+        """
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+        completion_tokens = getattr(usage, "completion_tokens", None) or 0
+        if not (prompt_tokens or completion_tokens):
+            return
+
+        counters = self.by_model[model]
+        counters["prompt_tokens"] += prompt_tokens
+        counters["completion_tokens"] += completion_tokens
+
+        current = _current_message.get()
+        if current is not None:
+            current.prompt_tokens += prompt_tokens
+            current.completion_tokens += completion_tokens
+            self._add_pending(current.user_id, tokens=prompt_tokens + completion_tokens)
+
+    def _add_pending(self, user_id: int, tokens: int = 0, messages: int = 0) -> None:
+        pending = self._pending.setdefault(user_id, {"tokens": 0, "messages": 0})
+        pending["tokens"] += tokens
+        pending["messages"] += messages
+        self.start()
+
+    async def _run(self) -> None:
+        """Цикл сброса раз в flush_interval (или сразу при остановке)"""
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Пишет накопленные токены и сообщения пользователей"""
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        await asyncio.gather(*(
+            self.storage.increment_user_metrics(user_id, tokens_used=counters["tokens"], messages=counters["messages"])
+            for user_id, counters in pending.items()
+        ))
+        self.flushed_users += len(pending)
+
+    async def stop(self) -> None:
+        """Останавливает фоновую задачу и дописывает остаток"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._task:
+            await self._task
+            self._task = None
+        await self.flush()
+        logger.info(f"✅ Usage tracker drained ({self.flushed_users} user updates written)")
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики для /status"""
+        def _rounded(counters: Dict[str, Any]) -> Dict[str, Any]:
+            return {**counters, "audio_seconds": round(counters["audio_seconds"], 1)}
+
+        return {
+            "messages": self.messages,
+            "avg_tokens_per_message": round(self.message_tokens / self.messages) if self.messages else None,
+            "pending_users": len(self._pending),
+            "flushed_users": self.flushed_users,
+            "by_model": {model: _rounded(counters) for model, counters in self.by_model.items()},
+            "by_key": {f"#{index}": _rounded(counters) for index, counters in self.by_key.items()}
+        }
+
+
+# Глобальный экземпляр
+usage_tracker = UsageTracker(db, flush_interval=settings.USAGE_FLUSH_INTERVAL)
@@ -0,0 +1,138 @@
+import random
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional
+
+from src.config import settings
+from src.services.supabase_db import SupabaseDB, db
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """
+    Фоновая очередь записи для vocabulary и error_logs.
+
+    Хендлеры только кладут строки в буфер (без await), а фоновая задача
+    сбрасывает их bulk insert'ами по порогу размера или по таймеру,
+    повторяет неудачные батчи с экспоненциальной задержкой и дочищает
+    буфер при shutdown.
+    """
+
+    def __init__(
+        self,
+        storage: SupabaseDB,
+        batch_size: int = 50,
+        flush_interval: float = 2.0,
+        max_retries: int = 3,
+        max_pending: int = 10000
+    ):
+        self.storage = storage
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.max_pending = max_pending
+
+        self._buffers: Dict[str, List[Dict[str, Any]]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        # Метрики
+        self.flushed_rows = 0
+        self.failed_rows = 0
+        self.dropped_rows = 0
+        self.batches = 0
+
+    @property
+    def pending(self) -> int:
+        return sum(len(rows) for rows in self._buffers.values())
+
+    def start(self) -> None:
+        """Запускает фоновую задачу (нужен работающий event loop)"""
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+            logger.info("✅ Write-behind queue started")
+
+    def add_vocabulary(self, telegram_id: int, word_data: Dict[str, Any]) -> None:
+        """Ставит слово в очередь на запись в vocabulary"""
+        self._put("vocabulary", self.storage.vocabulary_row(telegram_id, word_data))
+
+    def add_error(self, telegram_id: int, error_data: Dict[str, Any]) -> None:
+        """Ставит ошибку в очередь на запись в error_logs"""
+        self._put("error_logs", self.storage.error_row(telegram_id, error_data))
+
+    def _put(self, table: str, row: Dict[str, Any]) -> None:
+        if self.pending >= self.max_pending:
+            self.dropped_rows += 1
+            logger.warning(f"⚠️ Write-behind queue is full, dropping {table} row")
+            return
+
+        self._buffers.setdefault(table, []).append(row)
+        self.start()
+
+        if self.pending >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        """Цикл сброса: по сигналу переполнения или раз в flush_interval"""
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Сбрасывает всё накопленное bulk insert'ами"""
+        buffers, self._buffers = self._buffers, {}
+        for table, rows in buffers.items():
+            for i in range(0, len(rows), self.batch_size):
+                await self._insert_with_retry(table, rows[i:i + self.batch_size])
+
+    async def _insert_with_retry(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.storage.insert_many(table, rows)
+                self.flushed_rows += len(rows)
+                self.batches += 1
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed_rows += len(rows)
+                    logger.error(f"❌ Write-behind: dropped {len(rows)} {table} rows after {attempt + 1} attempts: {e}")
+                    return
+                delay = 0.5 * (2 ** attempt) + random.random() * 0.5
+                logger.warning(f"Write-behind {table} batch failed (attempt {attempt + 1}), retry in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+
+    async def stop(self) -> None:
+        """Останавливает фоновую задачу и дописывает остаток буфера"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._task:
+            await self._task
+            self._task = None
+        await self.flush()
+        logger.info(f"✅ Write-behind queue drained ({self.flushed_rows} rows written)")
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики для /status"""
+        return {
+            "pending": self.pending,
+            "flushed_rows": self.flushed_rows,
+            "failed_rows": self.failed_rows,
+            "dropped_rows": self.dropped_rows,
+            "batches": self.batches
+        }
+
+
+# Глобальный экземпляр
+write_queue = WriteBehindQueue(
+    db,
+    batch_size=settings.WRITE_BEHIND_BATCH_SIZE,
+    flush_interval=settings.WRITE_BEHIND_FLUSH_INTERVAL,
+    max_retries=settings.WRITE_BEHIND_MAX_RETRIES
+)
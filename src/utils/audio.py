@@ -1,34 +1,70 @@
-import os
+import io
+import wave
+import asyncio
 import logging
 import tempfile
+import subprocess
 from pathlib import Path
-from typing import Optional
-
-import aiofiles
+import warnings
+from typing import AsyncIterator, List, Optional, Tuple, Union
 
 logger = logging.getLogger(__name__)
 
+# PyAV (опционально): кодирование Opus внутри процесса, без запуска ffmpeg
+try:
+    import av
+except ImportError:
+    av = None
+
+# audioop: быстрые C-операции над PCM (есть до Python 3.12 включительно)
+try:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        import audioop
+except ImportError:
+    audioop = None
+
+# Параметры голосовых ответов (стандарт для Telegram voice)
+VOICE_SAMPLE_RATE = 24000
+VOICE_BITRATE = 32000
+
+# Нормализация громкости: RMS около -20 dBFS, пик не выше -1 dBFS, усиление не больше x8
+VOICE_TARGET_RMS = 3277
+VOICE_PEAK_LIMIT = 29205
+VOICE_MAX_GAIN = 8.0
+
+# Частота для анализа входящих голосовых (VAD, нарезка)
+VAD_SAMPLE_RATE = 16000
+
+# Страница OGG не длиннее 65307 байт
+OGG_MAX_PAGE_BYTES = 65307
+
+FFMPEG_OPUS_ARGS = [
+    '-af', 'loudnorm=I=-16:TP=-1.5:LRA=11',  # Нормализация громкости
+    '-ac', '1',                 # Моно
+    '-c:a', 'libopus',          # Кодек Opus
+    '-b:a', '32k',              # Битрейт 32 kbps (стандарт для Telegram)
+    '-ar', '24000',             # Частота 24 кГц
+    '-application', 'voip',     # Оптимизация для речи
+    '-frame_duration', '60',    # Длительность фрейма
+    '-packet_loss', '1',        # Устойчивость к потерям
+    '-f', 'ogg',                # Выходной формат OGG
+]
+
+
+def warmup() -> bool:
+    """Пустая задача для воркеров OpusEncoderPool: поднимает процесс заранее"""
+    return av is not None
 
-async def save_voice_file(file_bytes: bytes, file_extension: str = "ogg") -> Path:
+
+def create_temp_path(file_extension: str = "ogg") -> Path:
     """
-    Сохраняет голосовое сообщение во временный файл.
-    Groq принимает OGG напрямую, конвертация не нужна!
+    Создаёт пустой временный файл и возвращает путь к нему.
+    Используется только для очень больших голосовых (spill-to-disk),
+    обычный путь голосового сообщения целиком в памяти.
     """
-    try:
-        # Создаем временный файл с правильным расширением
-        with tempfile.NamedTemporaryFile(suffix=f".{file_extension}", delete=False) as tmp:
-            tmp_path = Path(tmp.name)
-        
-        # Асинхронно записываем байты
-        async with aiofiles.open(tmp_path, 'wb') as f:
-            await f.write(file_bytes)
-        
-        logger.debug(f"Saved voice file: {tmp_path}")
-        return tmp_path
-        
-    except Exception as e:
-        logger.error(f"Error saving voice file: {e}")
-        raise
+    with tempfile.NamedTemporaryFile(suffix=f".{file_extension}", delete=False) as tmp:
+        return Path(tmp.name)
 
 
 async def cleanup_file(file_path: Path) -> None:
@@ -41,11 +77,417 @@ async def cleanup_file(file_path: Path) -> None:
         logger.error(f"Error cleaning up file {file_path}: {e}")
 
 
-async def read_file_bytes(file_path: Path) -> bytes:
-    """Читает файл и возвращает байты"""
+
+def concat_wav(wav_parts: List[bytes]) -> bytes:
+    """
+    Склеивает несколько WAV с одинаковыми параметрами в один файл
+    (используется для пофразового синтеза).
+    """
+    if len(wav_parts) == 1:
+        return wav_parts[0]
+    
+    params = None
+    frames = []
+    for part in wav_parts:
+        with wave.open(io.BytesIO(part), "rb") as reader:
+            part_params = (reader.getnchannels(), reader.getsampwidth(), reader.getframerate())
+            if params is None:
+                params = part_params
+            elif part_params != params:
+                raise ValueError(f"WAV parameters mismatch: {part_params} != {params}")
+            frames.append(reader.readframes(reader.getnframes()))
+    
+    output = io.BytesIO()
+    with wave.open(output, "wb") as writer:
+        writer.setnchannels(params[0])
+        writer.setsampwidth(params[1])
+        writer.setframerate(params[2])
+        writer.writeframes(b"".join(frames))
+    return output.getvalue()
+
+
+def read_wav(wav_bytes: bytes) -> Tuple[bytes, int, int]:
+    """
+    Читает 16-bit PCM WAV
+    
+    Returns:
+        (pcm, sample_rate, channels)
+    """
+    with wave.open(io.BytesIO(wav_bytes), "rb") as reader:
+        channels = reader.getnchannels()
+        sample_width = reader.getsampwidth()
+        sample_rate = reader.getframerate()
+        pcm = reader.readframes(reader.getnframes())
+    
+    if sample_width != 2:
+        raise ValueError(f"Only 16-bit PCM WAV is supported, got {sample_width * 8}-bit")
+    return pcm, sample_rate, channels
+
+
+def prepare_voice_pcm(
+    pcm: bytes,
+    sample_rate: int,
+    channels: int,
+    target_rate: int = VOICE_SAMPLE_RATE
+) -> Tuple[bytes, int, int]:
+    """
+    Общая пост-обработка речи любого TTS-провайдера:
+    моно, ресемплинг в target_rate и нормализация громкости
+    (RMS к VOICE_TARGET_RMS с ограничением пика VOICE_PEAK_LIMIT).
+    
+    Без audioop (Python 3.13+) PCM возвращается как есть,
+    ресемплинг тогда делает кодировщик.
+    
+    Returns:
+        (pcm, sample_rate, channels)
+    """
+    if audioop is None or not pcm:
+        return pcm, sample_rate, channels
+    
+    if channels == 2:
+        pcm = audioop.tomono(pcm, 2, 0.5, 0.5)
+        channels = 1
+    if channels == 1 and sample_rate != target_rate:
+        pcm, _ = audioop.ratecv(pcm, 2, 1, sample_rate, target_rate, None)
+        sample_rate = target_rate
+    
+    rms = audioop.rms(pcm, 2)
+    peak = audioop.max(pcm, 2)
+    if rms and peak:
+        gain = min(VOICE_TARGET_RMS / rms, VOICE_PEAK_LIMIT / peak, VOICE_MAX_GAIN)
+        if abs(gain - 1.0) > 0.05:
+            pcm = audioop.mul(pcm, 2, gain)
+    
+    return pcm, sample_rate, channels
+
+
+def encode_pcm_ogg_opus(
+    pcm: bytes,
+    input_rate: int,
+    channels: int = 1,
+    bitrate: int = VOICE_BITRATE,
+    sample_rate: int = VOICE_SAMPLE_RATE
+) -> bytes:
+    """Кодирует 16-bit PCM в OGG Opus (моно) через PyAV"""
+    if av is None:
+        raise RuntimeError("PyAV is not installed")
+    
+    frame = av.AudioFrame(
+        format="s16",
+        layout="mono" if channels == 1 else "stereo",
+        samples=len(pcm) // (2 * channels)
+    )
+    frame.planes[0].update(pcm)
+    frame.sample_rate = input_rate
+    
+    output = io.BytesIO()
+    with av.open(output, mode="w", format="ogg") as container:
+        stream = container.add_stream(
+            "libopus",
+            rate=sample_rate,
+            options={"application": "voip", "frame_duration": "60", "packet_loss": "1"}
+        )
+        stream.codec_context.layout = "mono"
+        stream.codec_context.bit_rate = bitrate
+        
+        # После prepare_voice_pcm ресемплер почти всегда ничего не делает
+        resampler = av.AudioResampler(format="s16", layout="mono", rate=sample_rate)
+        for resampled in resampler.resample(frame) + resampler.resample(None):
+            resampled.pts = None
+            for packet in stream.encode(resampled):
+                container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+    
+    return output.getvalue()
+
+
+def encode_ogg_opus(wav_bytes: bytes, bitrate: int = VOICE_BITRATE, sample_rate: int = VOICE_SAMPLE_RATE) -> bytes:
+    """
+    Единый выход голоса: WAV любого провайдера -> нормализованный OGG Opus
+    (32 kbps, моно, 24 кГц) внутри процесса через PyAV.
+    
+    Синхронная и CPU-bound: вызывается в воркерах OpusEncoderPool.
+    """
+    pcm, input_rate, channels = prepare_voice_pcm(*read_wav(wav_bytes), target_rate=sample_rate)
+    return encode_pcm_ogg_opus(pcm, input_rate, channels, bitrate=bitrate, sample_rate=sample_rate)
+
+
+def decode_ogg_pcm(ogg: Union[bytes, Path], sample_rate: int = VAD_SAMPLE_RATE) -> bytes:
+    """Декодирует OGG Opus (байты или файл на диске) в 16-bit моно PCM с заданной частотой (PyAV)"""
+    if av is None:
+        raise RuntimeError("PyAV is not installed")
+    
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=sample_rate)
+    chunks = []
+    
+    def _append(frames) -> None:
+        # Буфер плоскости выровнен и длиннее данных: хвост - мусор, не тишина
+        for resampled in frames:
+            chunks.append(bytes(resampled.planes[0])[:resampled.samples * 2])
+    
+    source = str(ogg) if isinstance(ogg, Path) else io.BytesIO(ogg)
+    with av.open(source, mode="r") as container:
+        for frame in container.decode(audio=0):
+            _append(resampler.resample(frame))
+        _append(resampler.resample(None))
+    return b"".join(chunks)
+
+
+def detect_speech(
+    pcm: bytes,
+    sample_rate: int = VAD_SAMPLE_RATE,
+    min_rms: int = 300,
+    frame_ms: int = 30
+) -> Tuple[float, float, float]:
+    """
+    Энергетический VAD: кадры громче порога считаются речью.
+    
+    Порог - максимум из min_rms и утроенного шумового фона (10-й перцентиль
+    RMS кадров). Фон не выше четверти медианы: в записи без пауз (сплошная
+    речь, тон) перцентиль - это уже речь, и порог по нему отбросил бы всё.
+    Границы речи расширяются по соседним кадрам громче половины порога,
+    чтобы не срезать тихие начала и концы слов.
+    
+    Returns:
+        (секунд речи, начало речи, конец речи) - в секундах
+    """
+    frame_bytes = sample_rate * frame_ms // 1000 * 2
+    levels = [
+        audioop.rms(pcm[i:i + frame_bytes], 2)
+        for i in range(0, len(pcm) - frame_bytes + 1, frame_bytes)
+    ]
+    if not levels:
+        return 0.0, 0.0, 0.0
+    
+    ordered = sorted(levels)
+    noise_floor = min(ordered[len(ordered) // 10], ordered[len(ordered) // 2] / 4)
+    threshold = max(min_rms, noise_floor * 3)
+    speech = [i for i, level in enumerate(levels) if level > threshold]
+    if not speech:
+        return 0.0, 0.0, 0.0
+    
+    edge_threshold = threshold / 2
+    first, last = speech[0], speech[-1]
+    while first > 0 and levels[first - 1] > edge_threshold:
+        first -= 1
+    while last < len(levels) - 1 and levels[last + 1] > edge_threshold:
+        last += 1
+    
+    frame_seconds = frame_ms / 1000
+    return len(speech) * frame_seconds, first * frame_seconds, (last + 1) * frame_seconds
+
+
+def screen_voice(
+    ogg: Union[bytes, Path],
+    min_rms: int = 300,
+    min_speech_seconds: float = 0.2,
+    trim_min_silence: float = 1.0,
+    padding: float = 0.3
+) -> Tuple[bool, Optional[Union[bytes, Path]], float]:
+    """
+    Локальная проверка голосового перед Whisper (выполняется в пуле процессов)
+    
+    Запись на диске декодируется из файла, обрезанная версия записывается
+    поверх него (только если она меньше): через пул передаётся лишь путь.
+    
+    Returns:
+        (есть ли речь, обрезанный OGG или None если обрезать нечего, секунд речи)
+    """
+    pcm = decode_ogg_pcm(ogg)
+    if audioop is None:
+        return True, None, len(pcm) / (2 * VAD_SAMPLE_RATE)
+    
+    speech_seconds, start, end = detect_speech(pcm, min_rms=min_rms)
+    if speech_seconds < min_speech_seconds:
+        return False, None, speech_seconds
+    
+    total = len(pcm) / (2 * VAD_SAMPLE_RATE)
+    start = max(0.0, start - padding)
+    end = min(total, end + padding)
+    if start + (total - end) < trim_min_silence:
+        return True, None, speech_seconds
+    
+    trimmed = pcm[int(start * VAD_SAMPLE_RATE) * 2:int(end * VAD_SAMPLE_RATE) * 2]
+    encoded = encode_pcm_ogg_opus(trimmed, VAD_SAMPLE_RATE, sample_rate=VAD_SAMPLE_RATE)
+    if not isinstance(ogg, Path):
+        return True, encoded, speech_seconds
+    if len(encoded) >= ogg.stat().st_size:
+        return True, None, speech_seconds
+    tmp_path = ogg.with_suffix(".trimmed")
+    tmp_path.write_bytes(encoded)
+    tmp_path.replace(ogg)
+    return True, ogg, speech_seconds
+
+
+def split_voice(
+    ogg: Union[bytes, Path],
+    target_seconds: float = 30.0,
+    overlap_seconds: float = 1.0,
+    frame_ms: int = 30
+) -> List[bytes]:
+    """
+    Режет длинное голосовое на перекрывающиеся сегменты по паузам
+    (выполняется в пуле процессов)
+    
+    Граница сегмента ищется в самом тихом кадре последней трети
+    очередного окна target_seconds, к каждой стороне добавляется overlap.
+    Запись на диске декодируется прямо из файла, в процесс пула передаётся
+    только путь.
+    
+    Returns:
+        Список OGG Opus сегментов (16 кГц моно)
+    """
+    pcm = decode_ogg_pcm(ogg)
+    bytes_per_second = VAD_SAMPLE_RATE * 2
+    total = len(pcm) / bytes_per_second
+    if total <= target_seconds * 1.2:
+        return [ogg.read_bytes() if isinstance(ogg, Path) else ogg]
+    
+    frame_bytes = bytes_per_second * frame_ms // 1000
+    frame_seconds = frame_ms / 1000
+    
+    def _level(second: float) -> int:
+        offset = int(second / frame_seconds) * frame_bytes
+        frame = pcm[offset:offset + frame_bytes]
+        if audioop is None or len(frame) < frame_bytes:
+            return 0
+        return audioop.rms(frame, 2)
+    
+    cuts = [0.0]
+    while total - cuts[-1] > target_seconds * 1.2:
+        window_end = cuts[-1] + target_seconds
+        window_start = window_end - target_seconds / 3
+        candidates = [window_start + i * frame_seconds for i in range(int((window_end - window_start) / frame_seconds))]
+        cuts.append(min(candidates, key=_level) if candidates else window_end)
+    cuts.append(total)
+    
+    segments = []
+    for start, end in zip(cuts, cuts[1:]):
+        start = max(0.0, start - overlap_seconds)
+        end = min(total, end + overlap_seconds)
+        chunk = pcm[int(start * VAD_SAMPLE_RATE) * 2:int(end * VAD_SAMPLE_RATE) * 2]
+        segments.append(encode_pcm_ogg_opus(chunk, VAD_SAMPLE_RATE, sample_rate=VAD_SAMPLE_RATE))
+    return segments
+
+
+def ogg_duration(ogg_data) -> float:
+    """
+    Длительность OGG Opus в секундах по granule position последней страницы
+    (granule у Opus всегда в отсчётах 48 кГц, за вычетом pre-skip из OpusHead).
+    
+    Принимает bytes, memoryview или путь к файлу; читаются только начало
+    и последняя страница.
+    """
+    if isinstance(ogg_data, Path):
+        with open(ogg_data, "rb") as f:
+            head_bytes = f.read(512)
+            f.seek(max(0, ogg_data.stat().st_size - OGG_MAX_PAGE_BYTES))
+            tail = f.read()
+    else:
+        view = memoryview(ogg_data)
+        head_bytes = bytes(view[:512])
+        tail = bytes(view[-OGG_MAX_PAGE_BYTES:])
+    
+    last_page = tail.rfind(b"OggS")
+    if last_page < 0 or last_page + 14 > len(tail):
+        return 0.0
+    granule = int.from_bytes(tail[last_page + 6:last_page + 14], "little", signed=True)
+    
+    pre_skip = 0
+    head = head_bytes.find(b"OpusHead")
+    if 0 <= head and head + 12 <= len(head_bytes):
+        pre_skip = int.from_bytes(head_bytes[head + 10:head + 12], "little")
+    
+    return max(0.0, (granule - pre_skip) / 48000)
+
+
+async def ffmpeg_encode_ogg_opus(wav_bytes: bytes) -> Optional[bytes]:
+    """
+    Конвертирует WAV в OGG Opus отдельным процессом ffmpeg
+    (запасной путь, если PyAV не установлен)
+    """
     try:
-        async with aiofiles.open(file_path, 'rb') as f:
-            return await f.read()
-    except Exception as e:
-        logger.error(f"Error reading file {file_path}: {e}")
+        process = await asyncio.create_subprocess_exec(
+            'ffmpeg',
+            '-i', 'pipe:0',             # Вход из stdin
+            *FFMPEG_OPUS_ARGS,
+            'pipe:1',                   # Выход в stdout
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        
+        # Отправляем WAV в stdin и получаем результат
+        stdout, stderr = await process.communicate(input=wav_bytes)
+        
+        if process.returncode != 0:
+            logger.error(f"FFmpeg conversion error: {stderr.decode()}")
+            return None
+        return stdout
+        
+    except FileNotFoundError:
+        # WAV Telegram как голосовое не примет, поэтому без кодировщика голоса нет
+        logger.error("❌ Neither PyAV nor ffmpeg is available, cannot encode Opus")
+        return None
+
+
+async def ffmpeg_stream_ogg_opus(chunks: AsyncIterator[bytes]) -> Optional[bytes]:
+    """
+    Потоковое кодирование WAV -> OGG Opus: чанки пишутся в stdin ffmpeg
+    по мере поступления, Opus-страницы читаются из stdout параллельно.
+    
+    drain() даёт backpressure: если ffmpeg не успевает, чтение из сети
+    приостанавливается. При отмене процесс ffmpeg убивается.
+    """
+    process = await asyncio.create_subprocess_exec(
+        'ffmpeg',
+        '-f', 'wav',
+        '-i', 'pipe:0',
+        *FFMPEG_OPUS_ARGS,
+        'pipe:1',
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    
+    async def _feed() -> int:
+        received = 0
+        try:
+            async for chunk in chunks:
+                received += len(chunk)
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg завершился раньше времени - причину покажет stderr
+            pass
+        finally:
+            if hasattr(chunks, "aclose"):
+                await chunks.aclose()
+            process.stdin.close()
+        return received
+    
+    async def _collect() -> bytes:
+        pages = []
+        while True:
+            data = await process.stdout.read(65536)
+            if not data:
+                break
+            pages.append(data)
+        return b"".join(pages)
+    
+    try:
+        received, ogg_data, stderr = await asyncio.gather(_feed(), _collect(), process.stderr.read())
+        await process.wait()
+    except BaseException:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
         raise
+    
+    if process.returncode != 0 or not received:
+        logger.error(f"FFmpeg streaming conversion error: {stderr.decode(errors='ignore')[-500:]}")
+        return None
+    
+    logger.info(f"✅ Stream-encoded WAV ({received} bytes) to OGG ({len(ogg_data)} bytes)")
+    return ogg_data
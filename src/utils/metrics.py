@@ -0,0 +1,59 @@
+import time
+from collections import deque
+from typing import Any, Awaitable, Dict, Optional
+
+
+class LatencyStats:
+    """Скользящее окно латентностей с перцентилями (для /status и адаптивных порогов)"""
+
+    def __init__(self, window: int = 500):
+        self._samples: deque = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self.count += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """q в диапазоне 0..1; None, если замеров ещё нет"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+        return ordered[index]
+
+    def stats(self) -> Dict[str, Any]:
+        p50 = self.percentile(0.5)
+        p99 = self.percentile(0.99)
+        return {
+            "count": self.count,
+            "p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "p99_ms": round(p99 * 1000) if p99 is not None else None
+        }
+
+
+class StageTimer:
+    """Замеры стадий обработки одного сообщения для логов пайплайна"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.durations: Dict[str, float] = {}
+        self.marks: Dict[str, float] = {}
+
+    async def track(self, stage: str, awaitable: Awaitable[Any]) -> Any:
+        """Выполняет awaitable и запоминает его длительность как стадию"""
+        started = time.monotonic()
+        try:
+            return await awaitable
+        finally:
+            self.durations[stage] = time.monotonic() - started
+
+    def mark(self, event: str) -> float:
+        """Запоминает момент события относительно начала обработки"""
+        self.marks[event] = time.monotonic() - self.started
+        return self.marks[event]
+
+    def summary(self) -> str:
+        parts = [f"{stage}={seconds:.2f}s" for stage, seconds in self.durations.items()]
+        parts += [f"@{event}={seconds:.2f}s" for event, seconds in self.marks.items()]
+        return " ".join(parts)
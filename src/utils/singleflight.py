@@ -0,0 +1,47 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные одинаковые вызовы: пока вызов с ключом
+    выполняется, остальные вызовы с тем же ключом ждут его результат
+    (или исключение) вместо повторного запроса.
+
+    Отмена одного из ожидающих не отменяет общий вызов для остальных.
+    Не потокобезопасен: рассчитан на использование из одного event loop.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполняет func() или присоединяется к уже идущему вызову с тем же ключом"""
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda finished: self._done(key, finished))
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Все ожидающие могли быть отменены - помечаем исключение как полученное
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики для /status"""
+        total = self.leaders + self.shared
+        return {
+            "in_flight": len(self._in_flight),
+            "calls": self.leaders,
+            "shared": self.shared,
+            "shared_rate": round(self.shared / total, 3) if total else 0.0
+        }
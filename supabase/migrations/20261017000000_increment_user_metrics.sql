@@ -0,0 +1,29 @@
+-- Атомарное обновление метрик пользователя за один round trip.
+-- UPDATE берёт блокировку строки, поэтому параллельные сообщения
+-- одного пользователя не теряют инкременты.
+-- Streak считается по разнице дат (UTC), а не по дню месяца.
+
+create or replace function public.increment_user_metrics(
+    p_telegram_id bigint,
+    p_tokens bigint default 0,
+    p_messages integer default 1
+)
+returns setof public.users
+language sql
+as $$
+    update public.users
+    set
+        total_tokens_used = coalesce(total_tokens_used, 0) + p_tokens,
+        free_messages_used = coalesce(free_messages_used, 0) + p_messages,
+        streak_days = case
+            when last_active is null then 1
+            when (now() at time zone 'utc')::date - (last_active at time zone 'utc')::date = 0
+                then coalesce(streak_days, 1)
+            when (now() at time zone 'utc')::date - (last_active at time zone 'utc')::date = 1
+                then coalesce(streak_days, 0) + 1
+            else 1
+        end,
+        last_active = now()
+    where telegram_id = p_telegram_id
+    returning *;
+$$;
@@ -0,0 +1,41 @@
+-- Счётчики ошибок по категориям, поддерживаемые триггером на error_logs.
+-- /stats читает несколько строк отсюда вместо всей истории ошибок.
+
+create table if not exists public.user_error_stats (
+    user_id bigint not null,
+    category text not null,
+    error_count bigint not null default 0,
+    primary key (user_id, category)
+);
+
+-- Statement-level триггер: bulk insert из write-behind очереди
+-- обновляет счётчики одним upsert'ом на батч
+create or replace function public.bump_user_error_stats()
+returns trigger
+language plpgsql
+as $$
+begin
+    insert into public.user_error_stats (user_id, category, error_count)
+    select user_id, coalesce(category, 'none'), count(*)
+    from new_rows
+    group by user_id, coalesce(category, 'none')
+    on conflict (user_id, category)
+    do update set error_count = public.user_error_stats.error_count + excluded.error_count;
+    return null;
+end;
+$$;
+
+drop trigger if exists error_logs_bump_stats on public.error_logs;
+create trigger error_logs_bump_stats
+    after insert on public.error_logs
+    referencing new table as new_rows
+    for each statement
+    execute function public.bump_user_error_stats();
+
+-- Заполняем счётчики по уже накопленной истории
+insert into public.user_error_stats (user_id, category, error_count)
+select user_id, coalesce(category, 'none'), count(*)
+from public.error_logs
+group by user_id, coalesce(category, 'none')
+on conflict (user_id, category)
+do update set error_count = excluded.error_count;
@@ -0,0 +1,9 @@
+-- Память диалога: краткое содержание старых реплик и последние сообщения.
+-- Одна строка на пользователя, перезаписывается после каждого обмена репликами.
+
+create table if not exists public.conversation_memory (
+    telegram_id bigint primary key,
+    summary text not null default '',
+    messages jsonb not null default '[]'::jsonb,
+    updated_at timestamptz not null default now()
+);
@@ -0,0 +1,19 @@
+import os
+import sys
+import asyncio
+from typing import Any, Awaitable
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# src.config требует обязательные переменные окружения; тестам настоящие не нужны
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:test-token")
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJyb2xlIjoiYW5vbiJ9.test")
+os.environ.setdefault("TTS_PROVIDER", "groq")
+
+
+def run(coro: Awaitable[Any]) -> Any:
+    """Выполняет корутину теста в новом event loop"""
+    return asyncio.run(coro)
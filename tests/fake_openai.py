@@ -0,0 +1,93 @@
+import json
+import asyncio
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+
+class FakeOpenAI:
+    """
+    OpenAI-совместимый сервер для офлайн-тестов GroqClient и KeyScheduler.
+
+    Поведение задаётся по API-ключу (Bearer): статус, заголовки и задержка
+    ответа. Ключи без настроек отвечают 200 с текстом "reply from <key>".
+    Поддерживается stream=True (SSE), usage в потоке - только с
+    stream_options.include_usage, как у настоящего API.
+    """
+
+    def __init__(self):
+        self.keys: Dict[str, Dict[str, Any]] = {}
+        self.requests: Counter = Counter()
+        self.bodies: list = []
+        self._server: Optional[TestServer] = None
+
+    def configure(self, key: str, status: int = 200, headers: Optional[Dict[str, str]] = None, delay: float = 0.0) -> None:
+        self.keys[key] = {"status": status, "headers": headers or {}, "delay": delay}
+
+    @property
+    def base_url(self) -> str:
+        return str(self._server.make_url("/v1"))
+
+    async def __aenter__(self) -> "FakeOpenAI":
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._chat_completions)
+        self._server = TestServer(app)
+        await self._server.start_server()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._server.close()
+
+    async def _chat_completions(self, request: web.Request) -> web.StreamResponse:
+        key = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        body = await request.json()
+        self.requests[key] += 1
+        self.bodies.append(body)
+
+        behaviour = self.keys.get(key, {"status": 200, "headers": {}, "delay": 0.0})
+        if behaviour["delay"]:
+            await asyncio.sleep(behaviour["delay"])
+        if behaviour["status"] != 200:
+            return web.json_response(
+                {"error": {"message": f"HTTP {behaviour['status']} for {key}", "type": "test"}},
+                status=behaviour["status"],
+                headers=behaviour["headers"]
+            )
+
+        content = f"reply from {key}"
+        usage = {"prompt_tokens": 11, "completion_tokens": 5, "total_tokens": 16}
+        if body.get("stream"):
+            return await self._stream(request, body, content, usage, behaviour["headers"])
+        return web.json_response({
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage
+        }, headers=behaviour["headers"])
+
+    async def _stream(self, request, body, content, usage, headers) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", **headers})
+        await response.prepare(request)
+
+        def _chunk(delta: Dict[str, Any], **extra: Any) -> bytes:
+            payload = {
+                "id": "chatcmpl-test",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": body["model"],
+                "choices": [{"index": 0, "delta": delta, "finish_reason": None}] if delta else [],
+                **extra
+            }
+            return f"data: {json.dumps(payload)}\n\n".encode()
+
+        for word in content.split(" "):
+            await response.write(_chunk({"content": word + " "}))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await response.write(_chunk({}, usage=usage))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
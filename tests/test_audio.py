@@ -0,0 +1,126 @@
+import io
+import math
+import wave
+import random
+import struct
+
+import pytest
+
+from src.utils import audio
+from src.utils.audio import VAD_SAMPLE_RATE, concat_wav, detect_speech, ogg_duration
+
+pytestmark = pytest.mark.skipif(audio.audioop is None, reason="audioop is not available")
+
+
+def pcm(samples) -> bytes:
+    return b"".join(struct.pack("<h", max(-32768, min(32767, int(s)))) for s in samples)
+
+
+def tone(seconds: float, amplitude: float = 3000, freq: float = 220) -> bytes:
+    count = int(seconds * VAD_SAMPLE_RATE)
+    return pcm(amplitude * math.sin(2 * math.pi * freq * i / VAD_SAMPLE_RATE) for i in range(count))
+
+
+def voiced(seconds: float) -> bytes:
+    """Тон с медленно меняющейся громкостью, без пауз - как сплошная речь"""
+    count = int(seconds * VAD_SAMPLE_RATE)
+    return pcm(
+        (2000 + 1500 * math.sin(2 * math.pi * 3 * i / VAD_SAMPLE_RATE)) * math.sin(2 * math.pi * 180 * i / VAD_SAMPLE_RATE)
+        for i in range(count)
+    )
+
+
+def noise(seconds: float, amplitude: int = 50) -> bytes:
+    rng = random.Random(0)
+    return pcm(rng.randint(-amplitude, amplitude) for _ in range(int(seconds * VAD_SAMPLE_RATE)))
+
+
+def wav(data: bytes, rate: int = 22050) -> bytes:
+    output = io.BytesIO()
+    with wave.open(output, "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(rate)
+        writer.writeframes(data)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("clip, seconds", [(tone(0.6), 0.6), (voiced(1.0), 1.0), (voiced(3.0), 3.0)])
+def test_continuous_signal_is_speech(clip, seconds):
+    # Без пауз шумовой фон по перцентилю - это уже речь; клип не должен отбрасываться
+    speech_seconds, start, end = detect_speech(clip)
+    assert speech_seconds >= seconds / 2
+    assert start == 0.0
+
+
+def test_silence_is_not_speech():
+    assert detect_speech(noise(2.0)) == (0.0, 0.0, 0.0)
+    assert detect_speech(b"") == (0.0, 0.0, 0.0)
+
+
+def test_speech_boundaries_in_padded_clip():
+    speech_seconds, start, end = detect_speech(noise(1.0) + tone(1.0) + noise(1.0))
+    assert speech_seconds == pytest.approx(1.0, abs=0.1)
+    assert start == pytest.approx(1.0, abs=0.05)
+    assert end == pytest.approx(2.0, abs=0.05)
+
+
+def test_soft_onset_is_kept():
+    # Тихое начало слова (вдвое тише порога речи) не должно срезаться
+    _, start, _ = detect_speech(noise(1.0) + tone(0.2, amplitude=600) + tone(1.0) + noise(1.0))
+    assert start == pytest.approx(1.0, abs=0.05)
+
+
+def test_concat_wav_joins_frames():
+    joined = concat_wav([wav(tone(0.1)), wav(tone(0.2))])
+    with wave.open(io.BytesIO(joined), "rb") as reader:
+        assert reader.getnframes() == int(0.1 * VAD_SAMPLE_RATE) + int(0.2 * VAD_SAMPLE_RATE)
+
+
+def test_concat_wav_rejects_mismatched_parts():
+    with pytest.raises(ValueError):
+        concat_wav([wav(tone(0.1), rate=16000), wav(tone(0.1), rate=22050)])
+
+
+@pytest.mark.skipif(audio.av is None, reason="PyAV is not installed")
+def test_encoded_voice_duration_and_screening():
+    clip = noise(1.5) + voiced(1.0) + noise(1.5)
+    ogg = audio.encode_pcm_ogg_opus(clip, VAD_SAMPLE_RATE, sample_rate=VAD_SAMPLE_RATE)
+    assert ogg_duration(ogg) == pytest.approx(4.0, abs=0.1)
+
+    has_speech, trimmed, speech_seconds = audio.screen_voice(ogg)
+    assert has_speech
+    assert speech_seconds > 0.4
+    assert trimmed is not None and ogg_duration(trimmed) < 2.0
+
+
+@pytest.mark.skipif(audio.av is None, reason="PyAV is not installed")
+def test_screening_continuous_speech_sends_it_to_whisper():
+    ogg = audio.encode_pcm_ogg_opus(voiced(1.0), VAD_SAMPLE_RATE, sample_rate=VAD_SAMPLE_RATE)
+    has_speech, trimmed, _ = audio.screen_voice(ogg)
+    assert has_speech
+    assert trimmed is None
+
+
+@pytest.mark.skipif(audio.av is None, reason="PyAV is not installed")
+def test_spilled_voice_is_screened_and_trimmed_in_place(tmp_path):
+    path = tmp_path / "voice.ogg"
+    path.write_bytes(audio.encode_pcm_ogg_opus(noise(3.0) + voiced(1.0) + noise(3.0), VAD_SAMPLE_RATE, sample_rate=VAD_SAMPLE_RATE))
+
+    has_speech, trimmed, _ = audio.screen_voice(path)
+    assert has_speech
+    assert trimmed == path and ogg_duration(path) < 2.0
+    assert list(tmp_path.iterdir()) == [path]
+
+
+@pytest.mark.skipif(audio.av is None, reason="PyAV is not installed")
+def test_spilled_voice_is_measured_and_split_from_disk(tmp_path):
+    # Речь с паузами: 4 с речи, 0.5 с тишины
+    clip = b"".join(voiced(4.0) + noise(0.5) for _ in range(5))
+    path = tmp_path / "voice.ogg"
+    path.write_bytes(audio.encode_pcm_ogg_opus(clip, VAD_SAMPLE_RATE, sample_rate=VAD_SAMPLE_RATE))
+
+    assert ogg_duration(path) == pytest.approx(22.5, abs=0.1)
+    segments = audio.split_voice(path, target_seconds=8.0, overlap_seconds=0.5)
+    assert len(segments) == 3
+    assert sum(ogg_duration(segment) for segment in segments) == pytest.approx(22.5 + 2 * 2 * 0.5, abs=0.3)
@@ -0,0 +1,68 @@
+import pytest
+
+from src.utils import cache
+from src.utils.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(cache, "time", fake)
+    return fake
+
+
+def test_get_returns_default_for_missing_key(clock):
+    store = TTLCache(maxsize=2, ttl=10)
+    assert store.get("missing") is None
+    assert store.get("missing", "fallback") == "fallback"
+    assert store.stats()["misses"] == 2
+
+
+def test_entries_expire_after_ttl(clock):
+    store = TTLCache(maxsize=10, ttl=10)
+    store.set("a", 1)
+    clock.now += 9
+    assert store.get("a") == 1
+    clock.now += 2
+    assert store.get("a") is None
+    assert len(store) == 0
+
+
+def test_per_entry_ttl_and_zero_ttl(clock):
+    store = TTLCache(maxsize=10, ttl=10)
+    store.set("short", 1, ttl=1)
+    store.set("forever", 2, ttl=0)
+    clock.now += 5
+    assert store.get("short") is None
+    clock.now += 10 ** 6
+    assert store.get("forever") == 2
+
+
+def test_lru_eviction_keeps_recently_used(clock):
+    store = TTLCache(maxsize=2, ttl=0)
+    store.set("a", 1)
+    store.set("b", 2)
+    store.get("a")
+    store.set("c", 3)
+    assert store.get("b") is None
+    assert store.get("a") == 1
+    assert store.get("c") == 3
+
+
+def test_invalidate_and_stats(clock):
+    store = TTLCache(maxsize=2, ttl=0)
+    store.set("a", 1)
+    store.invalidate("a")
+    store.invalidate("missing")
+    assert store.get("a") is None
+    store.set("b", 2)
+    store.get("b")
+    assert store.stats() == {"size": 1, "maxsize": 2, "hits": 1, "misses": 1, "hit_rate": 0.5}
@@ -0,0 +1,91 @@
+import pytest
+
+from src.services.correction_precheck import (
+    ROUTE_HEAVY, ROUTE_LIGHT, ROUTE_SKIP, CorrectionPrecheck, normalize_phrase
+)
+
+
+@pytest.fixture
+def precheck():
+    return CorrectionPrecheck(skip_threshold=0.9, light_threshold=0.6, light_max_words=10)
+
+
+def test_normalize_phrase():
+    assert normalize_phrase("  I’m FINE, thanks!! ") == "i'm fine thanks"
+
+
+@pytest.mark.parametrize("text", ["Yes", "Thanks!", "thank you very much.", "I’m fine, thank you"])
+def test_trivial_phrases_skip_correction(precheck, text):
+    route, result = precheck.check(text)
+    assert route == ROUTE_SKIP
+    assert result["corrected_sentence"] == text
+    assert result["error_category"] == "none"
+
+
+@pytest.mark.parametrize("text, reason", [
+    ("He don't like coffee", "subject-verb agreement"),
+    ("I is happy", "subject-verb agreement"),
+    ("I didn't went home", "verb form after auxiliary"),
+    ("I have a apple", "a before vowel"),
+    ("It is more better", "double comparative"),
+    ("Привет, как дела?", "non-latin text"),
+])
+def test_suspicious_input_goes_to_main_model(precheck, text, reason):
+    assert precheck.confidence(text) == (0.0, reason)
+    assert precheck.check(text) == (ROUTE_HEAVY, None)
+
+
+@pytest.mark.parametrize("text", [
+    "I go to school yesterday",
+    "Yesterday I go to the cinema",
+    "Two days ago I see a movie",
+    "Last week I visit my friend",
+    "I want buy a car",
+    "I need go home",
+    "I can to swim",
+    "She go to school every day",
+    "He like coffee",
+    "They was at home",
+    "We has a dog",
+    "I goes to work",
+])
+def test_known_errors_stay_on_main_model(precheck, text):
+    # Короткие фразы из частых слов: без признаков ошибки ушли бы на лёгкую модель
+    assert precheck.confidence(text)[0] == 0.0
+    assert precheck.check(text) == (ROUTE_HEAVY, None)
+
+
+@pytest.mark.parametrize("text", [
+    "I went to school yesterday",
+    "Yesterday I went to the cinema",
+    "Last week I visited my friend",
+    "I want to buy a car",
+    "She goes to school every day",
+    "Does she go to school",
+    "They were at home",
+])
+def test_corrected_sentences_still_use_light_model(precheck, text):
+    assert precheck.check(text) == (ROUTE_LIGHT, None)
+
+
+def test_short_common_phrase_uses_light_model(precheck):
+    assert precheck.check("I like to read books") == (ROUTE_LIGHT, None)
+
+
+def test_long_or_rare_phrase_uses_main_model(precheck):
+    long_text = "Yesterday my colleagues and I discussed the quarterly procurement strategy at length"
+    assert precheck.check(long_text) == (ROUTE_HEAVY, None)
+
+
+def test_confidence_never_claims_certainty_for_free_text(precheck):
+    confidence, _ = precheck.confidence("I like to read books")
+    assert confidence <= 0.8
+
+
+def test_stats_count_routes(precheck):
+    precheck.check("Yes")
+    precheck.check("I like to read books")
+    precheck.check("He don't like coffee")
+    stats = precheck.stats()
+    assert (stats["checks"], stats["skip"], stats["light"], stats["heavy"]) == (3, 1, 1, 1)
+    assert stats["heavy_calls_avoided"] == 2
@@ -0,0 +1,211 @@
+import time
+import types
+
+import pytest
+
+from src.services.groq_client import GroqClient
+from src.services.key_scheduler import KeyScheduler, is_retryable, parse_duration
+from tests.conftest import run
+from tests.fake_openai import FakeOpenAI
+
+
+class HTTPError(Exception):
+    """Ошибка API с кодом и заголовками ответа, как у исключений openai"""
+
+    def __init__(self, status_code: int, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = types.SimpleNamespace(headers=headers or {})
+
+
+def make_scheduler(keys: int = 2, **kwargs) -> KeyScheduler:
+    return KeyScheduler([f"client-{i}" for i in range(keys)], **kwargs)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("30", 30.0),
+    ("7.66s", 7.66),
+    ("2m59.56s", 179.56),
+    ("1h2m", 3720.0),
+    ("120ms", 0.12),
+    (None, None),
+    ("soon", None),
+])
+def test_parse_duration(value, expected):
+    if expected is None:
+        assert parse_duration(value) is None
+    else:
+        assert parse_duration(value) == pytest.approx(expected)
+
+
+def test_retryable_errors():
+    assert is_retryable(HTTPError(429))
+    assert is_retryable(HTTPError(503))
+    assert is_retryable(TimeoutError())
+    assert not is_retryable(HTTPError(400))
+    assert not is_retryable(HTTPError(422))
+
+
+def test_picks_least_loaded_key():
+    scheduler = make_scheduler(3)
+
+    async def scenario():
+        return [await scheduler.acquire() for _ in range(3)]
+
+    states = run(scenario())
+    assert sorted(state.index for state in states) == [0, 1, 2]
+    assert all(state.in_flight == 1 for state in scheduler.states)
+
+
+def test_prefers_faster_key_when_idle():
+    scheduler = make_scheduler(2)
+    scheduler.release(scheduler.states[0], latency=2.0)
+    scheduler.release(scheduler.states[1], latency=0.2)
+
+    state = run(scheduler.acquire())
+    assert state.index == 1
+
+
+def test_rate_limited_key_waits_for_retry_after():
+    scheduler = make_scheduler(2)
+    state = run(scheduler.acquire())
+    scheduler.release(state, latency=0.1, error=HTTPError(429, {"retry-after": "7"}))
+
+    assert state.rate_limited == 1
+    assert state.available_at == pytest.approx(time.monotonic() + 7, abs=0.5)
+    # 429 - не поломка ключа: breaker не трогаем
+    assert state.consecutive_failures == 0
+    assert run(scheduler.acquire()).index != state.index
+
+
+def test_breaker_opens_after_threshold_and_closes_after_probe():
+    scheduler = make_scheduler(2, failure_threshold=3, open_seconds=0.05)
+    bad = scheduler.states[0]
+    for _ in range(3):
+        bad.in_flight += 1
+        scheduler.release(bad, latency=0.1, error=HTTPError(500))
+    assert bad.circuit_open
+    assert not bad.is_available(time.monotonic())
+
+    time.sleep(0.06)
+    # Half-open: один пробный запрос, второй ключ для остальных
+    scheduler.states[1].in_flight = 1
+    probe = run(scheduler.acquire())
+    assert probe is bad
+    assert run(scheduler.acquire()).index == 1
+
+    scheduler.release(probe, latency=0.1)
+    assert not bad.circuit_open
+    assert bad.consecutive_failures == 0
+
+
+def test_revoked_key_is_disabled():
+    scheduler = make_scheduler(2, revoked_seconds=600)
+    state = run(scheduler.acquire())
+    scheduler.release(state, latency=0.1, error=HTTPError(401))
+
+    assert state.circuit_open
+    assert state.available_at > time.monotonic() + 500
+
+
+def test_request_error_does_not_penalise_key():
+    scheduler = make_scheduler(1)
+    state = run(scheduler.acquire())
+    scheduler.release(state, latency=0.1, error=HTTPError(400))
+
+    assert state.failures == 0
+    assert state.is_available(time.monotonic())
+
+
+def test_acquire_gives_up_after_max_wait():
+    scheduler = make_scheduler(1, max_wait=0.05)
+    state = scheduler.states[0]
+    state.available_at = time.monotonic() + 10
+
+    with pytest.raises(RuntimeError):
+        run(scheduler.acquire())
+
+
+def test_exhausted_rate_limit_headers_pause_key():
+    scheduler = make_scheduler(2)
+    scheduler.observe_headers(0, {
+        "x-ratelimit-remaining-requests": "0",
+        "x-ratelimit-reset-requests": "2.5s"
+    })
+
+    assert scheduler.states[0].remaining_requests == 0
+    assert scheduler.states[0].available_at == pytest.approx(time.monotonic() + 2.5, abs=0.5)
+    assert run(scheduler.acquire()).index == 1
+
+
+# Офлайн-проверка GroqClient с фейковым OpenAI-совместимым сервером
+
+async def _chat(client):
+    return await client.chat.completions.create(
+        model="test-model",
+        messages=[{"role": "user", "content": "hi"}]
+    )
+
+
+def test_rate_limited_key_fails_over_without_sdk_retries():
+    async def scenario():
+        async with FakeOpenAI() as server:
+            server.configure("limited", status=429, headers={"retry-after": "30"})
+            groq = GroqClient(["limited", "healthy"], base_url=server.base_url)
+            replies = [await groq._make_request(_chat) for _ in range(4)]
+            return server, groq, replies
+
+    server, groq, replies = run(scenario())
+    assert [r.choices[0].message.content for r in replies] == ["reply from healthy"] * 4
+    # Без повторов SDK ключ под 429 получает ровно один запрос
+    assert server.requests["limited"] == 1
+    assert groq.scheduler.states[0].rate_limited == 1
+
+
+def test_failing_key_is_taken_out_of_rotation():
+    async def scenario():
+        async with FakeOpenAI() as server:
+            server.configure("broken", status=500)
+            groq = GroqClient(["broken", "healthy"], base_url=server.base_url)
+            groq.scheduler.failure_threshold = 2
+            for _ in range(10):
+                reply = await groq._make_request(_chat)
+                assert reply.choices[0].message.content == "reply from healthy"
+            return server
+
+    server = run(scenario())
+    assert server.requests["healthy"] == 10
+    assert server.requests["broken"] <= 2
+
+
+def test_non_retryable_error_is_not_repeated():
+    async def scenario():
+        async with FakeOpenAI() as server:
+            server.configure("k1", status=400)
+            server.configure("k2", status=400)
+            groq = GroqClient(["k1", "k2"], base_url=server.base_url)
+            with pytest.raises(Exception):
+                await groq._make_request(_chat)
+            return server
+
+    server = run(scenario())
+    assert sum(server.requests.values()) == 1
+
+
+def test_response_headers_reach_scheduler():
+    async def scenario():
+        async with FakeOpenAI() as server:
+            server.configure("k1", headers={
+                "x-ratelimit-remaining-requests": "0",
+                "x-ratelimit-reset-requests": "20s",
+                "x-ratelimit-remaining-tokens": "900"
+            })
+            groq = GroqClient(["k1", "k2"], base_url=server.base_url)
+            groq.scheduler.states[1].latency_ewma = 5.0  # без заголовков выбрался бы k1
+            await groq._make_request(_chat)
+            second = await groq._make_request(_chat)
+            return groq, second
+
+    groq, second = run(scenario())
+    assert groq.scheduler.states[0].remaining_tokens == 900
+    assert second.choices[0].message.content == "reply from k2"
@@ -0,0 +1,33 @@
+import pytest
+
+from src.config import settings
+from src.services.groq_client import GroqClient
+from src.services.opus_encoder import opus_encoder
+from src.utils import audio
+from tests.conftest import run
+from tests.test_audio import VAD_SAMPLE_RATE, voiced
+
+pytestmark = pytest.mark.skipif(audio.av is None or audio.audioop is None, reason="PyAV and audioop are required")
+
+
+def test_spilled_long_voice_goes_to_the_pool_as_a_path(monkeypatch, tmp_path):
+    path = tmp_path / "voice.ogg"
+    path.write_bytes(audio.encode_pcm_ogg_opus(voiced(1.0) * 90, VAD_SAMPLE_RATE, sample_rate=VAD_SAMPLE_RATE))
+    groq = GroqClient(["k1"])
+    calls = []
+
+    async def pool_run(func, *args, timeout=None):
+        calls.append((func, args, timeout))
+        return [b"first", b"second"]
+
+    async def transcribe_once(segment, duration=None):
+        return {b"first": "hello there", b"second": "there my friend"}[segment]
+
+    monkeypatch.setattr(opus_encoder, "run", pool_run)
+    monkeypatch.setattr(groq, "_transcribe_once", transcribe_once)
+
+    assert run(groq.transcribe_audio(path)) == "hello there my friend"
+    (func, args, timeout), = calls
+    # Воркер получает путь, а не прочитанные байты
+    assert func is audio.split_voice and args[0] == path
+    assert timeout == pytest.approx(settings.OPUS_ENCODER_TIMEOUT + 1.5 * settings.LONG_AUDIO_SPLIT_TIMEOUT_PER_MINUTE, abs=0.1)
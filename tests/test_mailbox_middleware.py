@@ -0,0 +1,137 @@
+import asyncio
+import datetime
+
+import pytest
+from aiogram.types import Chat, Message, Update, User, Voice
+
+from src.bot.middlewares.mailbox_middleware import MailboxMiddleware
+from tests.conftest import run
+
+
+def update(update_id: int, text: str = None, voice: bool = False, user_id: int = 1) -> Update:
+    message = Message(
+        message_id=update_id,
+        date=datetime.datetime.now(),
+        chat=Chat(id=user_id, type="private"),
+        from_user=User(id=user_id, is_bot=False, first_name="Learner"),
+        text=text,
+        voice=Voice(file_id="file", file_unique_id="unique", duration=1) if voice else None
+    )
+    return Update(update_id=update_id, message=message)
+
+
+def label(event: Update, data: dict) -> str:
+    return data.get("user_text") or ("voice" if event.message.voice else event.message.text)
+
+
+async def deliver(middleware, updates, handler, gap: float = 0.01):
+    """Апдейты приходят по одному, как из polling, и обрабатываются параллельно"""
+    tasks = []
+    for event in updates:
+        tasks.append(asyncio.create_task(middleware(handler, event, {})))
+        await asyncio.sleep(gap)
+    await asyncio.gather(*tasks)
+
+
+def recording_handler(log, duration: float = 0.05):
+    async def handler(event, data):
+        log.append(label(event, data))
+        await asyncio.sleep(duration)
+    return handler
+
+
+def test_idle_user_message_starts_immediately():
+    middleware = MailboxMiddleware(debounce=0.0)
+    started = []
+
+    async def handler(event, data):
+        started.append(asyncio.get_running_loop().time())
+
+    async def scenario():
+        sent = asyncio.get_running_loop().time()
+        await middleware(handler, update(1, "hello"), {})
+        return started[0] - sent
+
+    assert run(scenario()) < 0.05
+
+
+def test_texts_during_running_turn_are_coalesced():
+    middleware = MailboxMiddleware(debounce=0.0)
+    log = []
+    run(deliver(middleware, [update(1, "a"), update(2, "b"), update(3, "c")], recording_handler(log)))
+    assert log == ["a", "b\nc"]
+    assert middleware.stats()["coalesced_messages"] == 1
+
+
+def test_later_texts_do_not_overtake_voice():
+    middleware = MailboxMiddleware(debounce=0.0, max_pending=10)
+    log = []
+    updates = [update(1, "a"), update(2, "b"), update(3, voice=True), update(4, "c"), update(5, "d")]
+    run(deliver(middleware, updates, recording_handler(log)))
+    assert log == ["a", "b", "voice", "c\nd"]
+
+
+def test_commands_close_coalescing():
+    middleware = MailboxMiddleware(debounce=0.0, max_pending=10)
+    log = []
+    updates = [update(1, "a"), update(2, "b"), update(3, "/level"), update(4, "c")]
+    run(deliver(middleware, updates, recording_handler(log)))
+    assert log == ["a", "b", "/level", "c"]
+
+
+def test_debounce_merges_burst_from_idle_user():
+    middleware = MailboxMiddleware(debounce=0.05, max_debounce=1.0)
+    log = []
+    run(deliver(middleware, [update(1, "a"), update(2, "b")], recording_handler(log)))
+    assert log == ["a\nb"]
+
+
+def test_users_are_processed_in_parallel():
+    middleware = MailboxMiddleware(debounce=0.0)
+    running = set()
+    overlap = []
+
+    async def handler(event, data):
+        running.add(event.message.from_user.id)
+        overlap.append(len(running))
+        await asyncio.sleep(0.05)
+        running.discard(event.message.from_user.id)
+
+    run(deliver(middleware, [update(1, "a", user_id=1), update(2, "b", user_id=2)], handler))
+    assert max(overlap) == 2
+
+
+def test_full_mailbox_rejects_updates(monkeypatch):
+    answers = []
+
+    async def answer(self, text, **kwargs):
+        answers.append(text)
+
+    monkeypatch.setattr(Message, "answer", answer)
+    middleware = MailboxMiddleware(debounce=0.0, max_pending=2)
+    log = []
+    updates = [update(1, voice=True), update(2, voice=True), update(3, voice=True)]
+    run(deliver(middleware, updates, recording_handler(log)))
+
+    assert log == ["voice", "voice"]
+    assert len(answers) == 1
+    assert middleware.stats()["rejected_updates"] == 1
+
+
+def test_failed_turn_releases_mailbox():
+    middleware = MailboxMiddleware(debounce=0.0)
+    log = []
+
+    async def handler(event, data):
+        log.append(label(event, data))
+        if event.message.text == "a":
+            raise RuntimeError("handler failed")
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await middleware(handler, update(1, "a"), {})
+        await middleware(handler, update(2, "b"), {})
+
+    run(scenario())
+    assert log == ["a", "b"]
+    assert middleware.stats()["active_users"] == 0
@@ -0,0 +1,94 @@
+import time
+import asyncio
+
+import pytest
+
+from src.services.opus_encoder import OpusEncoderPool
+from tests.conftest import run
+
+pytestmark = pytest.mark.skipif(not OpusEncoderPool().available, reason="PyAV is not installed")
+
+
+def test_hung_job_does_not_affect_other_jobs():
+    pool = OpusEncoderPool(workers=2, job_timeout=1.0)
+
+    async def job(seconds):
+        try:
+            await pool.run(time.sleep, seconds)
+            return "ok"
+        except Exception as e:
+            return type(e).__name__
+
+    async def scenario():
+        pool.start()
+        try:
+            # Пять коротких задач ждут в очереди дольше таймаута, но выполняются быстрее
+            return await asyncio.gather(job(30), *(job(0.4) for _ in range(5)))
+        finally:
+            pool.shutdown()
+
+    hung, *others = run(scenario())
+    assert hung == "TimeoutError"
+    assert others == ["ok"] * 5
+    assert pool.stats()["recycles"] == 1
+
+
+def test_hung_worker_process_is_terminated():
+    pool = OpusEncoderPool(workers=1, job_timeout=0.5)
+
+    async def scenario():
+        pool.start()
+        try:
+            await pool.run(sum, [])
+            executor = next(iter(pool._executors))
+            processes = list(executor._processes.values())
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.run(time.sleep, 30)
+            await asyncio.sleep(0.5)
+            return processes, await pool.run(sum, [1, 2])
+        finally:
+            pool.shutdown()
+
+    processes, result = run(scenario())
+    assert processes and not any(process.is_alive() for process in processes)
+    assert result == 3
+
+
+def test_encode_failure_returns_none():
+    pool = OpusEncoderPool(workers=1)
+
+    async def scenario():
+        pool.start()
+        try:
+            return await pool.encode(b"not a wav")
+        finally:
+            pool.shutdown()
+
+    assert run(scenario()) is None
+    assert pool.stats()["failures"] == 1
+
+
+def test_saturated_pool_rejects_instead_of_queueing():
+    pool = OpusEncoderPool(workers=1, queue_size=2, job_timeout=5.0, queue_timeout=0.5)
+
+    async def job(seconds):
+        try:
+            await pool.run(time.sleep, seconds)
+            return "ok"
+        except Exception as e:
+            return str(e)
+
+    async def scenario():
+        pool.start()
+        await pool.run(sum, [])
+        try:
+            # Первая задача занимает воркер, вторая ждёт его дольше queue_timeout, третья не влезает в очередь
+            return await asyncio.gather(job(1.0), job(0.1), job(0.1))
+        finally:
+            pool.shutdown()
+
+    first, waited, overflow = run(scenario())
+    assert first == "ok"
+    assert waited.startswith("No free Opus encoder worker")
+    assert overflow.startswith("Opus encoder queue is full")
+    assert pool.stats()["rejected"] == 2
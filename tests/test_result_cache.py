@@ -0,0 +1,63 @@
+import json
+from types import SimpleNamespace
+
+from src.config import settings
+from src.services.correction_precheck import ROUTE_HEAVY, ROUTE_LIGHT, correction_precheck
+from src.services.groq_client import GroqClient
+from tests.conftest import run
+
+
+def make_client(monkeypatch, route):
+    groq = GroqClient(["k1"])
+    models = []
+
+    async def create(model, **kwargs):
+        models.append(model)
+        content = {"corrected_sentence": f"from {model}", "explanation": "", "vocabulary_items": [], "error_category": "None"}
+        if kwargs["messages"][-1]["content"].endswith("correct and reply."):
+            content["chat_response"] = "Nice!"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(content)))], usage=None)
+
+    async def hedged_request(operation, request):
+        return await request(SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+
+    monkeypatch.setattr(groq, "_make_hedged_request", hedged_request)
+    monkeypatch.setattr(correction_precheck, "check", lambda text: (route[0], None))
+    return groq, models
+
+
+def test_light_and_main_model_results_are_cached_separately(monkeypatch):
+    route = [ROUTE_LIGHT]
+    groq, models = make_client(monkeypatch, route)
+
+    light = run(groq.correct_text("I like tea", "intermediate"))
+    assert run(groq.correct_text("I  like tea", "intermediate")) == light
+    route[0] = ROUTE_HEAVY
+    main = run(groq.correct_text("I like tea", "intermediate"))
+
+    assert models == [settings.LIGHT_CORRECTION_MODEL, settings.CORRECTION_MODEL]
+    assert main["corrected_sentence"] == f"from {settings.CORRECTION_MODEL}"
+
+
+def test_fused_mode_does_not_reuse_light_model_correction(monkeypatch):
+    groq, models = make_client(monkeypatch, [ROUTE_LIGHT])
+
+    run(groq.correct_text("I like tea", "intermediate"))
+    result = run(groq.analyze_and_respond("I like tea", "intermediate"))
+
+    assert models == [settings.LIGHT_CORRECTION_MODEL, settings.FUSED_MODEL]
+    assert result["chat_response"] == "Nice!"
+
+
+def test_fused_correction_is_reused_by_next_fused_call(monkeypatch):
+    groq, models = make_client(monkeypatch, [ROUTE_HEAVY])
+
+    async def generate_response(text, level, user_id=None):
+        return "Again!"
+
+    run(groq.analyze_and_respond("I like tea", "intermediate"))
+    monkeypatch.setattr(groq, "generate_response", generate_response)
+    result = run(groq.analyze_and_respond("I like tea", "intermediate"))
+
+    assert models == [settings.FUSED_MODEL]
+    assert result["chat_response"] == "Again!"
@@ -0,0 +1,101 @@
+import re
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+MIGRATION = Path(__file__).resolve().parent.parent / "supabase/migrations/20261017000000_increment_user_metrics.sql"
+
+# Postgres-выражения функции и их SQLite-эквиваленты (now подставляется параметром)
+TRANSLATION = [
+    ("public.users", "users"),
+    ("(now() at time zone 'utc')::date", "julianday(date(:now))"),
+    ("(last_active at time zone 'utc')::date", "julianday(date(last_active))"),
+    ("last_active = now()", "last_active = :now"),
+]
+
+
+def update_statement() -> str:
+    """UPDATE из миграции increment_user_metrics, переведённый на SQLite"""
+    body = MIGRATION.read_text()
+    statement = body[body.index("update public.users"):body.index("returning *;") + len("returning *")]
+    for postgres, sqlite in TRANSLATION:
+        statement = statement.replace(postgres, sqlite)
+    statement = re.sub(r"\bp_(\w+)", r":p_\1", statement)
+    # Всё, что зависит от Postgres, должно быть переведено
+    assert "now()" not in statement and "::" not in statement
+    return statement
+
+
+@pytest.fixture
+def increment():
+    connection = sqlite3.connect(":memory:")
+    connection.row_factory = sqlite3.Row
+    connection.execute("""
+        create table users (
+            telegram_id integer primary key,
+            total_tokens_used integer,
+            free_messages_used integer,
+            streak_days integer,
+            last_active text
+        )
+    """)
+    statement = update_statement()
+
+    def _increment(last_active, now, streak_days=3, tokens=10, messages=1):
+        connection.execute("delete from users")
+        connection.execute(
+            "insert into users values (1, 100, 5, ?, ?)",
+            (streak_days, last_active)
+        )
+        row = connection.execute(
+            statement,
+            {"now": now, "p_telegram_id": 1, "p_tokens": tokens, "p_messages": messages}
+        ).fetchone()
+        return dict(row)
+
+    yield _increment
+    connection.close()
+
+
+def test_counters_are_incremented(increment):
+    row = increment("2026-10-17T08:00:00+00:00", "2026-10-17T09:00:00+00:00", tokens=42, messages=2)
+    assert (row["total_tokens_used"], row["free_messages_used"]) == (142, 7)
+    assert row["last_active"] == "2026-10-17T09:00:00+00:00"
+
+
+def test_first_activity_starts_streak(increment):
+    assert increment(None, "2026-10-17T09:00:00+00:00", streak_days=None)["streak_days"] == 1
+
+
+@pytest.mark.parametrize("last_active, now", [
+    ("2026-10-17T00:01:00+00:00", "2026-10-17T23:59:00+00:00"),
+    ("2026-10-17T09:00:00+00:00", "2026-10-17T09:00:01+00:00"),
+])
+def test_same_utc_day_keeps_streak(increment, last_active, now):
+    assert increment(last_active, now)["streak_days"] == 3
+
+
+@pytest.mark.parametrize("last_active, now", [
+    # Меньше часа, но уже следующий день по UTC
+    ("2026-10-17T23:59:00+00:00", "2026-10-18T00:01:00+00:00"),
+    # Почти двое суток, но календарно - следующий день
+    ("2026-10-17T00:01:00+00:00", "2026-10-18T23:59:00+00:00"),
+    # Через границу месяца
+    ("2026-10-31T12:00:00+00:00", "2026-11-01T12:00:00+00:00"),
+])
+def test_next_utc_day_extends_streak(increment, last_active, now):
+    assert increment(last_active, now)["streak_days"] == 4
+
+
+@pytest.mark.parametrize("last_active, now", [
+    ("2026-10-17T23:59:00+00:00", "2026-10-19T00:01:00+00:00"),
+    ("2026-09-17T12:00:00+00:00", "2026-10-17T12:00:00+00:00"),
+])
+def test_gap_resets_streak(increment, last_active, now):
+    assert increment(last_active, now)["streak_days"] == 1
+
+
+def test_streak_uses_utc_dates_not_local_time(increment):
+    # 01:00 по Москве 18-го - это ещё 17-е по UTC: следующий день, а не тот же
+    assert increment("2026-10-18T01:00:00+03:00", "2026-10-18T12:00:00+00:00")["streak_days"] == 4
@@ -0,0 +1,41 @@
+from src.services.groq_client import split_sentences, stitch_transcripts
+
+
+def test_split_sentences_returns_remainder():
+    sentences, rest = split_sentences("Hello there. How are you? I am")
+    assert sentences == ["Hello there.", "How are you?"]
+    assert rest == "I am"
+
+
+def test_split_sentences_ignores_decimal_points():
+    sentences, rest = split_sentences("It costs 3.50 dollars. Ok")
+    assert sentences == ["It costs 3.50 dollars."]
+    assert rest == "Ok"
+
+
+def test_split_sentences_merges_short_sentences():
+    sentences, rest = split_sentences("Oh! Great. That sounds like a plan. And", min_chars=20)
+    assert sentences == ["Oh! Great. That sounds like a plan."]
+    assert rest == "And"
+
+
+def test_split_sentences_waits_for_whitespace_after_end():
+    assert split_sentences("Wait for it.") == ([], "Wait for it.")
+
+
+def test_stitch_removes_overlap_words():
+    parts = ["I went to the store and", "the store and bought some milk", "some milk for breakfast."]
+    assert stitch_transcripts(parts) == "I went to the store and bought some milk for breakfast."
+
+
+def test_stitch_ignores_case_and_punctuation_in_overlap():
+    assert stitch_transcripts(["We talked about travel,", "About travel and food."]) == "We talked about travel, and food."
+
+
+def test_stitch_keeps_short_single_word_match():
+    # Совпадение из одного короткого слова вероятнее случайное
+    assert stitch_transcripts(["I saw a", "a dog"]) == "I saw a a dog"
+
+
+def test_stitch_skips_empty_parts():
+    assert stitch_transcripts(["", "Hello world", "  "]) == "Hello world"
@@ -0,0 +1,35 @@
+import asyncio
+
+from src.services.tts_cache import TTSCache
+from tests.conftest import run
+
+
+def disk_usage(cache: TTSCache) -> int:
+    return sum(path.stat().st_size for path in cache.disk_dir.glob("*/*.ogg"))
+
+
+def test_concurrent_disk_writes_keep_size_accounting(tmp_path):
+    cache = TTSCache(disk_dir=str(tmp_path), disk_max_bytes=10 * 1024 * 1024)
+
+    async def scenario():
+        # Каждый ключ пишется дважды одновременно: повтор не должен учитываться
+        await asyncio.gather(*(
+            cache.put(TTSCache.make_key(f"phrase {i % 50}", "voice", "groq"), bytes(1000 + i % 50))
+            for i in range(100)
+        ))
+
+    run(scenario())
+    assert cache.stats()["disk_bytes"] == disk_usage(cache) == sum(1000 + i for i in range(50))
+
+
+def test_concurrent_writes_evict_down_to_limit(tmp_path):
+    cache = TTSCache(disk_dir=str(tmp_path), disk_max_bytes=20 * 1000)
+
+    async def scenario():
+        await asyncio.gather(*(
+            cache.put(TTSCache.make_key(f"phrase {i}", "voice", "groq"), bytes(1000))
+            for i in range(60)
+        ))
+
+    run(scenario())
+    assert cache.stats()["disk_bytes"] == disk_usage(cache) <= 20 * 1000
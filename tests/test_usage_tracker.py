@@ -0,0 +1,23 @@
+from src.services.groq_client import GroqClient
+from src.services.usage_tracker import usage_tracker
+from tests.conftest import run
+from tests.fake_openai import FakeOpenAI
+
+
+def test_stream_response_reports_usage(monkeypatch):
+    # Фоновый сброс в Supabase тесту не нужен
+    monkeypatch.setattr(usage_tracker, "start", lambda: None)
+    monkeypatch.setattr(usage_tracker, "_pending", {})
+
+    async def scenario():
+        async with FakeOpenAI() as server:
+            groq = GroqClient(["k1"], base_url=server.base_url)
+            with usage_tracker.message(42) as usage:
+                text = "".join([token async for token in groq.stream_response("Hello", "intermediate")])
+            return server, text, usage
+
+    server, text, usage = run(scenario())
+    assert text.strip() == "reply from k1"
+    assert server.bodies[0]["stream_options"] == {"include_usage": True}
+    assert (usage.prompt_tokens, usage.completion_tokens) == (11, 5)
+    assert usage_tracker._pending[42]["tokens"] == 16
@@ -0,0 +1,56 @@
+import pytest
+
+from src.bot.handlers import message as handler
+from src.config import settings
+from src.services.opus_encoder import opus_encoder
+from src.utils import audio
+from tests.conftest import run
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    calls = []
+
+    async def pool_run(func, *args, timeout=None):
+        calls.append((func, args, timeout))
+        return True, None, 1.0
+
+    monkeypatch.setattr(opus_encoder, "run", pool_run)
+    monkeypatch.setattr(type(opus_encoder), "available", property(lambda self: True))
+    monkeypatch.setattr(settings, "VOICE_PRESCREEN", True)
+    return calls
+
+
+def test_telegram_duration_replaces_ogg_parsing(monkeypatch, pool, tmp_path):
+    path = tmp_path / "voice.ogg"
+    path.write_bytes(b"not an ogg")
+
+    def ogg_duration(data):
+        raise AssertionError("duration is known from Telegram")
+
+    monkeypatch.setattr(handler, "ogg_duration", ogg_duration)
+    assert run(handler.prescreen_voice(path, 120)) == path
+    (func, args, timeout), = pool
+    # В пул уходит путь, таймаут учитывает длину записи
+    assert func is audio.screen_voice and args[0] == path
+    assert timeout == pytest.approx(settings.OPUS_ENCODER_TIMEOUT + 2 * settings.LONG_AUDIO_SPLIT_TIMEOUT_PER_MINUTE)
+
+
+def test_unknown_duration_falls_back_to_ogg(monkeypatch, pool, tmp_path):
+    path = tmp_path / "voice.ogg"
+    path.write_bytes(b"not an ogg")
+    monkeypatch.setattr(handler, "ogg_duration", lambda data: 0.1)
+
+    assert run(handler.prescreen_voice(path, 0)) is None
+    assert pool == []
+
+
+def test_silent_spilled_voice_skips_whisper(monkeypatch, pool, tmp_path):
+    path = tmp_path / "voice.ogg"
+    path.write_bytes(b"not an ogg")
+
+    async def pool_run(func, *args, timeout=None):
+        return False, None, 0.0
+
+    monkeypatch.setattr(opus_encoder, "run", pool_run)
+    assert run(handler.prescreen_voice(path, 30)) is None
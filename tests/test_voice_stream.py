@@ -0,0 +1,58 @@
+from src.services.groq_client import GroqClient
+from tests.conftest import run
+
+
+def make_client(monkeypatch, stream_tokens, fail_after=None):
+    groq = GroqClient(["k1"])
+    calls = {"remembered": [], "voiced": [], "regenerated": 0}
+
+    async def stream_response(text, level, history=None):
+        for i, token in enumerate(stream_tokens):
+            if fail_after is not None and i == fail_after:
+                raise ConnectionError("stream dropped")
+            yield token
+
+    async def generate_response(text, level, user_id=None):
+        calls["regenerated"] += 1
+        return "Full reply."
+
+    async def remember(user_id, text, reply):
+        calls["remembered"].append(reply)
+
+    async def text_to_speech(text, voice=None):
+        calls["voiced"].append(text)
+        return b"ogg"
+
+    async def synthesize_wav(text):
+        return None
+
+    monkeypatch.setattr(groq, "stream_response", stream_response)
+    monkeypatch.setattr(groq, "generate_response", generate_response)
+    monkeypatch.setattr(groq, "_remember_exchange", remember)
+    monkeypatch.setattr(groq, "text_to_speech", text_to_speech)
+    monkeypatch.setattr(groq, "_synthesize_wav", synthesize_wav)
+    return groq, calls
+
+
+def test_broken_stream_does_not_keep_partial_reply(monkeypatch):
+    groq, calls = make_client(monkeypatch, ["I went ", "to the ", "park ", "yesterday."], fail_after=2)
+
+    reply, audio = run(groq.generate_response_with_voice("Hi", "intermediate", user_id=1))
+
+    assert reply == "Full reply."
+    assert calls["regenerated"] == 1
+    # Обрывок "I went to the" не попадает ни в память, ни в голос
+    assert calls["remembered"] == []
+    assert calls["voiced"] == ["Full reply."]
+    assert audio == b"ogg"
+
+
+def test_finished_stream_is_kept_when_synthesis_fails(monkeypatch):
+    groq, calls = make_client(monkeypatch, ["I went ", "to the ", "park ", "yesterday."])
+
+    reply, _ = run(groq.generate_response_with_voice("Hi", "intermediate", user_id=1))
+
+    assert reply == "I went to the park yesterday."
+    assert calls["regenerated"] == 0
+    assert calls["remembered"] == ["I went to the park yesterday."]
+    assert calls["voiced"] == ["I went to the park yesterday."]